@@ -0,0 +1,26 @@
+import numpy as np
+from vec3 import Point3
+
+class AABB:
+    def __init__(self, minimum, maximum):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def hit(self, ray, t_min, t_max):
+        for a in range(3):
+            direction = float(ray.direction[a])
+            origin = float(ray.origin[a])
+            inv_d = 1.0/direction if direction != 0.0 else np.inf
+            t0 = (float(self.minimum[a]) - origin)*inv_d
+            t1 = (float(self.maximum[a]) - origin)*inv_d
+            if inv_d < 0.0:
+                t0, t1 = t1, t0
+            t_min = t0 if t0 > t_min else t_min
+            t_max = t1 if t1 < t_max else t_max
+            if t_max <= t_min:
+                return False
+        return True
+
+def surrounding_box(box0, box1):
+    return AABB(Point3(np.minimum(box0.minimum.e, box1.minimum.e)),
+                Point3(np.maximum(box0.maximum.e, box1.maximum.e)))
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import signal
+import queue
+import numpy as np
+from multiprocessing import Process, Queue
+from sampler import Sampler
+from scheduler import make_tiles
+from framebuffer import SharedFramebuffer
+import image_io
+
+CAMERA_FIELDS = ('lookfrom', 'lookat', 'vup', 'vfov', 'aperture', 'focus_dist')
+
+class CameraPath:
+    # Keyframes are camera parameter dicts with a 'frame' number; fields a
+    # keyframe leaves out carry over from the one before it, and frames in
+    # between are interpolated linearly.
+    def __init__(self, base, keyframes, frames=None):
+        self.keyframes = []
+        params = dict(base)
+        for k, key in enumerate(sorted(keyframes, key=lambda key: key.get('frame', 0))):
+            params = dict(params, **{name: key[name] for name in CAMERA_FIELDS if name in key})
+            self.keyframes.append((key.get('frame', k), params))
+        last = self.keyframes[-1][0] if self.keyframes else 0
+        self.frames = frames if frames is not None else last + 1
+
+    def __len__(self):
+        return self.frames
+
+    def camera_params(self, frame):
+        times = [t for t, _ in self.keyframes]
+        k = int(np.searchsorted(times, frame, side='right'))
+        if k == 0:
+            return dict(self.keyframes[0][1])
+        if k == len(times):
+            return dict(self.keyframes[-1][1])
+        (t0, a), (t1, b) = self.keyframes[k - 1], self.keyframes[k]
+        w = (frame - t0)/(t1 - t0)
+        return {name: (np.asarray(a[name], dtype=float)*(1 - w) + np.asarray(b[name], dtype=float)*w).tolist()
+                for name in CAMERA_FIELDS}
+
+def load_camera_path(path, base):
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {'keyframes': [dict(key, frame=k) for k, key in enumerate(data)]}
+    return CameraPath(base, data['keyframes'], data.get('frames'))
+
+def turntable(base, frames):
+    # orbit lookfrom around lookat about the up vector, one turn over the frames
+    lookat, vup = np.asarray(base['lookat'], dtype=float), np.asarray(base['vup'], dtype=float)
+    axis = vup/np.linalg.norm(vup)
+    offset = np.asarray(base['lookfrom'], dtype=float) - lookat
+    keyframes = []
+    for frame in range(frames):
+        theta = 2*np.pi*frame/frames
+        rotated = (offset*np.cos(theta) + np.cross(axis, offset)*np.sin(theta)
+                   + axis*np.dot(axis, offset)*(1 - np.cos(theta)))
+        keyframes.append({'frame': frame, 'lookfrom': (lookat + rotated).tolist()})
+    return CameraPath(base, keyframes)
+
+def frame_output(pattern, frame):
+    if '%' in pattern:
+        return pattern % frame
+    root, ext = os.path.splitext(pattern)
+    return f'{root}_{frame:04d}{ext}'
+
+def frame_sampler(seed, frame):
+    return Sampler([seed, frame])
+
+def animation_worker(tracer, cameras, tasks, done):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    framebuffers = {}
+    current = None
+    seed = tracer.sampler.seed
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        frame, name, tile, samples = task
+        if tracer.stop_event.is_set():
+            done.put((frame, tile.index, 0.0, (0, 0, 0)))
+            continue
+        if name not in framebuffers:
+            # frames more than one behind this one are finished and unlinked
+            for old in [n for n, (f, _) in framebuffers.items() if f < frame - 1]:
+                framebuffers.pop(old)[1].close()
+            framebuffers[name] = (frame, SharedFramebuffer(tracer.image_width, tracer.image_height, name))
+        fb = framebuffers[name][1]
+        if frame != current:
+            tracer.setup_camera(cameras.camera_params(frame))
+            tracer.sampler = frame_sampler(seed, frame)
+            tracer.prepare_renderer()
+            tracer.framebuffer = fb
+            current = frame
+        source = tracer.wavefront if tracer.engine == 'wavefront' else tracer
+        before = (source.paths, source.segments, source.roulette_terminations)
+        start = time.perf_counter()
+        mask = np.ones((tile.height, tile.width), dtype=bool)
+        first_sample = np.zeros((tile.height, tile.width), dtype=np.int64)
+        radiance, luminance_sq = tracer.render_tile(tile, samples, mask, first_sample)
+        fb.accumulate(tile.x0, tile.y0, radiance, luminance_sq, samples)
+        after = (source.paths, source.segments, source.roulette_terminations)
+        done.put((frame, tile.index, time.perf_counter() - start, tuple(b - a for a, b in zip(before, after))))
+    for _, fb in framebuffers.values():
+        fb.close()
+
+class AnimationRenderer:
+    # One scene build and one worker pool for every frame. Tiles of up to
+    # frames_in_flight frames share the task queue, so workers move on to the
+    # next frame while the last tiles of the current one finish.
+    frames_in_flight = 2
+
+    def __init__(self, tracer, cameras):
+        self.tracer = tracer
+        self.cameras = cameras
+
+    def log(self, message):
+        print(message, file=self.tracer.log_stream, flush=True)
+
+    def start_frame(self, frame):
+        tracer = self.tracer
+        fb = SharedFramebuffer(tracer.image_width, tracer.image_height)
+        tiles = make_tiles(tracer.image_width, tracer.image_height, tracer.tile_size, tracer.tile_order)
+        self.frames[frame] = {'framebuffer': fb, 'remaining': len(tiles), 'start': time.perf_counter()}
+        for tile in tiles:
+            self.tasks.put((frame, fb.name, tile, tracer.samples_per_pix))
+
+    def finish_frame(self, frame):
+        state = self.frames.pop(frame)
+        fb = state['framebuffer']
+        path = frame_output(self.tracer.output, frame)
+        image_io.save_image(path, fb.radiance, fb.counts)
+        fb.close()
+        self.log(f'Frame {frame + 1}/{len(self.cameras)} written to {path} '
+                 f'in {time.perf_counter() - state["start"]:.2f}s')
+
+    def run(self):
+        tracer = self.tracer
+        tracer.build_world()
+        if tracer.engine == 'wavefront' and hasattr(tracer.world, 'compile'):
+            # compile once here rather than in every worker for every frame
+            tracer.world = tracer.world.compile()
+        self.tasks, self.done = Queue(), Queue()
+        self.frames = {}
+        workers = [Process(target=animation_worker, args=(tracer, self.cameras, self.tasks, self.done), daemon=True)
+                   for _ in range(tracer.worker_count)]
+        for w in workers:
+            w.start()
+        previous_handlers = [signal.signal(sig, tracer.request_stop) for sig in (signal.SIGINT, signal.SIGTERM)]
+        start = time.perf_counter()
+        written = 0
+        next_frame = 0
+        try:
+            while next_frame < len(self.cameras) and next_frame < self.frames_in_flight:
+                self.start_frame(next_frame)
+                next_frame += 1
+            while self.frames:
+                try:
+                    frame, _, _, paths = self.done.get(timeout=0.5)
+                except queue.Empty:
+                    if not all(w.is_alive() for w in workers):
+                        raise RuntimeError('an animation worker exited unexpectedly')
+                    continue
+                with tracer.path_counts.get_lock():
+                    for k, n in enumerate(paths):
+                        tracer.path_counts[k] += n
+                self.frames[frame]['remaining'] -= 1
+                if self.frames[frame]['remaining']:
+                    continue
+                if tracer.stop_event.is_set():
+                    self.frames.pop(frame)['framebuffer'].close()
+                    continue
+                self.finish_frame(frame)
+                written += 1
+                if next_frame < len(self.cameras):
+                    self.start_frame(next_frame)
+                    next_frame += 1
+        finally:
+            for _ in workers:
+                self.tasks.put(None)
+            for w in workers:
+                w.join()
+            for state in self.frames.values():
+                state['framebuffer'].close()
+            signal.signal(signal.SIGINT, previous_handlers[0])
+            signal.signal(signal.SIGTERM, previous_handlers[1])
+        elapsed = time.perf_counter() - start
+        paths, segments, _ = tracer.path_counts[:]
+        self.log(f'{written} frames in {elapsed:.2f}s ({elapsed/max(written, 1):.2f}s per frame), '
+                 f'average path length {segments/max(paths, 1):.2f} segments')
+        return written
@@ -0,0 +1,64 @@
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+import numpy as np
+from main import PathTracer, parse_args
+from animation import AnimationRenderer, CameraPath, turntable, frame_output
+
+BASE = {'lookfrom': [0.0, 0.0, 2.0], 'lookat': [0.0, 0.0, -1.0], 'vup': [0.0, 1.0, 0.0],
+        'vfov': 50.0, 'aperture': 0.0, 'focus_dist': 3.0}
+
+class TestAnimation(unittest.TestCase):
+
+    def test_keyframes_interpolate_and_carry_over(self):
+        path = CameraPath(BASE, [{'frame': 0, 'vfov': 40.0}, {'frame': 4, 'lookfrom': [4.0, 0.0, 2.0]}])
+        self.assertEqual(len(path), 5)
+        mid = path.camera_params(2)
+        self.assertTrue(np.allclose(mid['lookfrom'], [2.0, 0.0, 2.0]))
+        self.assertAlmostEqual(mid['vfov'], 40.0)
+        self.assertEqual(path.camera_params(9)['lookfrom'], [4.0, 0.0, 2.0])
+
+    def test_turntable_orbits_lookat(self):
+        path = turntable(BASE, 4)
+        self.assertTrue(np.allclose(path.camera_params(0)['lookfrom'], BASE['lookfrom']))
+        self.assertTrue(np.allclose(path.camera_params(2)['lookfrom'], [0.0, 0.0, -4.0]))
+
+    def test_frame_output(self):
+        self.assertEqual(frame_output('out.png', 7), 'out_0007.png')
+        self.assertEqual(frame_output('f%03d.ppm', 7), 'f007.ppm')
+
+    def test_rejects_options_the_frame_loop_ignores(self):
+        with contextlib.redirect_stderr(io.StringIO()) as err, self.assertRaises(SystemExit):
+            parse_args(['--frames', '4', '--listen', 'localhost:0'])
+        self.assertIn('--listen', err.getvalue())
+        self.assertEqual(parse_args(['--frames', '4', '--tile-size', '8']).frames, 4)
+
+    def test_submit_rejects_options_the_service_ignores(self):
+        # a service job is one uniform pass with the service's own tiling,
+        # the same restriction as the frame loop
+        for option in (['--adaptive'], ['--tile-size', '8'], ['--checkpoint', 'render.npz'], ['--backend', 'thread']):
+            with contextlib.redirect_stderr(io.StringIO()) as err, self.assertRaises(SystemExit):
+                parse_args(['--submit', 'service.sock'] + option)
+            self.assertIn(option[0], err.getvalue())
+        self.assertEqual(parse_args(['--submit', 'service.sock', '--seed', '3']).seed, 3)
+
+    def test_frames_independent_of_worker_count(self):
+        frames = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for workers in (1, 2):
+                output = os.path.join(tmp, f'w{workers}.npy')
+                with contextlib.redirect_stdout(io.StringIO()):
+                    pt = PathTracer(image_width=16, image_height=12, samples_per_pix=2, max_depth=4, workers=workers,
+                                    engine='wavefront', tile_size=8, output=output)
+                    written = AnimationRenderer(pt, turntable(pt.camera_params(), 3)).run()
+                self.assertEqual(written, 3)
+                frames.append([np.load(frame_output(output, f)) for f in range(3)])
+        for a, b in zip(*frames):
+            self.assertTrue(np.array_equal(a, b))
+        self.assertFalse(np.array_equal(frames[0][0], frames[0][1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
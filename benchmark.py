@@ -0,0 +1,272 @@
+import os
+import sys
+import io
+import json
+import time
+import timeit
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+import subprocess
+import importlib.util
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+class SourceFinder:
+    # imports the repo's modules from their .py files even when a compiled
+    # extension sits next to them, to time the same code uncompiled
+    @staticmethod
+    def find_spec(name, path=None, target=None):
+        source = os.path.join(ROOT, name + '.py')
+        if path is None and os.path.exists(source):
+            return importlib.util.spec_from_file_location(name, source)
+        return None
+
+if os.environ.get('RAYTRACER_PURE_PYTHON'):
+    sys.meta_path.insert(0, SourceFinder)
+
+from vec3 import Vec3, Point3, Color, dot, cross, unit_vector
+from ray import Ray
+from color import get_color, write_color
+from hittable import HitRecord
+from main import PathTracer
+
+BENCHMARKS = []
+
+def benchmark(name, module, unit='op'):
+    def register(setup):
+        BENCHMARKS.append((name, module, unit, setup))
+        return setup
+    return register
+
+def fixed_scene():
+    np.random.seed(0)
+    pt = PathTracer(image_width=64, image_height=36, samples_per_pix=2, max_depth=10)
+    pt.create_world()
+    pt.setup_camera()
+    return pt
+
+def scatter_setup(material_idx):
+    pt = fixed_scene()
+    material = pt.world.objects[material_idx].material
+    ray = Ray(Point3([0, 0, 0]), Vec3([0.1, -0.2, -1.0]))
+    rec = HitRecord()
+    rec.point = Point3([0, 0, -0.5])
+    rec.t = 0.5
+    rec.set_face_normal(ray, unit_vector(Vec3([0.1, 0.2, 1.0])))
+    rec.material = material
+    return lambda: material.scatter(ray, rec)
+
+@benchmark('vec3_add', 'vec3')
+def vec3_add():
+    u, v = Vec3([1.0, 2.0, 3.0]), Vec3([2.0, 3.0, 4.0])
+    return lambda: u + v
+
+@benchmark('vec3_scale', 'vec3')
+def vec3_scale():
+    u = Vec3([1.0, 2.0, 3.0])
+    return lambda: 0.5*u
+
+@benchmark('vec3_dot', 'vec3')
+def vec3_dot():
+    u, v = Vec3([1.0, 2.0, 3.0]), Vec3([2.0, 3.0, 4.0])
+    return lambda: dot(u, v)
+
+@benchmark('vec3_cross', 'vec3')
+def vec3_cross():
+    u, v = Vec3([1.0, 2.0, 3.0]), Vec3([2.0, 3.0, 4.0])
+    return lambda: cross(u, v)
+
+@benchmark('vec3_unit_vector', 'vec3')
+def vec3_unit_vector():
+    u = Vec3([1.0, 2.0, 3.0])
+    return lambda: unit_vector(u)
+
+@benchmark('ray_at', 'ray')
+def ray_at():
+    ray = Ray(Point3([0, 0, 0]), Vec3([0.3, -0.1, -1.0]))
+    return lambda: ray.at(0.5)
+
+@benchmark('sphere_hit', 'sphere')
+def sphere_hit():
+    sphere = fixed_scene().world.objects[1]
+    ray = Ray(Point3([0, 0, 0]), Vec3([0.0, 0.1, -1.0]))
+    return lambda: sphere.hit(ray, 0.001, np.inf)
+
+@benchmark('hittable_list_hit', 'hittable_list')
+def hittable_list_hit():
+    world = fixed_scene().world
+    ray = Ray(Point3([0, 0, 0]), Vec3([0.3, -0.1, -1.0]))
+    return lambda: world.hit(ray, 0.001, np.inf)
+
+@benchmark('camera_get_ray', 'camera')
+def camera_get_ray():
+    cam = fixed_scene().cam
+    return lambda: cam.get_ray(0.3, 0.6)
+
+@benchmark('lambertian_scatter', 'material')
+def lambertian_scatter():
+    return scatter_setup(0)
+
+@benchmark('metal_scatter', 'material')
+def metal_scatter():
+    return scatter_setup(4)
+
+@benchmark('dielectric_scatter', 'material')
+def dielectric_scatter():
+    return scatter_setup(2)
+
+@benchmark('get_color', 'color')
+def get_color_bench():
+    c = Color([0.5, 1.2, 0.1])
+    return lambda: get_color(c, 4)
+
+@benchmark('write_color', 'color')
+def write_color_bench():
+    c = Color([0.5, 1.2, 0.1])
+    stream = io.StringIO()
+    return lambda: write_color(stream, c, 4)
+
+@benchmark('compiled_closest_hit_1k_rays', 'compiled_scene', unit='ray')
+def compiled_closest_hit():
+    scene = fixed_scene().world.compile()
+    rng = np.random.default_rng(0)
+    origins = np.zeros((1000, 3))
+    directions = rng.normal(size=(1000, 3))
+    return lambda: scene.closest_hit(origins, directions), 1000
+
+def run_end_to_end(engine):
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        pt = PathTracer(image_width=64, image_height=36, samples_per_pix=4, max_depth=10, engine=engine,
+                        progress='none', output=os.path.join(tempfile.gettempdir(), f'benchmark_{engine}.ppm'))
+        start = time.perf_counter()
+        pt.run()
+        seconds = time.perf_counter() - start
+    return seconds, pt.image_width*pt.image_height*pt.samples_per_pix
+
+def time_case(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number))/number
+
+def run_benchmarks(selected=None, repeat=3, end_to_end=True):
+    results = {}
+    for name, module, unit, setup in BENCHMARKS:
+        if selected and not any(s in name for s in selected):
+            continue
+        case = setup()
+        per_call = 1
+        if isinstance(case, tuple):
+            case, per_call = case
+        seconds = time_case(case, repeat)/per_call
+        results[name] = {'module': module, 'unit': unit, 'ns_per_op': seconds*1e9, 'ops_per_sec': 1.0/seconds}
+
+    if end_to_end:
+        for engine in ('scalar', 'wavefront'):
+            name = f'path_tracer_run_{engine}'
+            if selected and not any(s in name for s in selected):
+                continue
+            seconds, rays = min((run_end_to_end(engine) for _ in range(repeat)), key=lambda r: r[0])
+            results[name] = {'module': 'main', 'unit': 'ray', 'ns_per_op': seconds/rays*1e9,
+                             'ops_per_sec': rays/seconds, 'rays_per_sec': rays/seconds, 'seconds': seconds}
+
+    modules = sorted({module for _, module, _, _ in BENCHMARKS} | {'main', 'ray'})
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        # ru_maxrss is reported in KiB on Linux
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'peak_rss_children_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        'compiled_modules': [m for m in modules if not sys.modules[m].__file__.endswith('.py')],
+        'results': results,
+    }
+
+def compiled_speedup(argv):
+    # the same benchmarks in two child processes, one importing only .py files
+    reports = []
+    for pure in (True, False):
+        env = dict(os.environ)
+        env.pop('RAYTRACER_PURE_PYTHON', None)
+        if pure:
+            env['RAYTRACER_PURE_PYTHON'] = '1'
+        child = subprocess.run([sys.executable, os.path.abspath(__file__)] + argv, env=env,
+                               stdout=subprocess.PIPE, check=True)
+        reports.append(json.loads(child.stdout))
+    python, compiled = reports
+    lines = [f'compiled modules: {", ".join(compiled["compiled_modules"]) or "none"}',
+             f'{"benchmark":<32} {"module":<16} {"python ns":>12} {"compiled ns":>12} {"speedup":>8}']
+    by_module = {}
+    for name, result in compiled['results'].items():
+        base = python['results'][name]
+        speedup = base['ns_per_op']/result['ns_per_op']
+        by_module.setdefault(result['module'], []).append(speedup)
+        lines.append(f'{name:<32} {result["module"]:<16} {base["ns_per_op"]:>12.1f} '
+                     f'{result["ns_per_op"]:>12.1f} {speedup:>7.2f}x')
+    lines.append('')
+    lines.append(f'{"module":<16} {"speedup":>8}  (geometric mean)')
+    for module, speedups in by_module.items():
+        lines.append(f'{module:<16} {float(np.exp(np.mean(np.log(speedups)))):>7.2f}x')
+    return lines, compiled['compiled_modules']
+
+def compare(report, baseline, threshold):
+    regressions = []
+    lines = [f'{"benchmark":<32} {"baseline ns":>14} {"current ns":>14} {"change":>8}']
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            lines.append(f'{name:<32} {"-":>14} {result["ns_per_op"]:>14.1f} {"new":>8}')
+            continue
+        change = result['ns_per_op']/base['ns_per_op'] - 1.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        lines.append(f'{name:<32} {base["ns_per_op"]:>14.1f} {result["ns_per_op"]:>14.1f} {change:>+8.1%}{flag}')
+    return lines, regressions
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Micro and end-to-end benchmarks for the path tracer hot paths')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against a stored JSON report')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown reported as a regression (default 0.10)')
+    parser.add_argument('--filter', action='append', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-end-to-end', action='store_true', help='skip the PathTracer.run benchmarks')
+    parser.add_argument('--compiled-speedup', action='store_true',
+                        help='time each benchmark with and without the Cython extensions built by setup.py')
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = parse_args(argv)
+    if args.compiled_speedup:
+        lines, compiled_modules = compiled_speedup([arg for arg in argv if arg != '--compiled-speedup'])
+        print('\n'.join(lines))
+        if not compiled_modules:
+            print('no compiled modules found, build them with: python setup.py build_ext --inplace')
+            return 1
+        return 0
+    report = run_benchmarks(args.filter, args.repeat, not args.no_end_to_end)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(report, baseline, args.threshold)
+        print('\n'.join(lines))
+        if regressions:
+            print(f'{len(regressions)} regression(s) above {args.threshold:.0%}: {", ".join(regressions)}')
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,46 @@
+import numpy as np
+from hittable import Hittable
+from aabb import surrounding_box
+from compiled_scene import compile_scene
+import instrumentation
+
+class BVHNode(Hittable):
+    def __init__(self, objects):
+        super().__init__()
+        self.objects = list(objects)
+        objects = self.objects
+        box = objects[0].bounding_box()
+        for obj in objects[1:]:
+            box = surrounding_box(box, obj.bounding_box())
+        self.box = box
+
+        if len(objects) == 1:
+            self.left = self.right = objects[0]
+        elif len(objects) == 2:
+            self.left, self.right = objects
+        else:
+            axis = int(np.argmax((box.maximum - box.minimum).e))
+            objects = sorted(objects, key=lambda obj: obj.bounding_box().minimum[axis] + obj.bounding_box().maximum[axis])
+            mid = len(objects)//2
+            self.left = BVHNode(objects[:mid])
+            self.right = BVHNode(objects[mid:])
+
+    def compile(self, accelerate=True):
+        return compile_scene(self.objects, accelerate)
+
+    def bounding_box(self):
+        return self.box
+
+    def hit(self, ray, t_min, t_max):
+        if instrumentation.stats is not None:
+            instrumentation.stats.count('bvh_node_tests')
+        if not self.box.hit(ray, t_min, t_max):
+            return None
+        rec = self.left.hit(ray, t_min, t_max)
+        if rec is not None:
+            t_max = rec.t
+        if self.right is not self.left:
+            right = self.right.hit(ray, t_min, t_max)
+            if right is not None:
+                return right
+        return rec
@@ -1,5 +1,6 @@
+import math
 import numpy as np
-from vec3 import Vec3, Point3, cross, unit_vector, random_in_unit_disk
+from vec3 import Vec3, Point3, cross, unit_vector, random_in_unit_disk, random_in_unit_disk_batch
 from utils import rand, deg_to_rad
 from ray import Ray
 
@@ -9,7 +10,7 @@ class Camera:
         self.aspect_ratio = aspect_ratio
 
         theta = deg_to_rad(vfov)
-        h = np.tan(theta/2)
+        h = math.tan(theta/2)
         self.viewport_height = 2.0 * h
         self.viewport_width = self.aspect_ratio * self.viewport_height
         self.focal_length = 1.0
@@ -30,3 +31,10 @@ class Camera:
         offset = rd.x*self.u + rd.y*self.v
         direction = self.lower_left_corner + s*self.horizontal + t*self.vertical - self.origin - offset
         return Ray(self.origin + offset, direction)
+
+    def get_rays(self, s, t, lens_uniforms=None):
+        rd = self.lens_radius * random_in_unit_disk_batch(len(s), lens_uniforms)
+        offset = rd[:, 0:1]*self.u.e + rd[:, 1:2]*self.v.e
+        origins = self.origin.e + offset
+        directions = self.lower_left_corner.e + s[:, None]*self.horizontal.e + t[:, None]*self.vertical.e - origins
+        return origins.astype(np.float64), directions.astype(np.float64)
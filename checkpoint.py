@@ -0,0 +1,64 @@
+import os
+import json
+import zipfile
+import numpy as np
+
+CHECKPOINT_VERSION = 2
+# settings the pixels depend on; a checkpoint only resumes a render that agrees
+IMAGE_FIELDS = ('image_width', 'image_height', 'max_depth', 'engine', 'seed', 'roulette_threshold')
+# settings that decide the pass layout; a resumed render takes them from the checkpoint
+SCHEDULE_FIELDS = ('samples_per_pix', 'samples_per_pass', 'adaptive', 'min_samples', 'noise_threshold')
+BUFFERS = ('radiance', 'luminance_sq', 'counts', 'active')
+
+def strip_key(name, y0):
+    return f'{name}_{y0}'
+
+def save_checkpoint(path, framebuffer, state, lock):
+    # The buffers are stored a strip of rows at a time, one .npz entry per
+    # buffer and strip. Each strip of every buffer is copied under lock, so
+    # a pixel's sums and count always agree while the workers only wait for
+    # one small copy. Written beside the old checkpoint and renamed over it,
+    # so a render killed mid-write still leaves the previous one intact.
+    names = BUFFERS + framebuffer.aov_names()
+    rows = []
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        with zipfile.ZipFile(f, 'w', allowZip64=True) as archive:
+            for y0, y1 in framebuffer.strips():
+                with lock:
+                    snapshot = [getattr(framebuffer, name)[y0:y1].copy() for name in names]
+                for name, values in zip(names, snapshot):
+                    with archive.open(strip_key(name, y0) + '.npy', 'w', force_zip64=True) as entry:
+                        np.lib.format.write_array(entry, values)
+                rows.append([y0, y1])
+            state = dict(state, version=CHECKPOINT_VERSION, buffers=list(names), strips=rows)
+            archive.writestr('state.json', json.dumps(state))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+def load_state(path):
+    with zipfile.ZipFile(path) as archive:
+        state = json.loads(archive.read('state.json'))
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f'{path}: checkpoint version {state.get("version")}, expected {CHECKPOINT_VERSION}')
+    return state
+
+def check_compatible(path, state, config, scene_hash, buffers):
+    for name in IMAGE_FIELDS:
+        if state['config'][name] != config[name]:
+            raise ValueError(f'{path} was rendered with {name}={state["config"][name]!r}, not {config[name]!r}')
+    if state['scene_hash'] != scene_hash:
+        raise ValueError(f'{path} was rendered from a different scene or camera')
+    if sorted(state['buffers']) != sorted(buffers):
+        raise ValueError(f'{path} holds buffers {sorted(state["buffers"])}, this render needs {sorted(buffers)}; '
+                         f'--denoise and --aovs must match the checkpointed render')
+
+def restore_buffers(path, state, framebuffer):
+    # strip by strip, like save_checkpoint, so a memory-mapped framebuffer
+    # never holds the whole image resident
+    with np.load(path) as data:
+        for y0, y1 in state['strips']:
+            for name in state['buffers']:
+                getattr(framebuffer, name)[y0:y1] = data[strip_key(name, y0)]
+            framebuffer.release(y0, y1)
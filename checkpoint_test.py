@@ -0,0 +1,71 @@
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+import threading
+import numpy as np
+from main import PathTracer
+from framebuffer import SharedFramebuffer
+from checkpoint import load_state, restore_buffers, save_checkpoint
+
+class TestCheckpoint(unittest.TestCase):
+
+    def render(self, **options):
+        settings = dict(image_width=16, image_height=12, max_depth=4, engine='wavefront', tile_size=8,
+                        samples_per_pass=2, progress='none')
+        settings.update(options)
+        with contextlib.redirect_stdout(io.StringIO()):
+            PathTracer(**settings).run()
+        return np.load(settings['output'])
+
+    def load(self, path):
+        state = load_state(path)
+        fb = SharedFramebuffer(16, 12)
+        restore_buffers(path, state, fb)
+        return state, fb
+
+    def test_add_samples_matches_single_render(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'render.npz')
+            output = os.path.join(tmp, 'image.npy')
+            self.render(samples_per_pix=4, output=output, checkpoint=path)
+            state, fb = self.load(path)
+            try:
+                self.assertEqual(state['samples_done'], 4)
+                self.assertTrue((fb.counts == 4).all())
+            finally:
+                fb.close()
+            refined = self.render(samples_per_pix=4, output=output, checkpoint=path, add_samples=4)
+            direct = self.render(samples_per_pix=8, output=os.path.join(tmp, 'direct.npy'))
+        self.assertTrue(np.array_equal(refined, direct))
+
+    def test_resume_finishes_an_interrupted_pass(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'render.npz')
+            output = os.path.join(tmp, 'image.npy')
+            direct = self.render(samples_per_pix=4, output=output, checkpoint=path)
+            _, finished = self.load(path)
+            self.render(samples_per_pix=2, output=output, checkpoint=path)
+            state, fb = self.load(path)
+            try:
+                # as if killed in the second pass of the 4 spp render, once
+                # the tiles right of x = 8 were done
+                state['config']['samples_per_pix'] = 4
+                for name in ('radiance', 'luminance_sq', 'counts'):
+                    getattr(fb, name)[:, 8:] = getattr(finished, name)[:, 8:]
+                save_checkpoint(path, fb, state, threading.Lock())
+            finally:
+                fb.close()
+                finished.close()
+            with self.assertRaises(ValueError):
+                self.render(samples_per_pix=4, output=output, checkpoint=path, resume=True, max_depth=5)
+            # the checkpoint has no AOV buffers to guide the denoiser with
+            with self.assertRaises(ValueError):
+                self.render(samples_per_pix=4, output=output, checkpoint=path, resume=True, denoise=True)
+            resumed = self.render(samples_per_pix=4, output=output, checkpoint=path, resume=True)
+        self.assertTrue(np.array_equal(resumed, direct))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,3 +20,13 @@ def write_color(stream, pix_color, samples_per_pix):
     stream.write(str(rgb[0]) + ' ' +
                  str(rgb[1]) + ' ' +
                  str(rgb[2]) + '\n')
+
+def luminance(rgb):
+    return rgb[..., 0]*0.2126 + rgb[..., 1]*0.7152 + rgb[..., 2]*0.0722
+
+def get_colors(radiance, samples_per_pix):
+    samples = np.maximum(np.asarray(samples_per_pix, dtype=np.float32), 1)
+    if samples.ndim:
+        samples = samples[..., None]
+    rgb = np.sqrt(np.maximum(radiance/samples, 0))
+    return (256*np.clip(rgb, 0, 0.999)).astype(np.uint8)
@@ -0,0 +1,238 @@
+import os
+import numpy as np
+from sphere import Sphere
+from triangle_mesh import TriangleMesh
+from flat_bvh import FlatBVH
+from material import scatter_by_kind, material_from_params
+import instrumentation
+
+def compile_scene(objects, accelerate=None):
+    for obj in objects:
+        if not isinstance(obj, (Sphere, TriangleMesh)):
+            raise TypeError(f'Cannot compile {type(obj).__name__}, only Sphere and TriangleMesh objects are supported')
+    scene = CompiledScene([obj for obj in objects if isinstance(obj, Sphere)])
+    if accelerate is None:
+        accelerate = len(scene) > CompiledScene.bvh_threshold
+    if accelerate:
+        scene.build_bvh()
+    meshes = [obj for obj in objects if isinstance(obj, TriangleMesh)]
+    return CompositeScene([scene] + meshes) if meshes else scene
+
+# Arrays that define a scene; everything else is derived from them. The
+# table_* arrays hold one row per distinct material.
+SCENE_ARRAYS = ('centers', 'radii', 'material_id', 'table_kind', 'table_albedo', 'table_fuzz', 'table_ri')
+
+class CompiledScene:
+    chunk_elems = 1 << 22
+    bvh_threshold = 32
+    # packet traversal wins on shallow trees; from this depth (about a
+    # thousand spheres) rays diverge enough that walking each one is faster
+    per_ray_depth = 10
+
+    def __init__(self, spheres):
+        materials = []
+        material_id = []
+        for sphere in spheres:
+            if sphere.material not in materials:
+                materials.append(sphere.material)
+            material_id.append(materials.index(sphere.material))
+
+        n = len(spheres)
+        self.centers = np.array([sphere.center.e for sphere in spheres], dtype=np.float64).reshape(n, 3)
+        self.radii = np.array([sphere.radius for sphere in spheres], dtype=np.float64)
+        self.material_id = np.array(material_id, dtype=np.int32)
+        self.table_kind = np.array([mat.kind for mat in materials], dtype=np.int8)
+        self.table_albedo = np.array([mat.albedo.e for mat in materials], dtype=np.float64).reshape(-1, 3)
+        self.table_fuzz = np.array([getattr(mat, 'fuzz', 0.0) for mat in materials], dtype=np.float64)
+        self.table_ri = np.array([getattr(mat, 'ri', 1.0) for mat in materials], dtype=np.float64)
+        self._materials = materials
+        self.bvh = None
+        self.cache_dir = None
+        self.derive()
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        scene = cls.__new__(cls)
+        for name in SCENE_ARRAYS:
+            setattr(scene, name, arrays[name])
+        bvh_arrays = {name[4:]: arrays[name] for name in arrays if name.startswith('bvh_')}
+        scene.bvh = FlatBVH.from_arrays(bvh_arrays) if bvh_arrays else None
+        scene._materials = None
+        scene.cache_dir = None
+        scene.derive()
+        return scene
+
+    def derive(self):
+        self.material_kind = self.table_kind[self.material_id]
+        self.albedo = self.table_albedo[self.material_id]
+        self.fuzz = self.table_fuzz[self.material_id]
+        self.ri = self.table_ri[self.material_id]
+        self.center_sq = np.einsum('ij,ij->i', self.centers, self.centers)
+        self.radius_sq = self.radii**2
+
+    @property
+    def materials(self):
+        if self._materials is None:
+            rows = zip(self.table_kind.tolist(), self.table_albedo.tolist(), self.table_fuzz.tolist(), self.table_ri.tolist())
+            self._materials = [material_from_params(*row) for row in rows]
+        return self._materials
+
+    def arrays(self):
+        arrays = {name: getattr(self, name) for name in SCENE_ARRAYS}
+        if self.bvh is not None:
+            arrays.update(('bvh_' + name, values) for name, values in self.bvh.arrays().items())
+        return arrays
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name, values in self.arrays().items():
+            np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(values))
+
+    @classmethod
+    def load(cls, path):
+        arrays = {}
+        for filename in os.listdir(path):
+            if filename.endswith('.npy'):
+                arrays[filename[:-4]] = np.load(os.path.join(path, filename), mmap_mode='r')
+        scene = cls.from_arrays(arrays)
+        scene.cache_dir = path
+        return scene
+
+    def __getstate__(self):
+        # a scene loaded from a cache travels as its path and is mapped again
+        if self.cache_dir is not None:
+            return {'cache_dir': self.cache_dir}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if list(state) == ['cache_dir']:
+            state = CompiledScene.load(state['cache_dir']).__dict__
+        self.__dict__.update(state)
+
+    def build_bvh(self, leaf_size=4):
+        extent = np.abs(self.radii)[:, None]
+        self.bvh = FlatBVH(self.centers - extent, self.centers + extent, leaf_size)
+
+    def __len__(self):
+        return len(self.radii)
+
+    def closest_hit(self, origins, directions, t_min=0.001, t_max=np.inf):
+        single = np.ndim(origins) == 1
+        origins = np.atleast_2d(np.asarray(origins, dtype=np.float64))
+        directions = np.atleast_2d(np.asarray(directions, dtype=np.float64))
+        t_max = np.broadcast_to(np.asarray(t_max, dtype=np.float64), (len(origins),))
+
+        hit_idx = np.full(len(origins), -1, dtype=np.int64)
+        t = np.full(len(origins), np.inf)
+        if self.bvh is not None:
+            traverse = self.bvh.closest_hit_per_ray if self.bvh.max_depth >= self.per_ray_depth else self.bvh.closest_hit
+            hit_idx, t = traverse(self.hit_pairs, origins, directions, t_min, t_max)
+        elif len(self):
+            if instrumentation.stats is not None:
+                instrumentation.stats.count('sphere_tests', len(origins)*len(self))
+            step = max(1, self.chunk_elems // len(self))
+            for start in range(0, len(origins), step):
+                sl = slice(start, start + step)
+                hit_idx[sl], t[sl] = self._closest_hit(origins[sl], directions[sl], t_min, t_max[sl])
+
+        if single:
+            return int(hit_idx[0]), float(t[0])
+        return hit_idx, t
+
+    def _closest_hit(self, origins, directions, t_min, t_max):
+        a = np.einsum('ij,ij->i', directions, directions)[:, None]
+        oc = origins @ self.centers.T
+        half_b = np.einsum('ij,ij->i', origins, directions)[:, None] - directions @ self.centers.T
+        c = np.einsum('ij,ij->i', origins, origins)[:, None] - 2*oc + (self.center_sq - self.radius_sq)
+        d = half_b**2 - a*c
+        with np.errstate(invalid='ignore'):
+            sqrtd = np.sqrt(d)
+        t_max = t_max[:, None]
+        t = (-half_b - sqrtd)/a
+        t = np.where((t > t_max) | (t < t_min), (-half_b + sqrtd)/a, t)
+        t = np.where((d < 0) | (t > t_max) | (t < t_min), np.inf, t)
+
+        hit_idx = np.argmin(t, axis=1)
+        t = t[np.arange(len(t)), hit_idx]
+        return np.where(np.isfinite(t), hit_idx, -1), t
+
+    def hit_pairs(self, sphere_idx, origins, directions, t_min, t_max):
+        co = origins - self.centers[sphere_idx]
+        a = np.einsum('ij,ij->i', directions, directions)
+        half_b = np.einsum('ij,ij->i', co, directions)
+        c = np.einsum('ij,ij->i', co, co) - self.radius_sq[sphere_idx]
+        d = half_b**2 - a*c
+        with np.errstate(invalid='ignore'):
+            sqrtd = np.sqrt(d)
+        t = (-half_b - sqrtd)/a
+        t = np.where((t > t_max) | (t < t_min), (-half_b + sqrtd)/a, t)
+        return np.where((d < 0) | (t > t_max) | (t < t_min), np.inf, t)
+
+    def outward_normals(self, hit_idx, points):
+        return (points - self.centers[hit_idx])/self.radii[hit_idx][:, None]
+
+    def hit_materials(self, hit_idx):
+        return self.material_kind[hit_idx], self.albedo[hit_idx], {'fuzz': self.fuzz[hit_idx], 'ri': self.ri[hit_idx]}
+
+    def scatter(self, hit_idx, directions, normals, front_face, uniforms=None):
+        kind, albedo, params = self.hit_materials(hit_idx)
+        return scatter_by_kind(kind, directions, normals, front_face, uniforms, albedo, params)
+
+class CompositeScene:
+    # Several compiled parts (the spheres, each triangle mesh) behind the
+    # CompiledScene interface. Part k owns hit indices offsets[k] up to
+    # offsets[k + 1]; a ray keeps the closest hit over all parts.
+    def __init__(self, parts):
+        self.parts = parts
+        self.offsets = np.cumsum([0] + [len(part) for part in parts])
+        self.material_kind = np.concatenate([part.material_kind for part in parts])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def closest_hit(self, origins, directions, t_min=0.001, t_max=np.inf):
+        single = np.ndim(origins) == 1
+        origins = np.atleast_2d(np.asarray(origins, dtype=np.float64))
+        directions = np.atleast_2d(np.asarray(directions, dtype=np.float64))
+        t = np.array(np.broadcast_to(np.asarray(t_max, dtype=np.float64), (len(origins),)))
+        hit_idx = np.full(len(origins), -1, dtype=np.int64)
+        for offset, part in zip(self.offsets, self.parts):
+            if not len(part):
+                continue
+            part_idx, part_t = part.closest_hit(origins, directions, t_min, t)
+            closer = (part_idx >= 0) & (part_t < t)
+            hit_idx[closer] = part_idx[closer] + offset
+            t[closer] = part_t[closer]
+        t[hit_idx < 0] = np.inf
+        if single:
+            return int(hit_idx[0]), float(t[0])
+        return hit_idx, t
+
+    def split(self, hit_idx):
+        part = np.searchsorted(self.offsets, hit_idx, side='right') - 1
+        for k, offset in enumerate(self.offsets[:-1]):
+            sel = np.flatnonzero(part == k)
+            if len(sel):
+                yield self.parts[k], sel, hit_idx[sel] - offset
+
+    def outward_normals(self, hit_idx, points):
+        normals = np.empty_like(points)
+        for part, sel, idx in self.split(hit_idx):
+            normals[sel] = part.outward_normals(idx, points[sel])
+        return normals
+
+    def hit_materials(self, hit_idx):
+        kind = np.empty(len(hit_idx), dtype=np.int8)
+        albedo = np.empty((len(hit_idx), 3))
+        params = {'fuzz': np.empty(len(hit_idx)), 'ri': np.empty(len(hit_idx))}
+        for part, sel, idx in self.split(hit_idx):
+            kind[sel], albedo[sel], part_params = part.hit_materials(idx)
+            for name in params:
+                params[name][sel] = part_params[name]
+        return kind, albedo, params
+
+    def scatter(self, hit_idx, directions, normals, front_face, uniforms=None):
+        # gather every part's material columns first so each kernel still
+        # runs once over all its hits
+        kind, albedo, params = self.hit_materials(hit_idx)
+        return scatter_by_kind(kind, directions, normals, front_face, uniforms, albedo, params)
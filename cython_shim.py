@@ -0,0 +1,21 @@
+# Stand-ins for the pure-Python-mode names the typed modules use, so they run
+# unchanged when Cython is not installed.
+compiled = False
+
+double = float
+bint = bool
+Py_ssize_t = int
+
+def _identity(fn):
+    return fn
+
+cclass = cfunc = ccall = inline = final = _identity
+
+def locals(**types):
+    return _identity
+
+def declare(t=None, value=None, **kwargs):
+    return value
+
+def cast(t, value):
+    return value
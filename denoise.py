@@ -0,0 +1,65 @@
+import numpy as np
+from color import luminance
+
+# B3 spline taps of the a-trous wavelet; level k spaces them 2**k pixels apart
+KERNEL = np.array([1/16, 1/4, 3/8, 1/4, 1/16])
+EPSILON = 1e-6
+
+def pad(values, r):
+    return np.pad(values, [(r, r), (r, r)] + [(0, 0)]*(values.ndim - 2), mode='edge')
+
+def blur3(values):
+    padded = pad(values, 1)
+    height, width = values.shape[:2]
+    weights = np.array([1/4, 1/2, 1/4])
+    return sum(weights[dy]*weights[dx]*padded[dy:dy + height, dx:dx + width] for dy in range(3) for dx in range(3))
+
+def atrous(color, variance, guides, iterations=3, sigma_luminance=4.0):
+    # Edge-avoiding a-trous wavelet filter. A tap's weight falls off with the
+    # luminance difference measured in local standard deviations and with
+    # the difference of each guide buffer, so noise is averaged within
+    # surfaces but not across silhouettes, creases or material edges. The
+    # variance is filtered along with the image, which makes the later,
+    # wider levels less aggressive.
+    height, width = color.shape[:2]
+    for level in range(iterations):
+        step = 1 << level
+        r = 2*step
+        lum = luminance(color)
+        scale = sigma_luminance*np.sqrt(blur3(variance)) + EPSILON
+        padded = [pad(values, r) for values in (color, variance, lum)]
+        padded_guides = [(pad(values, r), values, sigma) for values, sigma in guides]
+        total = np.zeros_like(color)
+        weight_sum = np.zeros((height, width))
+        variance_sum = np.zeros((height, width))
+        for ky in range(5):
+            for kx in range(5):
+                dy, dx = (ky - 2)*step, (kx - 2)*step
+                window = (slice(r + dy, r + dy + height), slice(r + dx, r + dx + width))
+                q_color, q_variance, q_lum = (values[window] for values in padded)
+                exponent = np.abs(q_lum - lum)/scale
+                for q_guide, guide, sigma in padded_guides:
+                    diff = (q_guide[window] - guide)**2
+                    exponent += (diff.sum(axis=2) if diff.ndim == 3 else diff)/sigma**2
+                w = KERNEL[ky]*KERNEL[kx]*np.exp(-exponent)
+                total += w[..., None]*q_color
+                weight_sum += w
+                variance_sum += w**2*q_variance
+        color = total/weight_sum[..., None]
+        variance = variance_sum/weight_sum**2
+    return color
+
+def denoise(framebuffer, iterations=3, sigma_normal=1.0, sigma_albedo=0.5, sigma_depth=3.0):
+    # Filters the pixel means of a framebuffer rendered with AOV buffers and
+    # returns them as an (height, width, 3) array. The guides are themselves
+    # averages over a pixel's samples, noisy under depth of field, so their
+    # sigmas are loose; depth is compared on a log scale and only stops the
+    # filter at large jumps.
+    n = np.maximum(framebuffer.counts, 1).astype(np.float64)
+    color = framebuffer.radiance/n[..., None]
+    depth = framebuffer.resolve_aov('depth').astype(np.float64)
+    guides = [(framebuffer.resolve_aov('normal'), sigma_normal), (framebuffer.resolve_aov('albedo'), sigma_albedo),
+              (np.log1p(depth), sigma_depth)]
+    # variance of the pixel mean from the per-pixel luminance moments
+    variance = np.maximum(framebuffer.luminance_sq/n - luminance(color)**2, 0)/np.maximum(n - 1, 1)
+    return atrous(color, variance, guides, iterations)
@@ -0,0 +1,51 @@
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+import numpy as np
+from color import luminance
+from framebuffer import SharedFramebuffer
+from denoise import denoise
+from main import PathTracer
+
+class TestDenoise(unittest.TestCase):
+
+    def test_smooths_noise_but_keeps_edges(self):
+        # two flat surfaces meeting at x = 16, lit at 0.2 and 0.8, with noisy samples
+        rng = np.random.default_rng(0)
+        fb = SharedFramebuffer(32, 24, aovs=True)
+        try:
+            truth = np.where(np.arange(32) < 16, 0.2, 0.8)[None, :, None]*np.ones((24, 32, 3))
+            samples = truth[None] + rng.normal(0, 0.1, size=(4, 24, 32, 1))
+            fb.radiance[:] = samples.sum(axis=0)
+            fb.luminance_sq[:] = (luminance(samples)**2).sum(axis=0)
+            fb.counts[:] = 4
+            fb.normal[:, :16] = 4*np.array([0, 0, 1])
+            fb.normal[:, 16:] = 4*np.array([1, 0, 0])
+            fb.albedo[:] = 4*0.5
+            fb.depth[:] = 4*2.0
+            noisy = np.abs(fb.resolve() - truth).mean()
+            denoised = denoise(fb)
+        finally:
+            fb.close()
+        self.assertLess(np.abs(denoised - truth).mean(), noisy/3)
+        self.assertTrue(np.allclose(denoised[:, 14], 0.2, atol=0.05))
+        self.assertTrue(np.allclose(denoised[:, 17], 0.8, atol=0.05))
+
+    def test_run_writes_aovs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'image.npy')
+            with contextlib.redirect_stdout(io.StringIO()):
+                PathTracer(image_width=16, image_height=12, samples_per_pix=2, max_depth=4, engine='wavefront',
+                           output=output, denoise=True, aovs=True).run()
+            normal = np.load(os.path.join(tmp, 'image_normal.npy'))
+            depth = np.load(os.path.join(tmp, 'image_depth.npy'))
+            self.assertEqual(np.load(output).shape, (12, 16, 3))
+        # pixels whose samples all missed record neither depth nor normal
+        self.assertTrue((depth > 0).any())
+        self.assertTrue(np.array_equal(depth == 0, np.linalg.norm(normal, axis=2) == 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+import json
+import time
+import socket
+import struct
+import threading
+from collections import deque
+import numpy as np
+from scheduler import Tile
+
+MAGIC = b'RD'
+FRAME = struct.Struct('<2sBI')
+HELLO, CONFIG, TILE, RESULT, DONE = range(5)
+# tile index, x0, y0, width, height, samples
+TILE_HEADER = struct.Struct('<IHHHHI')
+# tile index, x0, y0, width, height, render seconds, paths, segments, roulette terminations
+RESULT_HEADER = struct.Struct('<IHHHHdQQQ')
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+def send_message(sock, kind, payload=b''):
+    sock.sendall(FRAME.pack(MAGIC, kind, len(payload)) + payload)
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        data += chunk
+    return bytes(data)
+
+def recv_message(sock):
+    magic, kind, size = FRAME.unpack(recv_exact(sock, FRAME.size))
+    if magic != MAGIC:
+        raise ConnectionError(f'bad frame magic {magic!r}')
+    return kind, recv_exact(sock, size)
+
+def encode_tile_request(tile, samples, mask, first_sample):
+    return (TILE_HEADER.pack(tile.index, tile.x0, tile.y0, tile.width, tile.height, samples)
+            + np.ascontiguousarray(mask, dtype=np.uint8).tobytes()
+            + np.ascontiguousarray(first_sample, dtype='<u4').tobytes())
+
+def decode_tile_request(payload):
+    index, x0, y0, width, height, samples = TILE_HEADER.unpack_from(payload)
+    n = width*height
+    offset = TILE_HEADER.size
+    mask = np.frombuffer(payload, dtype=np.uint8, count=n, offset=offset).reshape(height, width).astype(bool)
+    first_sample = np.frombuffer(payload, dtype='<u4', count=n, offset=offset + n).reshape(height, width)
+    return Tile(index, x0, y0, width, height), samples, mask, first_sample.astype(np.int64)
+
+def encode_tile_result(tile, radiance, luminance_sq, seconds, paths):
+    return (RESULT_HEADER.pack(tile.index, tile.x0, tile.y0, tile.width, tile.height, seconds, *paths)
+            + np.ascontiguousarray(radiance, dtype='<f4').tobytes()
+            + np.ascontiguousarray(luminance_sq, dtype='<f4').tobytes())
+
+def decode_tile_result(payload):
+    index, x0, y0, width, height, seconds, *paths = RESULT_HEADER.unpack_from(payload)
+    n = width*height
+    offset = RESULT_HEADER.size
+    radiance = np.frombuffer(payload, dtype='<f4', count=3*n, offset=offset).reshape(height, width, 3)
+    luminance_sq = np.frombuffer(payload, dtype='<f4', count=n, offset=offset + 12*n).reshape(height, width)
+    return Tile(index, x0, y0, width, height), radiance, luminance_sq, seconds, paths
+
+class NodeStats:
+    def __init__(self, name, peer):
+        self.name = name
+        self.peer = peer
+        self.tiles = 0
+        self.samples = 0
+        self.busy = 0.0
+        self.connected = time.perf_counter()
+        self.disconnected = None
+
+    def summary(self):
+        wall = (self.disconnected or time.perf_counter()) - self.connected
+        rate = self.samples/self.busy if self.busy else 0.0
+        return (f'node {self.name} ({self.peer[0]}:{self.peer[1]}): {self.tiles} tiles, {self.samples} samples, '
+                f'{self.busy:.2f}s busy of {wall:.2f}s, {rate:.0f} samples/s')
+
+class Coordinator:
+    # Serves tiles of the tracer's current pass to TCP workers, one tile in
+    # flight per connection, and puts a dead connection's tile back in the queue.
+    def __init__(self, address, tracer):
+        self.tracer = tracer
+        self.server = socket.create_server(address)
+        self.server.settimeout(0.2)
+        self.address = self.server.getsockname()
+        self.cond = threading.Condition()
+        self.pending = deque()
+        self.remaining = 0
+        self.samples = 0
+        self.closing = False
+        self.nodes = []
+        self.connections = set()
+        self.threads = []
+        self.accept_thread = threading.Thread(target=self.accept_loop, daemon=True)
+        self.accept_thread.start()
+
+    def log(self, message):
+        print(message, file=self.tracer.log_stream, flush=True)
+
+    def accept_loop(self):
+        while not self.closing:
+            try:
+                conn, peer = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            conn.settimeout(None)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self.serve, args=(conn, peer), daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def next_tile(self):
+        with self.cond:
+            while not self.pending and not self.closing:
+                self.cond.wait(0.2)
+            if self.closing:
+                return None
+            return self.pending.popleft()
+
+    def serve(self, conn, peer):
+        with self.cond:
+            self.connections.add(conn)
+        tile = None
+        node = None
+        try:
+            kind, payload = recv_message(conn)
+            if kind != HELLO:
+                raise ConnectionError('expected HELLO')
+            node = NodeStats(payload.decode() or f'{peer[0]}:{peer[1]}', peer)
+            self.nodes.append(node)
+            self.log(f'Worker {node.name} connected from {peer[0]}:{peer[1]}')
+            send_message(conn, CONFIG, json.dumps(self.tracer.worker_config()).encode())
+            while True:
+                tile = self.next_tile()
+                if tile is None:
+                    send_message(conn, DONE)
+                    return
+                fb = self.tracer.framebuffer
+                region = (slice(tile.y0, tile.y0 + tile.height), slice(tile.x0, tile.x0 + tile.width))
+                mask = self.tracer.tile_mask(tile)
+                send_message(conn, TILE, encode_tile_request(tile, self.samples, mask, fb.counts[region]))
+                kind, payload = recv_message(conn)
+                if kind != RESULT:
+                    raise ConnectionError(f'expected RESULT, got message type {kind}')
+                result, radiance, luminance_sq, seconds, paths = decode_tile_result(payload)
+                if result.index != tile.index:
+                    raise ConnectionError(f'result for tile {result.index} while tile {tile.index} was assigned')
+                with self.cond:
+                    if self.closing:
+                        return
+                    with self.tracer.accumulate_lock:
+                        fb.accumulate(tile.x0, tile.y0, radiance, luminance_sq, self.samples*mask)
+                    with self.tracer.path_counts.get_lock():
+                        for k, n in enumerate(paths):
+                            self.tracer.path_counts[k] += n
+                    node.tiles += 1
+                    node.samples += self.samples*int(mask.sum())
+                    node.busy += seconds
+                self.tracer.publish_tile(tile)
+                fb.release(tile.y0, tile.y0 + tile.height)
+                with self.cond:
+                    tile = None
+                    self.remaining -= 1
+                    self.cond.notify_all()
+        except (ConnectionError, OSError) as e:
+            with self.cond:
+                if tile is not None and not self.closing:
+                    self.pending.appendleft(tile)
+                    self.cond.notify_all()
+                    self.log(f'Worker {node.name if node else peer} lost ({e}), reissuing tile {tile.index}')
+        finally:
+            if node is not None:
+                node.disconnected = time.perf_counter()
+            with self.cond:
+                self.connections.discard(conn)
+            conn.close()
+
+    def render_pass(self, tiles, samples):
+        with self.cond:
+            self.samples = samples
+            self.remaining = len(tiles)
+            self.pending.extend(tiles)
+            self.cond.notify_all()
+            while self.remaining and not self.tracer.stop_event.is_set():
+                self.cond.wait(0.2)
+            self.pending.clear()
+
+    def report(self):
+        for node in self.nodes:
+            self.log(node.summary())
+
+    def close(self):
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        self.accept_thread.join()
+        self.server.close()
+        for thread in self.threads:
+            thread.join(1.0)
+        with self.cond:
+            # anything still connected is mid-tile; drop it
+            for conn in list(self.connections):
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        for thread in self.threads:
+            thread.join()
+
+def run_worker(address, name='', retry_seconds=10.0):
+    # imported here because main imports this module for the coordinator side
+    from main import PathTracer
+    deadline = time.monotonic() + retry_seconds
+    while True:
+        try:
+            sock = socket.create_connection(address)
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    with sock:
+        send_message(sock, HELLO, name.encode())
+        kind, payload = recv_message(sock)
+        if kind != CONFIG:
+            raise ConnectionError('expected CONFIG')
+        tracer = PathTracer(progress='none', **json.loads(payload))
+        tracer.build_world()
+        tracer.setup_camera()
+        tracer.prepare_renderer()
+        source = tracer.wavefront if tracer.engine == 'wavefront' else tracer
+        while True:
+            kind, payload = recv_message(sock)
+            if kind == DONE:
+                return
+            if kind != TILE:
+                raise ConnectionError(f'unexpected message type {kind}')
+            tile, samples, mask, first_sample = decode_tile_request(payload)
+            before = (source.paths, source.segments, source.roulette_terminations)
+            start = time.perf_counter()
+            radiance, luminance_sq = tracer.render_tile(tile, samples, mask, first_sample)
+            seconds = time.perf_counter() - start
+            after = (source.paths, source.segments, source.roulette_terminations)
+            paths = [b - a for a, b in zip(before, after)]
+            send_message(sock, RESULT, encode_tile_result(tile, radiance, luminance_sq, seconds, paths))
+
+def run_workers(address, count=1, name=None):
+    # one connection per process, so a node contributes `count` cores
+    from multiprocessing import Process
+    name = name or socket.gethostname()
+    if count <= 1:
+        run_worker(address, name)
+        return 0
+    workers = [Process(target=run_worker, args=(address, f'{name}/{k}')) for k in range(count)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return max(abs(w.exitcode) for w in workers)
@@ -0,0 +1,58 @@
+import io
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import contextlib
+import numpy as np
+from main import PathTracer
+from distributed import run_worker, send_message, recv_message, HELLO, CONFIG, TILE
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def flaky_worker(address, got_tile):
+    # takes one tile and hangs up without answering
+    while True:
+        try:
+            sock = socket.create_connection(address)
+            break
+        except OSError:
+            pass
+    with sock:
+        send_message(sock, HELLO, b'flaky')
+        assert recv_message(sock)[0] == CONFIG
+        assert recv_message(sock)[0] == TILE
+    got_tile.set()
+
+class TestDistributed(unittest.TestCase):
+
+    def render(self, path, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            pt = PathTracer(image_width=24, image_height=16, samples_per_pix=2, max_depth=4, engine='wavefront',
+                            tile_size=8, progress='none', output=path, **kwargs)
+            pt.run()
+        return pt, np.load(path)
+
+    def test_lost_worker_tiles_are_reissued(self):
+        address = ('127.0.0.1', free_port())
+        got_tile = threading.Event()
+        threads = [threading.Thread(target=flaky_worker, args=(address, got_tile)),
+                   threading.Thread(target=lambda: got_tile.wait(10) and run_worker(address, 'good'))]
+        for t in threads:
+            t.start()
+        with tempfile.TemporaryDirectory() as tmp:
+            pt, remote = self.render(os.path.join(tmp, 'remote.npy'), listen=f'{address[0]}:{address[1]}')
+            _, local = self.render(os.path.join(tmp, 'local.npy'))
+        for t in threads:
+            t.join()
+        self.assertTrue(np.array_equal(remote, local))
+        tiles = {node.name: node.tiles for node in pt.coordinator.nodes}
+        self.assertEqual(tiles, {'flaky': 0, 'good': 6})
+
+
+if __name__ == '__main__':
+    unittest.main()
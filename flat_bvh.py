@@ -0,0 +1,179 @@
+import numpy as np
+import instrumentation
+
+BVH_ARRAYS = ('node_min', 'node_max', 'left', 'right', 'first', 'count', 'split_axis', 'prim_order')
+
+class FlatBVH:
+    def __init__(self, box_min, box_max, leaf_size=4):
+        centroids = 0.5*(box_min + box_max)
+        node_min, node_max, left, right, first, count, split_axis = [], [], [], [], [], [], []
+        self.prim_order = np.arange(len(box_min), dtype=np.int64)
+
+        stack = [(0, len(box_min), -1, False)]
+        while stack:
+            start, end, parent, is_right = stack.pop()
+            node = len(node_min)
+            if parent >= 0:
+                (right if is_right else left)[parent] = node
+            prims = self.prim_order[start:end]
+            node_min.append(box_min[prims].min(axis=0))
+            node_max.append(box_max[prims].max(axis=0))
+            left.append(-1)
+            right.append(-1)
+            first.append(start)
+            count.append(end - start)
+            split_axis.append(0)
+            if end - start <= leaf_size:
+                continue
+
+            extent = centroids[prims].max(axis=0) - centroids[prims].min(axis=0)
+            axis = int(np.argmax(extent))
+            split_axis[node] = axis
+            mid = (end - start)//2
+            order = np.argpartition(centroids[prims, axis], mid)
+            self.prim_order[start:end] = prims[order]
+            count[node] = 0
+            stack.append((start + mid, end, node, True))
+            stack.append((start, start + mid, node, False))
+
+        self.node_min = np.array(node_min, dtype=np.float64).reshape(-1, 3)
+        self.node_max = np.array(node_max, dtype=np.float64).reshape(-1, 3)
+        self.left = np.array(left, dtype=np.int32)
+        self.right = np.array(right, dtype=np.int32)
+        self.first = np.array(first, dtype=np.int64)
+        self.count = np.array(count, dtype=np.int64)
+        self.split_axis = np.array(split_axis, dtype=np.int8)
+        self.derive()
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        bvh = cls.__new__(cls)
+        for name in BVH_ARRAYS:
+            setattr(bvh, name, arrays[name])
+        bvh.derive()
+        return bvh
+
+    def derive(self):
+        # sizes closest_hit_per_ray needs on every call, found once
+        self.max_depth = self.depth()
+        self.leaf_width = int(self.count.max())
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in BVH_ARRAYS}
+
+    def __len__(self):
+        return len(self.left)
+
+    def slab_test(self, node, origins, inv_dirs, t_min, t_max):
+        with np.errstate(invalid='ignore'):
+            t0 = (self.node_min[node] - origins)*inv_dirs
+            t1 = (self.node_max[node] - origins)*inv_dirs
+        t_near = np.fmax(np.fmin(t0, t1).max(axis=1), t_min)
+        t_far = np.fmin(np.fmax(t0, t1).min(axis=1), t_max)
+        return t_near <= t_far
+
+    def closest_hit(self, intersect, origins, directions, t_min, t_max, counter='sphere_tests'):
+        with np.errstate(divide='ignore'):
+            inv_dirs = 1.0/directions
+        best_t = np.array(t_max, dtype=np.float64)
+        best_prim = np.full(len(origins), -1, dtype=np.int64)
+
+        stats = instrumentation.stats
+        stack = [(0, np.arange(len(origins)))]
+        while stack:
+            node, rays = stack.pop()
+            if stats is not None:
+                stats.count('bvh_node_tests', len(rays))
+            rays = rays[self.slab_test(node, origins[rays], inv_dirs[rays], t_min, best_t[rays])]
+            if not len(rays):
+                continue
+
+            if self.count[node]:
+                prims = self.prim_order[self.first[node]:self.first[node] + self.count[node]]
+                pair_rays = np.repeat(rays, len(prims))
+                pair_prims = np.tile(prims, len(rays))
+                if stats is not None:
+                    stats.count(counter, len(pair_rays))
+                t = intersect(pair_prims, origins[pair_rays], directions[pair_rays], t_min, best_t[pair_rays])
+                t = t.reshape(len(rays), len(prims))
+                k = np.argmin(t, axis=1)
+                t = t[np.arange(len(rays)), k]
+                closer = t < best_t[rays]
+                best_t[rays[closer]] = t[closer]
+                best_prim[rays[closer]] = prims[k[closer]]
+                continue
+
+            near, far = self.left[node], self.right[node]
+            if directions[rays, self.split_axis[node]].sum() < 0:
+                near, far = far, near
+            stack.append((far, rays))
+            stack.append((near, rays))
+
+        return best_prim, np.where(best_prim >= 0, best_t, np.inf)
+
+    def depth(self):
+        frontier, depth = np.array([0]), 0
+        while len(frontier):
+            children = np.concatenate([self.left[frontier], self.right[frontier]])
+            frontier = children[children >= 0]
+            depth += 1
+        return depth
+
+    def closest_hit_per_ray(self, intersect, origins, directions, t_min, t_max, counter='sphere_tests'):
+        # Every ray walks the tree with its own stack and all rays advance
+        # one node per step. closest_hit splits packets at each node, which
+        # is cheap for small coherent trees but costs a NumPy call per node
+        # and sub-packet once rays diverge in a deep tree; here the number
+        # of steps is the longest walk of any one ray.
+        with np.errstate(divide='ignore'):
+            inv_dirs = 1.0/directions
+        best_t = np.array(t_max, dtype=np.float64)
+        best_prim = np.full(len(origins), -1, dtype=np.int64)
+        stack = np.zeros((len(origins), self.max_depth + 1), dtype=np.int32)
+        top = np.ones(len(origins), dtype=np.int64)
+        leaf_width = self.leaf_width
+        stats = instrumentation.stats
+
+        rays = np.arange(len(origins))
+        while len(rays):
+            top[rays] -= 1
+            node = stack[rays, top[rays]]
+            if stats is not None:
+                stats.count('bvh_node_tests', len(rays))
+            with np.errstate(invalid='ignore'):
+                t0 = (self.node_min[node] - origins[rays])*inv_dirs[rays]
+                t1 = (self.node_max[node] - origins[rays])*inv_dirs[rays]
+            t_near = np.fmax(np.fmin(t0, t1).max(axis=1), t_min)
+            t_far = np.fmin(np.fmax(t0, t1).min(axis=1), best_t[rays])
+            enter = t_near <= t_far
+            rays, node = rays[enter], node[enter]
+
+            leaf = self.count[node] > 0
+            if leaf.any():
+                leaf_rays, leaf_node = rays[leaf], node[leaf]
+                slot = np.arange(leaf_width)
+                valid = slot < self.count[leaf_node][:, None]
+                prims = self.prim_order[np.minimum(self.first[leaf_node][:, None] + slot,
+                                                   len(self.prim_order) - 1)]
+                pair_rays = np.repeat(leaf_rays, leaf_width)
+                if stats is not None:
+                    stats.count(counter, int(valid.sum()))
+                t = intersect(prims.ravel(), origins[pair_rays], directions[pair_rays], t_min, best_t[pair_rays])
+                t = np.where(valid, t.reshape(len(leaf_rays), leaf_width), np.inf)
+                k = np.argmin(t, axis=1)
+                t = t[np.arange(len(leaf_rays)), k]
+                closer = t < best_t[leaf_rays]
+                best_t[leaf_rays[closer]] = t[closer]
+                best_prim[leaf_rays[closer]] = prims[np.flatnonzero(closer), k[closer]]
+
+            inner_rays, inner_node = rays[~leaf], node[~leaf]
+            near, far = self.left[inner_node], self.right[inner_node]
+            flip = directions[inner_rays, self.split_axis[inner_node]] < 0
+            near, far = np.where(flip, far, near), np.where(flip, near, far)
+            stack[inner_rays, top[inner_rays]] = far
+            stack[inner_rays, top[inner_rays] + 1] = near
+            top[inner_rays] += 2
+
+            rays = np.flatnonzero(top > 0)
+
+        return best_prim, np.where(best_prim >= 0, best_t, np.inf)
@@ -0,0 +1,178 @@
+import os
+import mmap
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from color import luminance
+from image_io import strips
+
+def attach_shared_memory(name):
+    # only the creator should track the segment; a tracked attachment is
+    # reported as leaked and unlinked again when the attaching process exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+# auxiliary buffers of the first hit, summed over samples like radiance;
+# misses count as normal 0, the sky colour as albedo and depth 0
+AOV_CHANNELS = {'normal': 3, 'albedo': 3, 'depth': 1}
+
+class SharedFramebuffer:
+    # Per-pixel accumulation buffers shared by all workers, in one shared
+    # memory segment or, given a path, in a memory-mapped file. In the file
+    # case nothing ever reads the whole image at once: workers touch their
+    # tiles, whole-image passes go a strip at a time, and release() drops
+    # finished rows from the resident set, so memory use does not grow with
+    # the resolution.
+    def __init__(self, image_width, image_height, name=None, aovs=False, path=None):
+        self.image_width = image_width
+        self.image_height = image_height
+        self.aovs = aovs
+        self.path = path
+        layout = [
+            ('radiance', (image_height, image_width, 3), np.float32),
+            ('luminance_sq', (image_height, image_width), np.float32),
+            ('counts', (image_height, image_width), np.uint32),
+            ('cost', (image_height, image_width), np.float32),
+            ('active', (image_height, image_width), np.bool_),
+        ]
+        if aovs:
+            for aov, channels in AOV_CHANNELS.items():
+                shape = (image_height, image_width, channels) if channels > 1 else (image_height, image_width)
+                layout.append((aov, shape, np.float32))
+        size = sum(int(np.prod(shape))*np.dtype(dtype).itemsize for _, shape, dtype in layout)
+        self.owner = name is None
+        if path is not None:
+            if self.owner:
+                # a sparse file reads back as zeros without being written
+                with open(path, 'wb') as f:
+                    f.truncate(size)
+            self.map = np.memmap(path, dtype=np.uint8, mode='r+', shape=(size,))
+            buffer = self.map
+        elif self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            buffer = self.shm.buf
+        else:
+            self.shm = attach_shared_memory(name)
+            buffer = self.shm.buf
+        self.row_ranges = []
+        offset = 0
+        for attr, shape, dtype in layout:
+            setattr(self, attr, np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset))
+            self.row_ranges.append((offset, int(np.prod(shape[1:]))*np.dtype(dtype).itemsize))
+            offset += int(np.prod(shape))*np.dtype(dtype).itemsize
+        if self.owner and path is None:
+            self.radiance.fill(0)
+            self.luminance_sq.fill(0)
+            self.counts.fill(0)
+            self.cost.fill(0)
+            for aov in self.aov_names():
+                getattr(self, aov).fill(0)
+        if self.owner:
+            for y0, y1 in self.strips():
+                self.active[y0:y1] = True
+
+    @property
+    def name(self):
+        return self.path if self.path is not None else self.shm.name
+
+    def aov_names(self):
+        return tuple(AOV_CHANNELS) if self.aovs else ()
+
+    def __getstate__(self):
+        return {'image_width': self.image_width, 'image_height': self.image_height, 'name': self.name,
+                'aovs': self.aovs, 'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def accumulate(self, x0, y0, radiance, luminance_sq, samples, aovs=None):
+        height, width = radiance.shape[:2]
+        self.radiance[y0:y0 + height, x0:x0 + width] += radiance
+        self.luminance_sq[y0:y0 + height, x0:x0 + width] += luminance_sq
+        self.counts[y0:y0 + height, x0:x0 + width] += np.asarray(samples, dtype=np.uint32)
+        for aov, values in (aovs or {}).items():
+            getattr(self, aov)[y0:y0 + height, x0:x0 + width] += values
+
+    def release(self, y0, y1):
+        # drops rows y0..y1 of every buffer from this process's resident set;
+        # the page cache keeps the data and writes it back to the file
+        if self.path is None or not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        for offset, row_bytes in self.row_ranges:
+            start = offset + y0*row_bytes
+            start -= start % mmap.PAGESIZE
+            self.map.base.madvise(mmap.MADV_DONTNEED, start, offset + y1*row_bytes - start)
+
+    def strips(self):
+        for y0, y1 in strips(self.image_height, self.image_width, top_down=False):
+            yield y0, y1
+            self.release(y0, y1)
+
+    def active_tiles(self, tiles, target):
+        # tiles with an active pixel that has fewer than target samples
+        bands = {}
+        for tile in tiles:
+            bands.setdefault((tile.y0, tile.height), []).append(tile)
+        active = set()
+        for (y0, height), band_tiles in bands.items():
+            band = self.active[y0:y0 + height] & (self.counts[y0:y0 + height] < target)
+            active.update(tile for tile in band_tiles if band[:, tile.x0:tile.x0 + tile.width].any())
+            self.release(y0, y0 + height)
+        return [tile for tile in tiles if tile in active]
+
+    def total_samples(self):
+        return sum(int(self.counts[y0:y1].sum(dtype=np.uint64)) for y0, y1 in self.strips())
+
+    def display_error(self, y0=0, y1=None):
+        # standard error of the mean luminance carried through the sqrt gamma
+        # curve, i.e. the expected noise in the written pixel value
+        rows = slice(y0, y1)
+        n = np.maximum(self.counts[rows], 1).astype(np.float64)
+        mean = luminance(self.radiance[rows])/n
+        variance = np.maximum(self.luminance_sq[rows]/n - mean**2, 0)*n/np.maximum(n - 1, 1)
+        return np.sqrt(variance/n)/(2*np.sqrt(np.maximum(mean, 1e-3)))
+
+    def update_active(self, noise_threshold, max_samples):
+        # a pixel keeps sampling while any pixel in its 3x3 neighbourhood is
+        # noisy, which protects against variance estimates that are low by chance
+        height, width = self.counts.shape
+        active = 0
+        for y0, y1 in self.strips():
+            # a strip at a time, with a row of context above and below
+            lo, hi = max(y0 - 1, 0), min(y1 + 1, height)
+            error = np.pad(self.display_error(lo, hi), 1, mode='edge')[y0 - lo:]
+            rows = y1 - y0
+            neighbourhood = np.max([error[dy:dy + rows, dx:dx + width] for dy in range(3) for dx in range(3)], axis=0)
+            active_rows = self.active[y0:y1]
+            np.logical_and(active_rows, self.counts[y0:y1] < max_samples, out=active_rows)
+            np.logical_and(active_rows, neighbourhood > noise_threshold, out=active_rows)
+            active += int(active_rows.sum())
+        return active
+
+    def resolve(self):
+        return self.radiance/np.maximum(self.counts, 1)[..., None]
+
+    def resolve_aov(self, aov):
+        values = getattr(self, aov)
+        n = np.maximum(self.counts, 1)
+        return values/(n[..., None] if values.ndim == 3 else n)
+
+    def close(self):
+        self.radiance = self.luminance_sq = self.counts = self.cost = self.active = None
+        for aov in self.aov_names():
+            setattr(self, aov, None)
+        if self.path is not None:
+            # the mapping goes away with the last view of it
+            self.map = None
+            if self.owner:
+                os.unlink(self.path)
+            return
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,85 @@
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+import numpy as np
+import image_io
+from color import luminance
+from framebuffer import SharedFramebuffer
+from main import PathTracer
+
+def noisy_edge_framebuffer(samples=8):
+    # a flat grey image whose column x = 20 alternates black and white samples
+    fb = SharedFramebuffer(32, 24)
+    values = np.full((samples, 24, 32), 0.5)
+    values[::2, :, 20] = 0.0
+    values[1::2, :, 20] = 1.0
+    fb.radiance[:] = values.sum(axis=0)[..., None]
+    fb.luminance_sq[:] = (luminance(np.repeat(values[..., None], 3, axis=3))**2).sum(axis=0)
+    fb.counts[:] = samples
+    return fb
+
+class TestAdaptiveMask(unittest.TestCase):
+
+    def test_flat_pixels_stop_and_the_edge_neighbourhood_continues(self):
+        fb = noisy_edge_framebuffer()
+        try:
+            error = fb.display_error()
+            self.assertTrue(np.allclose(error[:, :19], 0))
+            self.assertGreater(error[:, 20].min(), 0.01)
+            active = fb.update_active(0.01, 64)
+            mask = fb.active.copy()
+        finally:
+            fb.close()
+        self.assertEqual(active, 3*24)
+        self.assertTrue(mask[:, 19:22].all())
+        self.assertFalse(mask[:, :19].any() or mask[:, 22:].any())
+
+    def test_pixels_stop_at_max_samples(self):
+        fb = noisy_edge_framebuffer()
+        try:
+            self.assertEqual(fb.update_active(0.01, 8), 0)
+            self.assertFalse(fb.active.any())
+        finally:
+            fb.close()
+
+    def test_strips_match_whole_image(self):
+        fb = noisy_edge_framebuffer()
+        try:
+            fb.counts[5, 3] = 2
+            fb.luminance_sq[17, 7] *= 1.5
+            error = np.pad(fb.display_error(), 1, mode='edge')
+            neighbourhood = np.max([error[dy:dy + 24, dx:dx + 32] for dy in range(3) for dx in range(3)], axis=0)
+            expected = (fb.counts < 64) & (neighbourhood > 0.01)
+            saved = image_io.STRIP_PIXELS
+            # 32 and 96 pixels are one and three rows of this image
+            for strip_pixels in (32, 96, saved):
+                image_io.STRIP_PIXELS = strip_pixels
+                try:
+                    fb.active[:] = True
+                    fb.update_active(0.01, 64)
+                finally:
+                    image_io.STRIP_PIXELS = saved
+                self.assertTrue(np.array_equal(fb.active, expected), strip_pixels)
+        finally:
+            fb.close()
+
+class TestFramebufferFile(unittest.TestCase):
+
+    def test_framebuffer_file_matches_shared_memory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            images = []
+            for framebuffer_file in (None, os.path.join(tmp, 'framebuffer')):
+                output = os.path.join(tmp, f'{len(images)}.npy')
+                with contextlib.redirect_stdout(io.StringIO()):
+                    PathTracer(image_width=16, image_height=12, samples_per_pix=4, max_depth=4, workers=2,
+                               engine='wavefront', tile_size=8, adaptive=True, min_samples=2, samples_per_pass=1,
+                               output=output, framebuffer_file=framebuffer_file).run()
+                images.append(np.load(output))
+            self.assertFalse(os.path.exists(os.path.join(tmp, 'framebuffer')))
+        self.assertTrue(np.array_equal(*images))
+
+
+if __name__ == '__main__':
+    unittest.main()
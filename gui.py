@@ -5,6 +5,7 @@ import PySide2
 from multiprocessing import Process
 
 from main import PathTracer
+from progress import TileStreamDecoder
 
 dirname = os.path.dirname(PySide2.__file__)
 plugin_path = os.path.join(dirname, 'plugins', 'platforms')
@@ -90,8 +91,7 @@ class PathTracerWindow(QMainWindow):
 
         self.render_process = None
         self.pixel_count = 0
-        self.row, self.col = None, None
-        self.r, self.g, self.b = None, None, None
+        self.decoder = TileStreamDecoder()
 
     def render_clicked(self, is_checked):
         if not is_checked:
@@ -160,8 +160,15 @@ class PathTracerWindow(QMainWindow):
             self.image_height,
             self.samples_per_pix,
             self.max_depth,
-            self.workers
+            self.workers,
+            '--progress',
+            'binary',
         ]
+        if os.environ.get('RAYTRACER_SERVICE'):
+            # thin client: the service drops the job when this process is killed,
+            # and a new render replaces the previous one
+            args += ['--submit', os.environ['RAYTRACER_SERVICE'], '--tag', 'gui', '--priority', '1']
+        self.decoder = TileStreamDecoder()
         self.render_process = QProcess()
         self.render_process.setProgram('python')
         self.render_process.setArguments([str(arg) for arg in args])
@@ -169,37 +176,14 @@ class PathTracerWindow(QMainWindow):
         self.render_process.start()
 
     def set_pixel(self):
-        data = bytes(self.render_process.readAllStandardOutput()).decode()
-        parts = data.split('\n')
-        for s in parts:
-            if not s or ':' not in s:
-                continue
-            s = s.strip('\r')
-            label, val = s.split(':')
-            val = int(val)
-            if label == 'x':
-                self.row = self.image_width - 1 - val
-            elif label == 'y':
-                self.col = self.image_height - 1 - val
-            elif label == 'r':
-                self.r = val
-            elif label == 'g':
-                self.g = val
-            elif label == 'b':
-                self.b = val
-            if all([
-                self.row is not None,
-                self.col is not None,
-                self.r is not None,
-                self.g is not None,
-                self.b is not None
-            ]):
-                self.painter.setPen(qRgb(self.r, self.g, self.b))
-                self.painter.drawPoint(self.row, self.col)
-                self.display_widget.update()
-                self.pixel_count += 1
-                self.row, self.col = None, None
-                self.r, self.g, self.b = None, None, None
+        data = bytes(self.render_process.readAllStandardOutput())
+        tiles = self.decoder.feed(data)
+        for x, y, width, height, rgb in tiles:
+            image = QImage(rgb, width, height, 3*width, QImage.Format_RGB888)
+            self.painter.drawImage(x, y, image)
+            self.pixel_count += width*height
+        if tiles:
+            self.display_widget.update()
 
     def render_worker(self):
         self.pt = PathTracer()
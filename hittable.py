@@ -2,12 +2,14 @@ from abc import ABC
 from vec3 import Vec3, Point3, dot
 
 class HitRecord:
-    def __init__(self):
-        self.point = None
+    __slots__ = ('point', 'normal', 't', 'front_face', 'material')
+
+    def __init__(self, t=None, point=None, material=None):
+        self.point = point
         self.normal = None
-        self.t = None
+        self.t = t
         self.front_face = None
-        self.material = None
+        self.material = material
     
     def set_face_normal(self, ray, outward_normal):
         if dot(ray.direction, outward_normal) > 0:
@@ -18,8 +20,11 @@ class HitRecord:
             self.normal = outward_normal
 
 class Hittable(ABC):
-    def __init__(self):
-        self.rec = HitRecord()
+    # hit returns a new HitRecord for the closest hit in (t_min, t_max), or
+    # None; nothing is stored on the object, so one scene can serve many
+    # threads at once
+    def hit(self, ray, t_min, t_max):
+        pass
 
-    def hit(ray, t_min, t_max, hit_record):
+    def bounding_box(self):
         pass
@@ -1,5 +1,13 @@
 from hittable import Hittable, HitRecord
 from copy import deepcopy
+import numpy as np
+from aabb import surrounding_box
+from compiled_scene import compile_scene
+import instrumentation
+try:
+    import cython
+except ImportError:
+    import cython_shim as cython
 
 class HittableList(Hittable):
     def __init__(self):
@@ -11,14 +19,34 @@ class HittableList(Hittable):
     def clear(self):
         self.objects = []
     
-    def hit(self, ray, t_min, t_max):
-        hit_anything = False
-        closest_so_far = t_max
+    def compile(self, accelerate=None):
+        return compile_scene(self.objects, accelerate)
+
+    def bounding_box(self):
+        box = None
         for obj in self.objects:
-            if obj.hit(ray, t_min, closest_so_far):
-                hit_anything = True
-                closest_so_far = obj.rec.t
-                self.rec = obj.rec
-        return hit_anything
+            obj_box = obj.bounding_box()
+            box = obj_box if box is None else surrounding_box(box, obj_box)
+        return box
 
+    def hit(self, ray, t_min: cython.double, t_max: cython.double):
+        if instrumentation.stats is not None:
+            instrumentation.stats.count('scene_queries')
+        closest = None
+        closest_so_far: cython.double = t_max
+        for obj in self.objects:
+            rec = obj.hit(ray, t_min, closest_so_far)
+            if rec is not None:
+                closest = rec
+                closest_so_far = rec.t
+        return closest
 
+    def hit_batch(self, origins, directions, t_min, t_max):
+        closest_so_far = np.full(len(origins), t_max, dtype=np.float64)
+        hit_idx = np.full(len(origins), -1, dtype=np.int64)
+        for k, obj in enumerate(self.objects):
+            t = obj.hit_batch(origins, directions, t_min, closest_so_far)
+            hit = t < closest_so_far
+            closest_so_far[hit] = t[hit]
+            hit_idx[hit] = k
+        return hit_idx, closest_so_far
@@ -0,0 +1,110 @@
+import unittest
+import numpy as np
+from vec3 import Vec3, Point3, Color
+from ray import Ray
+from sphere import Sphere
+from hittable_list import HittableList
+from material import Lambertian, Metal, Dielectric
+from bvh import BVHNode
+import instrumentation
+
+class TestCompiledScene(unittest.TestCase):
+
+    def setUp(self):
+        self.world = HittableList()
+        self.world.add(Sphere(Point3([0, -100.5, -1]), 100, Lambertian(Color([0.8, 0.8, 0.0]))))
+        self.world.add(Sphere(Point3([0, 0, -1]), 0.5, Lambertian(Color([0.1, 0.2, 0.5]))))
+        self.world.add(Sphere(Point3([-1, 0, -1]), 0.5, Dielectric(1.5)))
+        self.world.add(Sphere(Point3([1, 0, -1]), 0.5, Metal(Color([0.8, 0.6, 0.2]), 0.3)))
+        self.scene = self.world.compile()
+
+    def test_material_arrays(self):
+        self.assertEqual(list(self.scene.material_kind), [0, 0, 2, 1])
+        self.assertTrue(np.allclose(self.scene.fuzz, [0, 0, 0, 0.3]))
+        self.assertTrue(np.allclose(self.scene.ri[2], 1.5))
+
+    def test_single_ray(self):
+        idx, t = self.scene.closest_hit(np.array([0.0, 0.0, 0.0]), np.array([0.0, 0.0, -1.0]))
+        self.assertEqual(idx, 1)
+        self.assertTrue(np.isclose(t, 0.5))
+
+    def test_miss(self):
+        idx, t = self.scene.closest_hit(np.array([0.0, 0.0, 0.0]), np.array([0.0, 1.0, 0.0]))
+        self.assertEqual(idx, -1)
+        self.assertEqual(t, np.inf)
+
+    def test_matches_hittable_list(self):
+        rng = np.random.default_rng(1)
+        origins = rng.uniform(-0.2, 0.2, size=(200, 3))
+        directions = rng.normal(size=(200, 3))
+        hit_idx, t = self.scene.closest_hit(origins, directions)
+        for k in range(len(origins)):
+            ray = Ray(Vec3(origins[k]), Vec3(directions[k]))
+            rec = self.world.hit(ray, 0.001, np.inf)
+            if rec is not None:
+                self.assertIs(rec.material, self.scene.materials[self.scene.material_id[hit_idx[k]]])
+                self.assertTrue(np.isclose(rec.t, t[k], rtol=1e-4))
+            else:
+                self.assertEqual(hit_idx[k], -1)
+
+    def test_scatter_by_kind_matches_instances(self):
+        rng = np.random.default_rng(2)
+        hit_idx = rng.integers(0, 4, size=50)
+        directions = rng.normal(size=(50, 3))
+        normals = rng.normal(size=(50, 3))
+        normals /= np.linalg.norm(normals, axis=1)[:, None]
+        front_face = rng.random(50) < 0.5
+        uniforms = rng.random((50, 4))
+        scattered, attenuation, valid = self.scene.scatter(hit_idx, directions, normals, front_face, uniforms)
+        self.assertTrue(np.allclose(attenuation, self.scene.albedo[hit_idx]))
+        for k in range(50):
+            mat = self.world.objects[hit_idx[k]].material
+            expected, ok = mat.scatter_batch(directions[k:k + 1], normals[k:k + 1], front_face[k:k + 1], uniforms[k:k + 1])
+            self.assertTrue(np.allclose(scattered[k], expected[0]))
+            self.assertEqual(valid[k], ok[0])
+
+    def test_instrumentation_counts_tests(self):
+        ray = Ray(Point3([0, 0, 0]), Vec3([0.0, 0.0, -1.0]))
+        stats = instrumentation.enable()
+        try:
+            self.world.hit(ray, 0.001, np.inf)
+            self.scene.closest_hit(np.zeros((10, 3)), np.tile([0.0, 0.0, -1.0], (10, 1)))
+        finally:
+            instrumentation.disable()
+        self.assertEqual(stats.counters['scene_queries'], 1)
+        self.assertEqual(stats.counters['sphere_tests'], 4 + 40)
+
+class TestBVH(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.world = HittableList()
+        material = Lambertian(Color([0.5, 0.5, 0.5]))
+        for center in rng.uniform(-5, 5, size=(300, 3)):
+            self.world.add(Sphere(Point3(center), 0.3, material))
+        self.origins = rng.uniform(-1, 1, size=(500, 3))
+        self.directions = rng.normal(size=(500, 3))
+
+    def test_flat_bvh_matches_brute_force(self):
+        brute_idx, brute_t = self.world.compile(accelerate=False).closest_hit(self.origins, self.directions)
+        scene = self.world.compile(accelerate=True)
+        # packet traversal at this depth, then per-ray walks forced
+        for per_ray_depth in (scene.per_ray_depth, 0):
+            scene.per_ray_depth = per_ray_depth
+            bvh_idx, bvh_t = scene.closest_hit(self.origins, self.directions)
+            self.assertTrue(np.array_equal(brute_idx, bvh_idx))
+            self.assertTrue(np.allclose(brute_t, bvh_t))
+
+    def test_bvh_node_matches_hittable_list(self):
+        bvh = BVHNode(self.world.objects)
+        for k in range(100):
+            ray = Ray(Vec3(self.origins[k]), Vec3(self.directions[k]))
+            rec = self.world.hit(ray, 0.001, np.inf)
+            bvh_rec = bvh.hit(ray, 0.001, np.inf)
+            self.assertEqual(bvh_rec is None, rec is None)
+            if rec is not None:
+                self.assertTrue(np.isclose(bvh_rec.t, rec.t))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import struct
+import zlib
+import numpy as np
+from color import get_colors
+
+IMAGE_FORMATS = ('.ppm', '.png', '.pfm', '.npy')
+# images are encoded a strip of rows at a time, so the temporaries never grow
+# past about this many pixels whatever the resolution
+STRIP_PIXELS = 1 << 18
+IDAT_BYTES = 1 << 20
+
+def to_rgb8(radiance, counts):
+    # framebuffer rows run bottom-up, image files are written top-down
+    return get_colors(radiance, counts)[::-1]
+
+def strips(height, width, top_down=True):
+    rows = max(1, STRIP_PIXELS//max(width, 1))
+    starts = range(0, height, rows)
+    for y0 in (reversed(starts) if top_down else starts):
+        yield y0, min(y0 + rows, height)
+
+def encoded_strips(height, width, encode, release=None, top_down=True):
+    # encode(y0, y1) turns framebuffer rows y0..y1 into file rows;
+    # release(y0, y1), if given, lets a memory-mapped framebuffer drop them
+    for y0, y1 in strips(height, width, top_down):
+        block = encode(y0, y1)
+        yield block[::-1] if top_down else block
+        if release is not None:
+            release(y0, y1)
+
+def write_ppm(path, width, height, rows):
+    with open(path, 'wb') as f:
+        f.write(b'P6\n%d %d\n255\n' % (width, height))
+        for block in rows:
+            f.write(np.ascontiguousarray(block, dtype=np.uint8).tobytes())
+
+def png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+def write_png(path, width, height, rows, level=6):
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    compressor = zlib.compressobj(level)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(png_chunk(b'IHDR', header))
+        pending = b''
+        for block in rows:
+            # each row starts with filter type 0
+            filtered = np.zeros((len(block), 1 + 3*width), dtype=np.uint8)
+            filtered[:, 1:] = block.reshape(len(block), 3*width)
+            pending += compressor.compress(filtered.tobytes())
+            if len(pending) >= IDAT_BYTES:
+                f.write(png_chunk(b'IDAT', pending))
+                pending = b''
+        f.write(png_chunk(b'IDAT', pending + compressor.flush()))
+        f.write(png_chunk(b'IEND', b''))
+
+def write_pfm(path, width, height, rows):
+    # PFM stores float rows bottom-up, which is the framebuffer's own layout
+    with open(path, 'wb') as f:
+        f.write(b'PF\n%d %d\n-1.0\n' % (width, height))
+        for block in rows:
+            f.write(np.ascontiguousarray(block, dtype='<f4').tobytes())
+
+def write_npy(path, values, counts=None, release=None):
+    # values summed over samples are divided by counts first
+    height, width = values.shape[:2]
+    dtype = np.float32 if counts is not None else values.dtype
+
+    def encode(y0, y1):
+        if counts is None:
+            return values[y0:y1]
+        n = np.maximum(counts[y0:y1], 1)
+        return values[y0:y1]/(n[..., None] if values.ndim == 3 else n)
+    with open(path, 'wb') as f:
+        np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                 'fortran_order': False, 'shape': values.shape})
+        for block in encoded_strips(height, width, encode, release):
+            f.write(np.ascontiguousarray(block, dtype=dtype).tobytes())
+
+def save_image(path, radiance, counts, release=None):
+    ext = os.path.splitext(path)[1].lower()
+    height, width = counts.shape
+    if ext in ('.ppm', '.png'):
+        rows = encoded_strips(height, width, lambda y0, y1: get_colors(radiance[y0:y1], counts[y0:y1]), release)
+        (write_ppm if ext == '.ppm' else write_png)(path, width, height, rows)
+    elif ext == '.pfm':
+        rows = encoded_strips(height, width, lambda y0, y1: radiance[y0:y1]/np.maximum(counts[y0:y1], 1)[..., None],
+                              release, top_down=False)
+        write_pfm(path, width, height, rows)
+    elif ext == '.npy':
+        write_npy(path, radiance, counts, release)
+    else:
+        raise ValueError(f'Unsupported image format {ext!r}, expected one of {IMAGE_FORMATS}')
+
+def save_heatmap(path, values, release=None):
+    height, width = values.shape
+    if os.path.splitext(path)[1].lower() == '.npy':
+        write_npy(path, values, release=release)
+        return
+    peak = 0.0
+    for y0, y1 in strips(height, width):
+        peak = max(peak, float(values[y0:y1].max()))
+        if release is not None:
+            release(y0, y1)
+    scale = max(peak, 1e-12)
+
+    def encode(y0, y1):
+        gray = (255*np.clip(values[y0:y1]/scale, 0, 1)).astype(np.uint8)
+        return np.repeat(gray[..., None], 3, axis=2)
+    rows = encoded_strips(height, width, encode, release)
+    if os.path.splitext(path)[1].lower() == '.png':
+        write_png(path, width, height, rows)
+    else:
+        write_ppm(path, width, height, rows)
@@ -0,0 +1,80 @@
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+import numpy as np
+from vec3 import Color
+from color import get_color
+import image_io
+from image_io import to_rgb8, save_image
+
+class TestImageIO(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.radiance = rng.uniform(0, 4, size=(5, 7, 3)).astype(np.float32)
+        self.counts = np.full((5, 7), 4, dtype=np.uint32)
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_matches_scalar_get_color(self):
+        rgb = to_rgb8(self.radiance, self.counts)
+        for j in range(5):
+            for i in range(7):
+                expected = get_color(Color(self.radiance[j, i]), 4)
+                self.assertEqual(tuple(rgb[4 - j, i]), expected)
+
+    def test_ppm(self):
+        path = os.path.join(self.tmpdir.name, 'out.ppm')
+        save_image(path, self.radiance, self.counts)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b'P6\n7 5\n255\n'))
+        pixels = np.frombuffer(data[len(b'P6\n7 5\n255\n'):], dtype=np.uint8).reshape(5, 7, 3)
+        self.assertTrue(np.array_equal(pixels, to_rgb8(self.radiance, self.counts)))
+
+    def test_png(self):
+        path = os.path.join(self.tmpdir.name, 'out.png')
+        save_image(path, self.radiance, self.counts)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        idat = data.index(b'IDAT')
+        length = struct.unpack('>I', data[idat - 4:idat])[0]
+        rows = np.frombuffer(zlib.decompress(data[idat + 4:idat + 4 + length]), dtype=np.uint8).reshape(5, 22)
+        self.assertTrue(np.array_equal(rows[:, 1:].reshape(5, 7, 3), to_rgb8(self.radiance, self.counts)))
+
+    def test_strips(self):
+        # one row per strip and an IDAT chunk per strip
+        path = os.path.join(self.tmpdir.name, 'out.png')
+        strip_pixels, idat_bytes = image_io.STRIP_PIXELS, image_io.IDAT_BYTES
+        image_io.STRIP_PIXELS, image_io.IDAT_BYTES = 1, 1
+        try:
+            save_image(path, self.radiance, self.counts)
+            save_image(path[:-3] + 'npy', self.radiance, self.counts)
+        finally:
+            image_io.STRIP_PIXELS, image_io.IDAT_BYTES = strip_pixels, idat_bytes
+        with open(path, 'rb') as f:
+            data = f.read()
+        stream, chunks, offset = b'', 0, 8
+        while offset < len(data):
+            length, tag = struct.unpack('>I4s', data[offset:offset + 8])
+            if tag == b'IDAT':
+                stream += data[offset + 8:offset + 8 + length]
+                chunks += 1
+            offset += 12 + length
+        self.assertGreater(chunks, 1)
+        rows = np.frombuffer(zlib.decompress(stream), dtype=np.uint8).reshape(5, 22)
+        self.assertTrue(np.array_equal(rows[:, 1:].reshape(5, 7, 3), to_rgb8(self.radiance, self.counts)))
+        self.assertTrue(np.array_equal(np.load(path[:-3] + 'npy'), (self.radiance/4)[::-1]))
+
+    def test_unknown_extension(self):
+        with self.assertRaises(ValueError):
+            save_image(os.path.join(self.tmpdir.name, 'out.bmp'), self.radiance, self.counts)
+
+
+if __name__ == '__main__':
+    unittest.main()
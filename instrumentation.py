@@ -0,0 +1,74 @@
+import time
+import threading
+from collections import defaultdict
+
+# The active RenderStats, or None when instrumentation is off. Hot paths test
+# this module attribute once per call, which is all they pay when disabled.
+stats = None
+
+class RenderStats:
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.hits_by_material = defaultdict(int)
+        self.depth_histogram = defaultdict(int)
+        self.phase_time = defaultdict(float)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def add_time(self, phase, start):
+        self.phase_time[phase] += time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            'counters': dict(self.counters),
+            'hits_by_material': dict(self.hits_by_material),
+            'depth_histogram': {str(k): v for k, v in sorted(self.depth_histogram.items())},
+            'phase_seconds': dict(self.phase_time),
+        }
+
+    def merge(self, summary):
+        for name, n in summary['counters'].items():
+            self.counters[name] += n
+        for name, n in summary['hits_by_material'].items():
+            self.hits_by_material[name] += n
+        for depth, n in summary['depth_histogram'].items():
+            self.depth_histogram[int(depth)] += n
+        for phase, seconds in summary['phase_seconds'].items():
+            self.phase_time[phase] += seconds
+
+class ThreadStats(threading.local):
+    # stands in for RenderStats while render threads share this module: each
+    # thread counts into its own RenderStats, appended to shards for merging
+    def __init__(self, shards):
+        self.shard = RenderStats()
+        shards.append(self.shard)
+
+    def count(self, name, n=1):
+        self.shard.counters[name] += n
+
+    def add_time(self, phase, start):
+        self.shard.add_time(phase, start)
+
+    @property
+    def hits_by_material(self):
+        return self.shard.hits_by_material
+
+    @property
+    def depth_histogram(self):
+        return self.shard.depth_histogram
+
+def enable():
+    global stats
+    stats = RenderStats()
+    return stats
+
+def disable():
+    global stats
+    stats = None
+
+def enable_threads():
+    global stats
+    shards = []
+    stats = ThreadStats(shards)
+    return shards
@@ -1,49 +1,161 @@
 import os
 import sys
+import copy
+import signal
+import argparse
+import json
+import hashlib
 import numpy as np
-import io
 from tqdm import tqdm
 from threading import Thread
-import queue
-from multiprocessing import Manager, Process, JoinableQueue, Lock
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process, Lock, Event, Queue, Array
 import time
+import queue
 
-from color import Color, get_color, write_color
+from color import Color, get_color, get_colors, luminance
 from vec3 import Vec3, Point3, unit_vector, dot, random_in_unit_sphere, random_unit_vector, random_in_hemisphere
 from ray import Ray
 from sphere import Sphere
 from hittable import Hittable, HitRecord
 from hittable_list import HittableList 
+from bvh import BVHNode
+from compiled_scene import CompiledScene, CompositeScene, SCENE_ARRAYS
+from triangle_mesh import TriangleMesh
 from camera import Camera
+import utils
+from utils import rand
+from sampler import Sampler
+from scene_file import load_scene
+from distributed import Coordinator, parse_address, run_workers
+from animation import AnimationRenderer, load_camera_path, turntable
+from render_service import service_address, run_client
+import instrumentation
+from instrumentation import RenderStats
 from material import Lambertian, Metal, Dielectric
+from wavefront import WavefrontRenderer
+from scheduler import TileScheduler, make_tiles, TILE_ORDERS
+from framebuffer import SharedFramebuffer
+from progress import encode_tile_messages, write_messages
+import image_io
+import denoise
+import checkpoint
 
 class PathTracer:
-    def __init__(self, image_width=400, image_height=400, samples_per_pix=2, max_depth=10, workers=1, *args, **kwargs):
+    def __init__(self, image_width=400, image_height=400, samples_per_pix=2, max_depth=10, workers=1, engine='scalar', world='default',
+                 tile_size=16, tile_order='scanline', tile_stats=None, progress='text',
+                 output='image.ppm', samples_per_pass=0, time_limit=None,
+                 adaptive=False, min_samples=4, noise_threshold=0.01, sample_map=None,
+                 stats=None, heatmap=None, seed=0, roulette_threshold=0.1, scene=None, scene_cache='.scene_cache',
+                 scene_data=None, listen=None, mesh=None, backend='process',
+                 denoise=False, aovs=False, framebuffer_file=None, checkpoint=None, checkpoint_interval=300.0,
+                 resume=False, add_samples=0, *args, **kwargs):
         self.image_width = image_width
         self.image_height = image_height
         self.aspect_ratio = self.image_width/float(self.image_height)
         self.samples_per_pix = samples_per_pix
         self.max_depth = max_depth
         self.worker_count = workers
+        self.backend = backend
+        self.engine = engine
+        self.world_name = world
+        self.scene_path = scene
+        self.scene_cache = scene_cache
+        self.scene_file = None
+        self.scene_data = scene_data
+        self.listen = listen
+        self.mesh_paths = mesh or []
+        self.coordinator = None
+        self.tile_size = tile_size
+        self.tile_order = tile_order
+        self.tile_stats_path = tile_stats
+        self.progress = progress
+        self.output = output
+        self.samples_per_pass = samples_per_pass or (min_samples if adaptive else samples_per_pix)
+        self.time_limit = time_limit
+        self.pass_index = 0
+        self.stop_event = Event()
+        self.adaptive = adaptive
+        self.min_samples = min(min_samples, samples_per_pix)
+        self.noise_threshold = noise_threshold
+        self.sample_map = sample_map
+        self.stats_path = stats
+        self.heatmap = heatmap
+        self.instrument = bool(stats or heatmap)
+        self.denoise = denoise
+        self.aovs = aovs
+        self.denoised = None
+        self.framebuffer_file = framebuffer_file
+        self.checkpoint_path = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume or bool(add_samples)
+        self.add_samples = add_samples
+        self.samples_done = 0
+        self.converged = False
+        self.pass_target = samples_per_pix
+        self.accumulate_lock = Lock()
+        # held by a checkpoint while it writes, so a pass cannot end under it
+        self.checkpoint_lock = Lock()
+        self.sampler = Sampler(seed)
+        self.roulette_threshold = roulette_threshold
+        self.paths = self.segments = self.roulette_terminations = 0
+        self.path_counts = Array('q', 3)
+        self.log_stream = sys.stderr if progress == 'binary' else sys.stdout
         self.print_lock = Lock()
         for name, val in kwargs.items():
             attr = getattr(name)
             setattr(name, val)
 
-    def ray_color(self, ray, depth):
-        if depth <= 0:
-            return Color([0, 0, 0])
-
-        if self.world.hit(ray, 0.001, np.inf):
-            scattered = Ray()
-            did_scatter, scattered = self.world.rec.material.scatter(ray, self.world.rec)
-            if did_scatter:
-                atten = self.world.rec.material.albedo
-                return atten * self.ray_color(scattered, depth - 1)
-            return Color([0, 0, 0]) 
-        unit_dir = unit_vector(ray.direction)
-        t = 0.5*(unit_dir.y + 1.0)
-        return (1.0 - t)*Color([1.0, 1.0, 1.0]) + t*Color([0.5, 0.7, 1.0])
+    def ray_color(self, ray, depth, first_hit=None):
+        # first_hit, if a list, gets the (normal, albedo, distance) of the
+        # camera ray's hit appended for the AOV buffers
+        stats = instrumentation.stats
+        throughput = Color([1.0, 1.0, 1.0])
+        self.paths += 1
+        for bounce in range(depth):
+            self.segments += 1
+            if stats is not None:
+                stats.count('secondary_rays' if bounce else 'primary_rays')
+                stats.depth_histogram[bounce] += 1
+                start = time.perf_counter()
+            rec = self.world.hit(ray, 0.001, np.inf)
+            if stats is not None:
+                stats.add_time('intersect', start)
+
+            if rec is None:
+                unit_dir = unit_vector(ray.direction)
+                t = 0.5*(unit_dir.y + 1.0)
+                sky = (1.0 - t)*Color([1.0, 1.0, 1.0]) + t*Color([0.5, 0.7, 1.0])
+                if first_hit is not None and not bounce:
+                    first_hit.append((np.zeros(3), sky.e, 0.0))
+                return throughput*sky
+
+            material = rec.material
+            if first_hit is not None and not bounce:
+                first_hit.append((rec.normal.e, material.albedo.e, rec.t*ray.direction.length()))
+            if stats is not None:
+                stats.hits_by_material[type(material).__name__] += 1
+                start = time.perf_counter()
+            did_scatter, ray = material.scatter(ray, rec)
+            if stats is not None:
+                stats.add_time('scatter', start)
+            if not did_scatter:
+                return Color([0, 0, 0])
+            throughput = throughput*material.albedo
+
+            # Russian roulette: a dim path survives with probability
+            # proportional to its throughput and is reweighted to stay unbiased
+            peak = max(throughput.x, throughput.y, throughput.z)
+            if peak < self.roulette_threshold:
+                survive = peak/self.roulette_threshold
+                if rand() >= survive:
+                    self.roulette_terminations += 1
+                    return Color([0, 0, 0])
+                throughput = throughput/survive
+
+        if stats is not None:
+            stats.count('max_depth_terminations')
+        return Color([0, 0, 0])
 
     def hit_sphere(self, center, radius, ray):
         co = ray.origin - center
@@ -68,82 +180,573 @@ class PathTracer:
         self.world.add(Sphere(Point3([-1, 0 , -1]), -0.45, material_left))
         self.world.add(Sphere(Point3([1, 0 , -1]), 0.5, material_right))
 
-    def setup_stream(self):
-        self.stream = io.StringIO()
-        self.stream.write("P3\n")
-        self.stream.write(str(self.image_width) + ' ' + str(self.image_height) + '\n')
-        self.stream.write("255\n")
-
-    def setup_camera(self):
-        lookfrom = Point3([-1, 1, 1]) 
-        lookat = Point3([0, 0, -1]) 
-        vup = Vec3([0, 1, 0]) 
-        vfov = 50.0
-        aperture = 2.0
-        dist_to_focus = (lookfrom - lookat).length()
-        self.cam = Camera(lookfrom, lookat, vup, vfov, self.aspect_ratio, aperture, dist_to_focus)
-    
-    def save_image(self):
+    def create_random_world(self):
+        self.world = HittableList()
+        self.world.add(Sphere(Point3([0, -1000, 0]), 1000, Lambertian(Color([0.5, 0.5, 0.5]))))
+        for a in range(-11, 11):
+            for b in range(-11, 11):
+                choose_mat = np.random.rand()
+                center = Point3([a + 0.9*np.random.rand(), 0.2, b + 0.9*np.random.rand()])
+                if (center - Point3([4, 0.2, 0])).length() <= 0.9:
+                    continue
+                if choose_mat < 0.8:
+                    albedo = Color(list(np.random.rand(3)*np.random.rand(3)))
+                    material = Lambertian(albedo)
+                elif choose_mat < 0.95:
+                    albedo = Color(list(0.5 + 0.5*np.random.rand(3)))
+                    material = Metal(albedo, 0.5*np.random.rand())
+                else:
+                    material = Dielectric(1.5)
+                self.world.add(Sphere(center, 0.2, material))
+        self.world.add(Sphere(Point3([0, 1, 0]), 1.0, Dielectric(1.5)))
+        self.world.add(Sphere(Point3([-4, 1, 0]), 1.0, Lambertian(Color([0.4, 0.2, 0.1]))))
+        self.world.add(Sphere(Point3([4, 1, 0]), 1.0, Metal(Color([0.7, 0.6, 0.5]), 0.0)))
 
-        for j in reversed(range(self.image_height)):
-            for i in range(self.image_width):
-                pix_color = self.pixel_colors[(i, j)]
-                write_color(self.stream, pix_color, self.samples_per_pix)
+    def build_world(self):
+        if self.scene_path or self.scene_data:
+            raw = self.scene_data.encode() if self.scene_data else None
+            self.scene_file = load_scene(self.scene_path, self.scene_cache, raw)
+            self.world = self.scene_file.scene if self.engine == 'wavefront' else self.scene_file.world()
+        elif self.world_name == 'random':
+            np.random.seed(0)
+            self.create_random_world()
+        else:
+            self.create_world()
+        meshes = [TriangleMesh.from_obj(path, Lambertian(Color([0.6, 0.6, 0.6]))) for path in self.mesh_paths]
+        if meshes and isinstance(self.world, CompiledScene):
+            self.world = CompositeScene([self.world] + meshes)
+        else:
+            for mesh in meshes:
+                self.world.add(mesh)
+        if self.engine == 'scalar' and len(self.world.objects) > CompiledScene.bvh_threshold:
+            self.world = BVHNode(self.world.objects)
 
-        with open('image.ppm', 'w') as f:
-            f.write(self.stream.getvalue())
+    def camera_params(self):
+        if self.scene_file is not None:
+            return self.scene_file.camera
+        if self.world_name == 'random':
+            return {'lookfrom': [13, 2, 3], 'lookat': [0, 0, 0], 'vup': [0, 1, 0], 'vfov': 20.0,
+                    'aperture': 0.1, 'focus_dist': 10.0}
+        return {'lookfrom': [-1, 1, 1], 'lookat': [0, 0, -1], 'vup': [0, 1, 0], 'vfov': 50.0,
+                'aperture': 2.0, 'focus_dist': float(np.sqrt(6.0))}
+
+    def setup_camera(self, params=None):
+        params = params or self.camera_params()
+        self.cam = Camera(Point3(params['lookfrom']), Point3(params['lookat']), Vec3(params['vup']),
+                          params['vfov'], self.aspect_ratio, params['aperture'], params['focus_dist'])
+    
+    def save_image(self):
+        if self.denoised is not None:
+            image_io.save_image(self.output, self.denoised, np.ones(self.denoised.shape[:2]))
+        else:
+            image_io.save_image(self.output, self.framebuffer.radiance, self.framebuffer.counts,
+                                self.framebuffer.release)
+        if self.sample_map:
+            image_io.save_heatmap(self.sample_map, self.framebuffer.counts, self.framebuffer.release)
 
     def print_progress(self):
         pass
 
-    def worker(self):
-        while True:
-            try:
-                i, j = self.task_queue.get(0.5)
-            except queue.Empty:
+    def render_tile(self, tile, samples, mask, first_sample, aovs=None):
+        if self.engine == 'wavefront':
+            return self.wavefront.render_tile(tile.x0, tile.y0, tile.width, tile.height, samples, mask, first_sample,
+                                              aovs)
+        radiance = np.zeros((tile.height, tile.width, 3))
+        luminance_sq = np.zeros((tile.height, tile.width))
+        first_hit = [] if aovs is not None else None
+        if aovs is not None:
+            aovs.update(normal=np.zeros((tile.height, tile.width, 3)), albedo=np.zeros((tile.height, tile.width, 3)),
+                        depth=np.zeros((tile.height, tile.width)))
+        jj, ii = np.nonzero(mask)
+        pixel = np.repeat((jj + tile.y0)*self.image_width + ii + tile.x0, samples)
+        sample_index = np.repeat(first_sample[mask], samples) + np.tile(np.arange(samples), len(ii))
+        streams = iter(self.sampler.streams(pixel, sample_index))
+        for j in range(tile.y0, tile.y0 + tile.height):
+            for i in range(tile.x0, tile.x0 + tile.width):
+                if not mask[j - tile.y0, i - tile.x0]:
+                    continue
+                if self.instrument:
+                    pixel_start = time.perf_counter()
+                pix_color = Color([0, 0, 0])
+                for s in range(samples):
+                    utils.set_stream(next(streams))
+                    u = (i + rand())/(self.image_width - 1)
+                    v = (j + rand())/(self.image_height - 1)
+                    if self.instrument:
+                        start = time.perf_counter()
+                        r = self.cam.get_ray(u, v)
+                        instrumentation.stats.add_time('camera', start)
+                    else:
+                        r = self.cam.get_ray(u, v)
+                    sample_color = self.ray_color(r, self.max_depth, first_hit)
+                    pix_color += sample_color
+                    luminance_sq[j - tile.y0, i - tile.x0] += luminance(sample_color.e)**2
+                if first_hit:
+                    for aov, values in zip(('normal', 'albedo', 'depth'), zip(*first_hit)):
+                        aovs[aov][j - tile.y0, i - tile.x0] = np.sum(values, axis=0)
+                    first_hit.clear()
+                radiance[j - tile.y0, i - tile.x0] = pix_color.e
+                if self.instrument:
+                    self.framebuffer.cost[j, i] += time.perf_counter() - pixel_start
+        utils.reset_stream()
+        return radiance, luminance_sq
+
+    def worker(self, worker_id, samples):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if self.instrument:
+            instrumentation.enable()
+        try:
+            self.render_tiles(worker_id, samples)
+        finally:
+            self.add_path_counts()
+            if self.instrument:
+                self.stats_queue.put(instrumentation.stats.as_dict())
+
+    def thread_worker(self, worker_id, samples):
+        # a shallow copy shares the scene, camera, scheduler and framebuffer
+        # and gives this thread its own path counters
+        tracer = copy.copy(self)
+        tracer.paths = tracer.segments = tracer.roulette_terminations = 0
+        if self.engine == 'wavefront':
+            tracer.wavefront = copy.copy(self.wavefront)
+            tracer.wavefront.paths = tracer.wavefront.segments = tracer.wavefront.roulette_terminations = 0
+        try:
+            tracer.render_tiles(worker_id, samples)
+        finally:
+            tracer.add_path_counts()
+
+    def add_path_counts(self):
+        source = self.wavefront if self.engine == 'wavefront' else self
+        with self.path_counts.get_lock():
+            self.path_counts[0] += source.paths
+            self.path_counts[1] += source.segments
+            self.path_counts[2] += source.roulette_terminations
+
+    def render_tiles(self, worker_id, samples):
+        while not self.stop_event.is_set():
+            tile = self.scheduler.next_tile(worker_id)
+            if tile is None:
                 return
-            np.random.seed(j*i + 2*i + j)
-            pix_color = Color([0, 0, 0])
-            for s in range(self.samples_per_pix):
-                u = (i + np.random.rand())/(self.image_width - 1)
-                v = (j + np.random.rand())/(self.image_height - 1)
-                r = self.cam.get_ray(u, v)
-                pix_color += self.ray_color(r, self.max_depth)
-            self.pixel_colors[(i, j)] = pix_color
-            self.task_queue.task_done()
-            rgb_color = get_color(pix_color, self.samples_per_pix)
+            start = time.perf_counter()
+            region = (slice(tile.y0, tile.y0 + tile.height), slice(tile.x0, tile.x0 + tile.width))
+            mask = self.tile_mask(tile)
+            # samples already taken give each pixel its next sample index
+            first_sample = self.framebuffer.counts[region].astype(np.int64)
+            aovs = {} if self.framebuffer.aovs else None
+            radiance, luminance_sq = self.render_tile(tile, samples, mask, first_sample, aovs)
+            elapsed = time.perf_counter() - start
+            self.scheduler.tile_done(tile, worker_id, elapsed)
+            if self.instrument and self.engine == 'wavefront' and mask.any():
+                region = self.framebuffer.cost[tile.y0:tile.y0 + tile.height, tile.x0:tile.x0 + tile.width]
+                region[mask] += elapsed/mask.sum()
+            with self.accumulate_lock:
+                self.framebuffer.accumulate(tile.x0, tile.y0, radiance, luminance_sq, samples*mask, aovs)
+            self.publish_tile(tile)
+            self.framebuffer.release(tile.y0, tile.y0 + tile.height)
+
+    def tile_mask(self, tile):
+        # active pixels still short of this pass's samples; only a resumed
+        # pass finds some of them already done
+        region = (slice(tile.y0, tile.y0 + tile.height), slice(tile.x0, tile.x0 + tile.width))
+        return self.framebuffer.active[region] & (self.framebuffer.counts[region] < self.pass_target)
+
+    def publish_tile(self, tile):
+        region = (slice(tile.y0, tile.y0 + tile.height), slice(tile.x0, tile.x0 + tile.width))
+        radiance, counts = self.framebuffer.radiance[region], self.framebuffer.counts[region]
+        if self.progress == 'binary':
+            messages = encode_tile_messages(tile.x0, tile.y0, get_colors(radiance, counts), self.image_height)
+            write_messages(sys.stdout.fileno(), messages)
+        elif self.progress == 'text':
+            lines = []
+            for dj in range(tile.height):
+                for di in range(tile.width):
+                    i, j = tile.x0 + di, tile.y0 + dj
+                    rgb_color = get_color(Color(radiance[dj, di]), max(1, counts[dj, di]))
+                    lines.append(f'x:{i}\ny:{j}\nr:{rgb_color[0]}\ng:{rgb_color[1]}\nb:{rgb_color[2]}')
             with self.print_lock:
-                print(f'x:{i}')
-                print(f'y:{j}')
-                print(f'r:{rgb_color[0]}')
-                print(f'g:{rgb_color[1]}')
-                print(f'b:{rgb_color[2]}')
+                print('\n'.join(lines), flush=True)
+
+    def render_pass(self, samples):
+        tiles = make_tiles(self.image_width, self.image_height, self.tile_size, self.tile_order)
+        tiles = self.framebuffer.active_tiles(tiles, self.pass_target)
+        tiles = [tile._replace(index=k) for k, tile in enumerate(tiles)]
+        if self.coordinator is not None:
+            self.coordinator.render_pass(tiles, samples)
+            return
+        self.scheduler = TileScheduler(tiles, self.worker_count)
+        if self.backend == 'thread':
+            self.render_threads(samples)
+        else:
+            self.render_processes(samples)
+        self.report_tile_stats()
+
+    def render_threads(self, samples):
+        # NumPy drops the GIL inside the wavefront kernels, and on a
+        # free-threaded build the scalar tracer runs in parallel as well
+        shards = instrumentation.enable_threads() if self.instrument else []
+        try:
+            with ThreadPoolExecutor(self.worker_count) as pool:
+                futures = [pool.submit(self.thread_worker, k, samples) for k in range(self.worker_count)]
+                for future in futures:
+                    future.result()
+        finally:
+            if self.instrument:
+                instrumentation.disable()
+            for shard in shards:
+                self.stats.merge(shard.as_dict())
+
+    def render_processes(self, samples):
+        self.stats_queue = Queue() if self.instrument else None
+        workers = [Process(target=self.worker, args=(k, samples), daemon=True) for k in range(self.worker_count)]
+        for w in workers:
+            w.start()
+        if self.instrument:
+            # drained before the join: a worker cannot exit while its queue
+            # still holds unflushed data. One that dies without reporting is
+            # noticed once no worker is left alive and the pipe is empty.
+            reported = 0
+            while reported < len(workers):
+                finished = not any(w.is_alive() for w in workers)
+                try:
+                    self.stats.merge(self.stats_queue.get(timeout=0.1))
+                    reported += 1
+                except queue.Empty:
+                    if finished:
+                        break
+        for w in workers:
+            w.join()
+        failed = [w.exitcode for w in workers if w.exitcode != 0]
+        if failed and not self.stop_event.is_set():
+            raise RuntimeError(f'{len(failed)} render worker(s) failed with exit codes {failed}')
+
+    def request_stop(self, signum=None, frame=None):
+        self.stop_event.set()
+
+    def prepare_renderer(self):
+        if self.engine == 'wavefront':
+            self.wavefront = WavefrontRenderer(self.world, self.cam, self.image_width, self.image_height, self.max_depth,
+                                               self.sampler, self.roulette_threshold)
+
+    def worker_config(self):
+        # what a remote tile worker needs to build the same renderer
+        config = {'image_width': self.image_width, 'image_height': self.image_height,
+                  'samples_per_pix': self.samples_per_pix, 'max_depth': self.max_depth, 'engine': self.engine,
+                  'world': self.world_name, 'seed': self.sampler.seed, 'roulette_threshold': self.roulette_threshold,
+                  'scene_cache': self.scene_cache, 'mesh': [os.path.abspath(path) for path in self.mesh_paths]}
+        if self.scene_path:
+            with open(self.scene_path) as f:
+                config['scene_data'] = f.read()
+        return config
 
     def render(self):
-        self.task_queue = JoinableQueue()
-        self.pixel_colors = Manager().dict()
-        for i in range(self.image_height):
-            for j in range(self.image_width):
-                self.pixel_colors[(i, j)] = 0
-                self.task_queue.put((j, i))
-        self.workers = [Process(target=(self.worker), daemon=True).start() for i in range(self.worker_count)]
-        self.task_queue.join()
+        self.prepare_renderer()
+        start = time.perf_counter()
+        done = self.samples_done
+        while done < self.samples_per_pix and not self.converged and not self.stop_event.is_set():
+            if self.adaptive:
+                samples = self.min_samples if done == 0 else min(self.samples_per_pass, self.samples_per_pix - done)
+            else:
+                samples = min(self.samples_per_pass, self.samples_per_pix - done)
+            pass_start = time.perf_counter()
+            self.pass_target = done + samples
+            self.render_pass(samples)
+            if self.stop_event.is_set():
+                break
+            # waits for a checkpoint being written, so every pixel it saves
+            # is within the pass its state records
+            with self.checkpoint_lock, self.accumulate_lock:
+                done += samples
+                self.samples_done = done
+                self.pass_index += 1
+                if self.adaptive:
+                    active = self.framebuffer.update_active(self.noise_threshold, self.samples_per_pix)
+                    self.converged = not active
+            if self.checkpoint_path:
+                self.save_checkpoint()
+            if self.adaptive:
+                print(f'Pass {self.pass_index}: {active} pixels above noise threshold', file=self.log_stream)
+                if not active:
+                    break
+            if done < self.samples_per_pix:
+                print(f'Pass {self.pass_index}: {done}/{self.samples_per_pix} samples per pixel', file=self.log_stream)
+                self.save_image()
+            if self.time_limit is not None:
+                elapsed = time.perf_counter() - start
+                if elapsed + (time.perf_counter() - pass_start) > self.time_limit:
+                    print(f'Stopping after {done} samples per pixel, time limit reached', file=self.log_stream)
+                    break
 
-    def run(self):
+    def checkpoint_config(self):
+        config = {name: getattr(self, name) for name in checkpoint.IMAGE_FIELDS + checkpoint.SCHEDULE_FIELDS
+                  if name != 'seed'}
+        config['seed'] = self.sampler.seed
+        return config
+
+    def scene_hash(self):
+        # geometry, materials and camera, so a checkpoint never resumes into
+        # a different scene
+        digest = hashlib.sha256(json.dumps(self.camera_params(), sort_keys=True).encode())
+        scene = self.world.compile() if hasattr(self.world, 'compile') else self.world
+        for part in getattr(scene, 'parts', [scene]):
+            if isinstance(part, TriangleMesh):
+                arrays = [part.vertices, part.faces, part.hit_materials(np.zeros(1, dtype=np.int64))[1]]
+            else:
+                arrays = [getattr(part, name) for name in SCENE_ARRAYS]
+            for values in arrays:
+                digest.update(np.ascontiguousarray(values).tobytes())
+        return digest.hexdigest()
+
+    def save_checkpoint(self):
+        with self.checkpoint_lock:
+            state = {'config': self.checkpoint_config(), 'scene_hash': self.scene_digest,
+                     'sampler_key': self.sampler.key.tolist(), 'samples_done': self.samples_done,
+                     'pass_index': self.pass_index, 'converged': self.converged}
+            checkpoint.save_checkpoint(self.checkpoint_path, self.framebuffer, state, self.accumulate_lock)
+
+    def checkpoint_loop(self, stop):
+        while not stop.wait(self.checkpoint_interval):
+            self.save_checkpoint()
 
-        self.create_world()
+    def restore_checkpoint(self):
+        # The sample streams are keyed by seed, pixel and sample index, so
+        # the saved per-pixel counts are the whole random number state: each
+        # pixel carries on with the samples an uninterrupted render would take
+        state = checkpoint.load_state(self.checkpoint_path)
+        checkpoint.check_compatible(self.checkpoint_path, state, self.checkpoint_config(), self.scene_digest,
+                                    checkpoint.BUFFERS + self.framebuffer.aov_names())
+        for name in checkpoint.SCHEDULE_FIELDS:
+            setattr(self, name, state['config'][name])
+        checkpoint.restore_buffers(self.checkpoint_path, state, self.framebuffer)
+        self.samples_done = state['samples_done']
+        self.pass_index = state['pass_index']
+        self.converged = state['converged']
+        if self.add_samples:
+            if self.adaptive:
+                # pixels that stopped at the old budget rather than by converging
+                for y0, y1 in self.framebuffer.strips():
+                    self.framebuffer.active[y0:y1] |= self.framebuffer.counts[y0:y1] >= self.samples_per_pix
+            self.samples_per_pix += self.add_samples
+            self.converged = False
+        print(f'Resuming {self.checkpoint_path}: {self.samples_done}/{self.samples_per_pix} samples per pixel',
+              file=self.log_stream)
+
+    def report_tile_stats(self):
+        self.tile_stats = self.scheduler.stats()
+        busy = ', '.join(f'{t:.2f}s' for t in self.tile_stats['worker_busy'])
+        print(f'{len(self.tile_stats["tiles"])} tiles, worker busy time [{busy}], '
+              f'steals {self.tile_stats["worker_steals"]}, imbalance {self.tile_stats["imbalance"]:.2f}',
+              file=sys.stderr)
+        if self.tile_stats_path:
+            with open(self.tile_stats_path, 'w') as f:
+                json.dump(self.tile_stats, f, indent=2)
+
+    def save_stats(self):
+        summary = self.stats.as_dict()
+        rays = sum(summary['counters'].get(name, 0) for name in ('primary_rays', 'secondary_rays'))
+        summary['wall_seconds'] = self.wall_time
+        summary['rays_per_sec'] = rays/max(self.wall_time['render'], 1e-9)
+        summary['samples'] = self.framebuffer.total_samples()
+        paths, segments, terminations = self.path_counts[:]
+        summary['paths'] = {'count': paths, 'average_length': segments/max(paths, 1),
+                            'roulette_terminations': terminations}
+        print(f'{rays} rays in {self.wall_time["render"]:.2f}s ({summary["rays_per_sec"]:.0f} rays/s)',
+              file=self.log_stream)
+        if self.stats_path:
+            with open(self.stats_path, 'w') as f:
+                json.dump(summary, f, indent=2)
+        if self.heatmap:
+            image_io.save_heatmap(self.heatmap, self.framebuffer.cost, self.framebuffer.release)
+
+    def save_aovs(self):
+        stem = os.path.splitext(self.output)[0]
+        for aov in self.framebuffer.aov_names():
+            image_io.write_npy(f'{stem}_{aov}.npy', getattr(self.framebuffer, aov), self.framebuffer.counts,
+                               self.framebuffer.release)
+
+    def run(self):
+        self.stats = RenderStats()
+        self.wall_time = {}
+        start = time.perf_counter()
+        self.build_world()
         self.setup_camera()
-        self.setup_stream()
-        print('Rendering ...')
-        self.render()
-        print('Done')
-        self.save_image()
+        self.scene_digest = self.scene_hash() if self.checkpoint_path else None
+        self.wall_time['build'] = time.perf_counter() - start
+        if self.resume and not self.checkpoint_path:
+            raise ValueError('--resume and --add-samples need --checkpoint')
+        if self.denoise and self.framebuffer_file:
+            raise ValueError('--denoise filters the whole image in memory and cannot use --framebuffer-file')
+        self.framebuffer = SharedFramebuffer(self.image_width, self.image_height, aovs=self.denoise or self.aovs,
+                                             path=self.framebuffer_file)
+        self.denoised = None
+        previous_handlers = [signal.signal(sig, self.request_stop) for sig in (signal.SIGINT, signal.SIGTERM)]
+        try:
+            if self.resume:
+                self.restore_checkpoint()
+            if self.listen:
+                self.coordinator = Coordinator(parse_address(self.listen), self)
+                host, port = self.coordinator.address[:2]
+                print(f'Waiting for workers on {host}:{port}', file=self.log_stream, flush=True)
+            print('Rendering ...', file=self.log_stream)
+            start = time.perf_counter()
+            stop_checkpoints = Event()
+            checkpointer = Thread(target=self.checkpoint_loop, args=(stop_checkpoints,), daemon=True)
+            if self.checkpoint_path:
+                checkpointer.start()
+            try:
+                self.render()
+            finally:
+                stop_checkpoints.set()
+                if checkpointer.is_alive():
+                    checkpointer.join()
+            if self.checkpoint_path:
+                # also after an interrupt, which keeps every finished tile
+                self.save_checkpoint()
+            self.wall_time['render'] = time.perf_counter() - start
+            print('Done', file=self.log_stream)
+            if self.coordinator is not None:
+                self.coordinator.report()
+            paths, segments, terminations = self.path_counts[:]
+            print(f'Average path length {segments/max(paths, 1):.2f} segments, '
+                  f'{terminations} of {paths} paths ended by Russian roulette', file=self.log_stream)
+            if self.adaptive:
+                total = self.framebuffer.total_samples()
+                uniform = self.samples_per_pix*self.image_width*self.image_height
+                print(f'Adaptive sampling used {total} of {uniform} samples ({uniform/max(total, 1):.2f}x fewer)',
+                      file=self.log_stream)
+            if self.denoise:
+                start = time.perf_counter()
+                self.denoised = denoise.denoise(self.framebuffer)
+                self.wall_time['denoise'] = time.perf_counter() - start
+                print(f'Denoised in {self.wall_time["denoise"]:.2f}s', file=self.log_stream)
+            start = time.perf_counter()
+            self.save_image()
+            if self.aovs:
+                self.save_aovs()
+            self.wall_time['save'] = time.perf_counter() - start
+            if self.instrument:
+                self.save_stats()
+        finally:
+            if self.coordinator is not None:
+                self.coordinator.close()
+            signal.signal(signal.SIGINT, previous_handlers[0])
+            signal.signal(signal.SIGTERM, previous_handlers[1])
+            self.framebuffer.close()
+
+# options that only a local, single-image render honours: the animation
+# frame loop and a render service job both render every tile in one uniform
+# pass into shared memory, so these would be silently ignored
+ANIMATION_UNSUPPORTED = ('--adaptive', '--samples-per-pass', '--time-limit', '--denoise', '--aovs', '--sample-map',
+                         '--stats', '--heatmap', '--tile-stats', '--backend', '--checkpoint', '--resume',
+                         '--add-samples', '--framebuffer-file', '--listen', '--submit')
+# the service also picks its own tile size and order
+SUBMIT_UNSUPPORTED = ANIMATION_UNSUPPORTED[:-1] + ('--tile-size', '--tile-order')
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('image_width', type=int, nargs='?', default=400)
+    parser.add_argument('image_height', type=int, nargs='?', default=400)
+    parser.add_argument('samples_per_pix', type=int, nargs='?', default=2)
+    parser.add_argument('max_depth', type=int, nargs='?', default=10)
+    parser.add_argument('workers', type=int, nargs='?', default=1)
+    parser.add_argument('--engine', choices=['scalar', 'wavefront'], default='scalar')
+    parser.add_argument('--backend', choices=['process', 'thread'], default='process',
+                        help='run the workers as processes, or as threads sharing one scene')
+    parser.add_argument('--world', choices=['default', 'random'], default='default')
+    parser.add_argument('--scene', metavar='PATH', help='render a JSON scene file instead of a built-in world')
+    parser.add_argument('--mesh', action='append', metavar='PATH',
+                        help='add a Wavefront OBJ triangle mesh to the world (repeatable)')
+    parser.add_argument('--scene-cache', default='.scene_cache', metavar='DIR',
+                        help='directory for compiled scene caches (default .scene_cache)')
+    parser.add_argument('--tile-size', type=int, default=16)
+    parser.add_argument('--tile-order', choices=TILE_ORDERS, default='scanline')
+    parser.add_argument('--tile-stats', help='write per-tile render timings to this JSON file')
+    parser.add_argument('--output', default='image.ppm',
+                        help='output image, format chosen by extension: ' + ', '.join(image_io.IMAGE_FORMATS))
+    parser.add_argument('--framebuffer-file', metavar='PATH',
+                        help='accumulate into a memory-mapped file at PATH instead of shared memory, for images too '
+                             'large to hold in RAM; workers only touch their tiles and the output is written in strips')
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help='save the accumulated samples to this .npz file after every pass, every '
+                             '--checkpoint-interval seconds and on exit')
+    parser.add_argument('--checkpoint-interval', type=float, default=300.0, metavar='SECONDS')
+    parser.add_argument('--resume', action='store_true', help='continue the render saved in --checkpoint')
+    parser.add_argument('--add-samples', type=int, default=0, metavar='N',
+                        help='resume a render from --checkpoint and raise its budget by N samples per pixel')
+    parser.add_argument('--samples-per-pass', type=int, default=0,
+                        help='render progressively, adding this many samples per pixel each pass')
+    parser.add_argument('--time-limit', type=float,
+                        help='stop after the last pass that fits in this many seconds')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='keep sampling only pixels whose estimated noise is above --noise-threshold, '
+                             'up to samples_per_pix samples')
+    parser.add_argument('--min-samples', type=int, default=4,
+                        help='samples per pixel of the first adaptive pass')
+    parser.add_argument('--noise-threshold', type=float, default=0.01,
+                        help='a pixel stops being sampled once the standard error of its displayed, gamma-encoded '
+                             'luminance (0-1 scale, so 0.01 is about 2.5 of 255 levels) falls below this')
+    parser.add_argument('--denoise', action='store_true',
+                        help='record first-hit normal, albedo and depth and denoise the image guided by them')
+    parser.add_argument('--aovs', action='store_true',
+                        help='also write the normal, albedo and depth buffers as <output>_<name>.npy')
+    parser.add_argument('--sample-map', help='write the per-pixel sample count map to this image or .npy file')
+    parser.add_argument('--seed', type=int, default=0, help='key for the per-pixel random number streams')
+    parser.add_argument('--roulette-threshold', type=float, default=0.1,
+                        help='paths whose throughput drops below this face Russian roulette (0 disables)')
+    parser.add_argument('--stats', metavar='PATH',
+                        help='count rays and intersection tests, time render phases and write a JSON summary')
+    parser.add_argument('--heatmap', metavar='PATH', help='write per-pixel render time as an image or .npy')
+    parser.add_argument('--camera-path', metavar='PATH',
+                        help='render an animation from a JSON list of cameras or {"frames": N, "keyframes": [...]}; '
+                             'frames are written to numbered copies of --output')
+    parser.add_argument('--frames', type=int,
+                        help='number of frames; without --camera-path, render a turntable orbit of the camera')
+    parser.add_argument('--listen', metavar='HOST:PORT',
+                        help='coordinate a distributed render, serving tiles to workers started with --connect')
+    parser.add_argument('--connect', metavar='HOST:PORT',
+                        help='run as a tile worker for a coordinator; the workers argument sets the process count')
+    parser.add_argument('--node-name', help='name this worker node reports to the coordinator')
+    parser.add_argument('--submit', metavar='ADDRESS',
+                        help='send the render to a running render_service (socket path or HOST:PORT) instead')
+    parser.add_argument('--priority', type=int, default=0, help='service job priority, higher runs first')
+    parser.add_argument('--tag', help='service job tag; submitting replaces unfinished jobs with the same tag')
+    parser.add_argument('--progress', choices=['text', 'binary', 'none'], default='text',
+                        help='per-tile progress stream written to stdout')
+    args = parser.parse_args(argv)
+
+    def given(options):
+        dests = [option[2:].replace('-', '_') for option in options]
+        return [option for option, dest in zip(options, dests) if getattr(args, dest) != parser.get_default(dest)]
+    if args.camera_path or args.frames:
+        ignored = given(ANIMATION_UNSUPPORTED)
+        if ignored:
+            parser.error(f'{", ".join(ignored)} cannot be used with --camera-path or --frames')
+    if args.submit:
+        ignored = given(SUBMIT_UNSUPPORTED)
+        if ignored:
+            parser.error(f'{", ".join(ignored)} cannot be used with --submit')
+    return args
 
 if __name__ == '__main__':
-    args = sys.argv
-    args = [int(arg) for arg in sys.argv[1:]]
-    pt = PathTracer(*args)
-    pt.run()
+    args = parse_args(sys.argv[1:])
+    options = vars(args)
+    connect, node_name = options.pop('connect'), options.pop('node_name')
+    camera_path, frames = options.pop('camera_path'), options.pop('frames')
+    submit, priority, tag = options.pop('submit'), options.pop('priority'), options.pop('tag')
+    if connect:
+        sys.exit(run_workers(parse_address(connect), args.workers, node_name))
+    if submit:
+        sys.exit(run_client(service_address(submit), options, priority, tag))
+    pt = PathTracer(**options)
+    if camera_path or frames:
+        if args.scene:
+            pt.scene_file = load_scene(args.scene, args.scene_cache)
+        base = pt.camera_params()
+        cameras = load_camera_path(camera_path, base) if camera_path else turntable(base, frames)
+        if frames:
+            cameras.frames = frames
+        AnimationRenderer(pt, cameras).run()
+    else:
+        pt.run()
 
 
 
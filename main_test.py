@@ -0,0 +1,79 @@
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+import numpy as np
+from main import PathTracer
+
+class PassRecorder(PathTracer):
+    # keeps a copy of the sample counts after every pass, and can stop the
+    # render after some number of them
+    stop_after = None
+
+    def render_pass(self, samples):
+        super().render_pass(samples)
+        self.passes.append((samples, self.framebuffer.counts.copy()))
+        if len(self.passes) == self.stop_after:
+            self.stop_event.set()
+
+class TestRender(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def render(self, stop_after=None, **options):
+        settings = dict(image_width=16, image_height=12, max_depth=4, engine='wavefront', tile_size=8,
+                        progress='none', output=os.path.join(self.tmp.name, 'image.npy'))
+        settings.update(options)
+        pt = PassRecorder(**settings)
+        pt.passes = []
+        pt.stop_after = stop_after
+        with contextlib.redirect_stdout(io.StringIO()):
+            pt.run()
+        return pt, np.load(settings['output'])
+
+    def test_thread_backend_matches_processes(self):
+        for engine in ('scalar', 'wavefront'):
+            images = [self.render(samples_per_pix=2, workers=2, engine=engine, backend=backend)[1]
+                      for backend in ('process', 'thread')]
+            self.assertTrue(np.array_equal(*images), engine)
+
+    def test_progressive_passes(self):
+        pt, image = self.render(samples_per_pix=7, samples_per_pass=3)
+        self.assertEqual([samples for samples, _ in pt.passes], [3, 3, 1])
+        for done, (_, counts) in zip((3, 6, 7), pt.passes):
+            self.assertTrue((counts == done).all())
+        # the passes take the same samples as a single one, summed in a
+        # different order
+        _, single = self.render(samples_per_pix=7, output=os.path.join(self.tmp.name, 'single.npy'))
+        self.assertTrue(np.allclose(image, single, atol=1e-5))
+
+    def test_stop_and_time_limit_keep_whole_passes(self):
+        sample_map = os.path.join(self.tmp.name, 'counts.npy')
+        for options in ({'stop_after': 1}, {'time_limit': 0.0}):
+            pt, image = self.render(samples_per_pix=8, samples_per_pass=2, sample_map=sample_map, **options)
+            self.assertEqual(len(pt.passes), 1)
+            self.assertTrue((np.load(sample_map) == 2).all())
+            self.assertTrue(np.isfinite(image).all() and image.max() > 0)
+
+    def test_adaptive_first_pass_and_early_exit(self):
+        # every pixel passes a huge threshold after the min_samples pass
+        pt, _ = self.render(samples_per_pix=16, samples_per_pass=4, adaptive=True, min_samples=2,
+                            noise_threshold=1e9)
+        self.assertEqual(len(pt.passes), 1)
+        self.assertEqual(pt.passes[0][0], 2)
+        self.assertTrue((pt.passes[0][1] == 2).all())
+        self.assertTrue(pt.converged)
+        # and none passes a negative one, so all run to samples_per_pix
+        pt, _ = self.render(samples_per_pix=8, samples_per_pass=4, adaptive=True, min_samples=2,
+                            noise_threshold=-1.0)
+        self.assertEqual([samples for samples, _ in pt.passes], [2, 4, 2])
+        self.assertTrue((pt.passes[-1][1] == 8).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
+import math
 import numpy as np
 from hittable import HitRecord
 from abc import ABC
 from vec3 import reflect, refract, unit_vector, random_unit_vector, dot, random_in_unit_sphere, Color
+from vec3 import reflect_batch, refract_batch, unit_vector_batch, random_unit_vector_batch, dot_batch, random_in_unit_sphere_batch
 from ray import Ray
 from utils import rand
 
@@ -10,6 +12,9 @@ class Material(ABC):
         pass
 
 class Lambertian(Material):
+    kind = 0
+    kernel_params = ()
+
     def __init__(self, a):
         self.albedo = a
     
@@ -20,7 +25,22 @@ class Lambertian(Material):
         scattered = Ray(rec.point, scatter_dir)
         return True, scattered
 
+    @staticmethod
+    def scatter_kernel(directions, normals, front_face, uniforms, albedo):
+        scatter_dir = normals + random_unit_vector_batch(len(normals), uniforms)
+        near_zero = np.all(np.abs(scatter_dir) < 1e-8, axis=1)
+        scatter_dir[near_zero] = normals[near_zero]
+        return scatter_dir, albedo, np.ones(len(normals), dtype=bool)
+
+    def scatter_batch(self, directions, normals, front_face, uniforms=None):
+        albedo = np.broadcast_to(self.albedo.e, normals.shape)
+        scatter_dir, _, valid = self.scatter_kernel(directions, normals, front_face, uniforms, albedo)
+        return scatter_dir, valid
+
 class Metal(Material):
+    kind = 1
+    kernel_params = ('fuzz',)
+
     def __init__(self, a, fuzz):
         self.albedo = a
         self.fuzz = min(1, fuzz)
@@ -30,7 +50,22 @@ class Metal(Material):
         scattered = Ray(rec.point, reflected + self.fuzz*random_in_unit_sphere())
         return dot(scattered.direction, rec.normal) > 0, scattered
 
+    @staticmethod
+    def scatter_kernel(directions, normals, front_face, uniforms, albedo, fuzz):
+        reflected = reflect_batch(unit_vector_batch(directions), normals)
+        scattered = reflected + fuzz[:, None]*random_in_unit_sphere_batch(len(normals), uniforms)
+        return scattered, albedo, dot_batch(scattered, normals) > 0
+
+    def scatter_batch(self, directions, normals, front_face, uniforms=None):
+        albedo = np.broadcast_to(self.albedo.e, normals.shape)
+        scattered, _, valid = self.scatter_kernel(directions, normals, front_face, uniforms, albedo,
+                                                  np.full(len(normals), self.fuzz))
+        return scattered, valid
+
 class Dielectric(Material):
+    kind = 2
+    kernel_params = ('ri',)
+
     def __init__(self, refractive_idx):
         self.ri = refractive_idx
         self.albedo = Color([1, 1, 1])
@@ -39,7 +74,7 @@ class Dielectric(Material):
         refraction_ratio = 1/self.ri if rec.front_face else self.ri
         unit_direction = unit_vector(ray_in.direction)
         cos_theta = min(dot(-unit_direction, rec.normal), 1.0)
-        sin_theta = np.sqrt(1.0 - cos_theta**2)
+        sin_theta = math.sqrt(1.0 - cos_theta**2)
         cannot_refract = refraction_ratio * sin_theta > 1.0 
         if cannot_refract or self.reflectance(cos_theta, refraction_ratio) > rand():
             direction = reflect(unit_direction, rec.normal)
@@ -47,8 +82,55 @@ class Dielectric(Material):
             direction = refract(unit_direction, rec.normal, refraction_ratio) 
         scattered = Ray(rec.point, direction)
         return True, scattered
-    
-    def reflectance(self, cosine, ref_idx):
+
+    @staticmethod
+    def scatter_kernel(directions, normals, front_face, uniforms, albedo, ri):
+        refraction_ratio = np.where(front_face, 1/ri, ri)
+        unit_direction = unit_vector_batch(directions)
+        cos_theta = np.minimum(dot_batch(-unit_direction, normals), 1.0)
+        sin_theta = np.sqrt(1.0 - cos_theta**2)
+        cannot_refract = refraction_ratio * sin_theta > 1.0
+        choice = np.random.rand(len(normals)) if uniforms is None else uniforms[:, 0]
+        reflects = cannot_refract | (Dielectric.reflectance(cos_theta, refraction_ratio) > choice)
+        direction = np.where(reflects[:, None],
+                             reflect_batch(unit_direction, normals),
+                             refract_batch(unit_direction, normals, refraction_ratio))
+        return direction, albedo, np.ones(len(normals), dtype=bool)
+
+    def scatter_batch(self, directions, normals, front_face, uniforms=None):
+        albedo = np.broadcast_to(self.albedo.e, normals.shape)
+        direction, _, valid = self.scatter_kernel(directions, normals, front_face, uniforms, albedo,
+                                                  np.full(len(normals), self.ri))
+        return direction, valid
+
+    @staticmethod
+    def reflectance(cosine, ref_idx):
         r0 = (1 - ref_idx)/( 1 + ref_idx)
         r0 = r0**2
         return r0 + (1 - r0)*pow((1 - cosine), 5)
+
+MATERIAL_KINDS = (Lambertian, Metal, Dielectric)
+
+def material_from_params(kind, albedo, fuzz, ri):
+    if kind == Metal.kind:
+        return Metal(Color(list(albedo)), fuzz)
+    if kind == Dielectric.kind:
+        return Dielectric(ri)
+    return Lambertian(Color(list(albedo)))
+
+def scatter_by_kind(kind, directions, normals, front_face, uniforms, albedo, params):
+    # sort the hits by material kind so each kernel runs once per bounce on
+    # its whole batch; params maps kernel_params names to per-hit arrays
+    order = np.argsort(kind, kind='stable')
+    bounds = np.searchsorted(kind[order], np.arange(len(MATERIAL_KINDS) + 1))
+    scattered = np.empty_like(directions)
+    attenuation = np.empty_like(directions)
+    valid = np.empty(len(kind), dtype=bool)
+    for material, start, stop in zip(MATERIAL_KINDS, bounds[:-1], bounds[1:]):
+        if start == stop:
+            continue
+        sel = order[start:stop]
+        extra = [params[name][sel] for name in material.kernel_params]
+        scattered[sel], attenuation[sel], valid[sel] = material.scatter_kernel(
+            directions[sel], normals[sel], front_face[sel], None if uniforms is None else uniforms[sel], albedo[sel], *extra)
+    return scattered, attenuation, valid
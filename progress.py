@@ -0,0 +1,59 @@
+import os
+import struct
+import numpy as np
+
+MAGIC = b'RT'
+HEADER = struct.Struct('<2sHHHH')
+# writes to a pipe up to PIPE_BUF bytes are atomic, so workers that keep
+# their messages below it can share stdout without a lock
+PIPE_BUF = 4096
+
+def encode_tile(x, y, rgb):
+    height, width = rgb.shape[:2]
+    return HEADER.pack(MAGIC, x, y, width, height) + np.ascontiguousarray(rgb, dtype=np.uint8).tobytes()
+
+def encode_tile_messages(x0, y0, rgb, image_height):
+    # rgb rows run bottom-up like the tracer's j; messages use top-left image coordinates.
+    # Tiles are cut into bands of rows, and rows too wide for one message
+    # into runs of columns, so no message is larger than PIPE_BUF.
+    rgb = rgb[::-1]
+    height, width = rgb.shape[:2]
+    top = image_height - (y0 + height)
+    cols = min(width, (PIPE_BUF - HEADER.size)//3)
+    rows = max(1, (PIPE_BUF - HEADER.size)//(3*cols))
+    return [encode_tile(x0 + c, top + r, rgb[r:r + rows, c:c + cols])
+            for r in range(0, height, rows) for c in range(0, width, cols)]
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def write_messages(fd, messages):
+    # each message goes out in one write of at most PIPE_BUF bytes, which a
+    # pipe never splits or interleaves with another writer's; the loop only
+    # matters when stdout is something else
+    for msg in messages:
+        write_all(fd, msg)
+
+class TileStreamDecoder:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        tiles = []
+        while True:
+            start = self.buffer.find(MAGIC)
+            if start < 0:
+                del self.buffer[:max(0, len(self.buffer) - 1)]
+                return tiles
+            del self.buffer[:start]
+            if len(self.buffer) < HEADER.size:
+                return tiles
+            _, x, y, width, height = HEADER.unpack_from(self.buffer)
+            end = HEADER.size + 3*width*height
+            if len(self.buffer) < end:
+                return tiles
+            tiles.append((x, y, width, height, bytes(self.buffer[HEADER.size:end])))
+            del self.buffer[:end]
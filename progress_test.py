@@ -0,0 +1,47 @@
+import os
+import unittest
+import threading
+import numpy as np
+from progress import encode_tile_messages, write_messages, TileStreamDecoder, PIPE_BUF
+
+class TestTileStream(unittest.TestCase):
+
+    def test_round_trip_split_reads(self):
+        rgb = np.arange(40*30*3, dtype=np.uint32).astype(np.uint8).reshape(30, 40, 3)
+        data = b''.join(encode_tile_messages(8, 2, rgb, 50))
+        decoder = TileStreamDecoder()
+        tiles = []
+        for k in range(0, len(data), 7):
+            tiles.extend(decoder.feed(data[k:k + 7]))
+        image = np.zeros((50, 48, 3), dtype=np.uint8)
+        for x, y, width, height, pixels in tiles:
+            image[y:y + height, x:x + width] = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 3)
+        self.assertTrue(np.array_equal(image[18:48, 8:48], rgb[::-1]))
+
+    def test_messages_fit_pipe_buf(self):
+        for width in (200, 3000):
+            rgb = np.zeros((64, width, 3), dtype=np.uint8)
+            for msg in encode_tile_messages(0, 0, rgb, 64):
+                self.assertLessEqual(len(msg), PIPE_BUF)
+
+    def test_wide_rows_arrive_whole(self):
+        # rows wider than PIPE_BUF are split into runs of columns
+        rgb = np.random.default_rng(0).integers(0, 256, size=(4, 3000, 3), dtype=np.uint8)
+        messages = encode_tile_messages(0, 0, rgb, 4)
+        read_fd, write_fd = os.pipe()
+        received = []
+        reader = threading.Thread(target=lambda: received.extend(iter(lambda: os.read(read_fd, 65536), b'')))
+        reader.start()
+        write_messages(write_fd, messages)
+        os.close(write_fd)
+        reader.join()
+        os.close(read_fd)
+        self.assertEqual(b''.join(received), b''.join(messages))
+        image = np.zeros_like(rgb)
+        for x, y, width, height, pixels in TileStreamDecoder().feed(b''.join(received)):
+            image[y:y + height, x:x + width] = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 3)
+        self.assertTrue(np.array_equal(image, rgb[::-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
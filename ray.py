@@ -1,22 +1,26 @@
 from vec3 import Point3
+try:
+	import cython
+except ImportError:
+	import cython_shim as cython
 
-class RayOrig:
-	def __get__(self, obj, objtype=None):
-		return obj.orig
-
-class RayDir:
-	def __get__(self, obj, objtype=None):
-		return obj.dir
-
+@cython.cclass
 class Ray:
-	origin = RayOrig()
-	direction = RayDir()
+	orig = cython.declare(object, visibility='public')
+	dir = cython.declare(object, visibility='public')
 
 	def __init__(self, origin=None, direction=None):
 		self.orig = origin
 		self.dir = direction
+
+	@property
+	def origin(self):
+		return self.orig
+
+	@property
+	def direction(self):
+		return self.dir
 	
-	def at(self, t):
+	def at(self, t: cython.double):
 		return self.orig + t*self.dir
 	
-
@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import struct
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import deque, OrderedDict
+from multiprocessing import Process, Queue
+import numpy as np
+from distributed import FRAME, MAGIC, parse_address, send_message, recv_message
+from scheduler import make_tiles
+from color import get_colors
+from progress import encode_tile_messages
+import image_io
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'raytracer.sock')
+REQUEST, EVENT, PIXELS = 16, 17, 18
+JOB_ID = struct.Struct('<I')
+# PathTracer arguments a job may set; everything else is fixed by the service
+JOB_FIELDS = ('image_width', 'image_height', 'samples_per_pix', 'max_depth', 'engine', 'world', 'scene',
+              'scene_cache', 'seed', 'roulette_threshold', 'mesh')
+TRACER_CACHE_SIZE = 4
+
+def service_worker(tasks, results):
+    # keeps the last few scenes built, so a repeated job starts rendering at once
+    from main import PathTracer
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    tracers = OrderedDict()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, config, tile, samples = task
+        key = json.dumps(config, sort_keys=True)
+        try:
+            tracer = tracers.pop(key, None)
+            if tracer is None:
+                tracer = PathTracer(progress='none', **config)
+                tracer.build_world()
+                tracer.setup_camera()
+                tracer.prepare_renderer()
+            tracers[key] = tracer
+            while len(tracers) > TRACER_CACHE_SIZE:
+                tracers.popitem(last=False)
+            mask = np.ones((tile.height, tile.width), dtype=bool)
+            first_sample = np.zeros((tile.height, tile.width), dtype=np.int64)
+            radiance, luminance_sq = tracer.render_tile(tile, samples, mask, first_sample)
+            results.put((job_id, tile, radiance.astype(np.float32), luminance_sq.astype(np.float32), None))
+        except Exception as e:
+            results.put((job_id, tile, None, None, f'{type(e).__name__}: {e}'))
+
+def service_address(text):
+    host, _, port = text.rpartition(':')
+    if host and port.isdigit():
+        return parse_address(text)
+    return text
+
+async def read_frame(reader):
+    magic, kind, size = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if magic != MAGIC:
+        raise ConnectionError(f'bad frame magic {magic!r}')
+    return kind, await reader.readexactly(size)
+
+def write_frame(writer, kind, payload):
+    if not writer.is_closing():
+        writer.write(FRAME.pack(MAGIC, kind, len(payload)) + payload)
+
+def write_event(writer, **event):
+    write_frame(writer, EVENT, json.dumps(event).encode())
+
+class Job:
+    def __init__(self, job_id, config, priority, tag, output, tile_size, writer):
+        self.id = job_id
+        self.config = config
+        self.priority = priority
+        self.tag = tag
+        self.output = output
+        self.writer = writer
+        self.samples = config.get('samples_per_pix', 2)
+        width, height = config.get('image_width', 400), config.get('image_height', 400)
+        self.tiles = deque(make_tiles(width, height, tile_size, 'spiral'))
+        self.remaining = len(self.tiles)
+        self.radiance = np.zeros((height, width, 3), dtype=np.float32)
+        self.counts = np.zeros((height, width), dtype=np.uint32)
+        self.submitted = time.perf_counter()
+
+    def summary(self):
+        return {'job': self.id, 'priority': self.priority, 'tag': self.tag, 'remaining_tiles': self.remaining,
+                'seconds': time.perf_counter() - self.submitted}
+
+class RenderService:
+    # Jobs share one warm worker pool. Tiles are handed out a few at a time,
+    # always from the highest-priority (then oldest) job, so a new urgent job
+    # overtakes a running one at the next tile and cancelled jobs waste at
+    # most the tiles already in flight.
+    def __init__(self, workers=None, tile_size=16):
+        workers = workers or os.cpu_count()
+        self.tile_size = tile_size
+        self.tasks, self.results = Queue(), Queue()
+        self.workers = [Process(target=service_worker, args=(self.tasks, self.results), daemon=True)
+                        for _ in range(workers)]
+        for w in self.workers:
+            w.start()
+        self.max_in_flight = 2*workers
+        self.in_flight = 0
+        self.jobs = {}
+        self.next_id = 1
+
+    async def serve(self, address):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        pump = threading.Thread(target=self.pump_results, daemon=True)
+        pump.start()
+        if isinstance(address, tuple):
+            server = await asyncio.start_server(self.handle_client, *address)
+        else:
+            if os.path.exists(address):
+                os.unlink(address)
+            server = await asyncio.start_unix_server(self.handle_client, path=address)
+        self.address = server.sockets[0].getsockname()
+        try:
+            async with server:
+                await self.stopped.wait()
+        finally:
+            for job_id in list(self.jobs):
+                self.finish(self.jobs[job_id], 'cancelled', 'service shutting down')
+            for _ in self.workers:
+                self.tasks.put(None)
+            for w in self.workers:
+                w.join()
+            self.results.put(None)
+            pump.join()
+            if not isinstance(address, tuple) and os.path.exists(address):
+                os.unlink(address)
+
+    def pump_results(self):
+        while True:
+            result = self.results.get()
+            if result is None:
+                return
+            self.loop.call_soon_threadsafe(self.on_result, result)
+
+    async def handle_client(self, reader, writer):
+        owned = []
+        try:
+            while True:
+                kind, payload = await read_frame(reader)
+                if kind != REQUEST:
+                    raise ConnectionError(f'unexpected message type {kind}')
+                request = json.loads(payload)
+                op = request.get('op')
+                if op == 'submit':
+                    owned.append(self.submit(request, writer).id)
+                elif op == 'cancel':
+                    job = self.jobs.get(request.get('job'))
+                    if job is not None:
+                        self.finish(job, 'cancelled', 'cancelled by request')
+                    write_event(writer, event='cancel', job=request.get('job'), found=job is not None)
+                elif op == 'status':
+                    write_event(writer, event='status', jobs=[job.summary() for job in self.jobs.values()],
+                                workers=len(self.workers), in_flight=self.in_flight)
+                elif op == 'shutdown':
+                    write_event(writer, event='shutdown')
+                    self.stopped.set()
+                else:
+                    write_event(writer, event='error', error=f'unknown op {op!r}')
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError, json.JSONDecodeError):
+            # CancelledError: the service is shutting down under this client
+            pass
+        finally:
+            # a client that goes away no longer wants its jobs
+            for job_id in owned:
+                if job_id in self.jobs:
+                    self.finish(self.jobs[job_id], 'cancelled', 'client disconnected')
+            writer.close()
+
+    def submit(self, request, writer):
+        spec = request.get('job', {})
+        config = {name: spec[name] for name in JOB_FIELDS if name in spec}
+        tag = request.get('tag')
+        if tag is not None:
+            for job in [job for job in self.jobs.values() if job.tag == tag]:
+                self.finish(job, 'cancelled', f'superseded by job {self.next_id}')
+        job = Job(self.next_id, config, request.get('priority', 0), tag, spec.get('output'), self.tile_size, writer)
+        self.next_id += 1
+        self.jobs[job.id] = job
+        write_event(writer, event='accepted', job=job.id, tiles=job.remaining)
+        self.dispatch()
+        return job
+
+    def dispatch(self):
+        while self.in_flight < self.max_in_flight:
+            ready = [job for job in self.jobs.values() if job.tiles]
+            if not ready:
+                return
+            job = min(ready, key=lambda job: (-job.priority, job.id))
+            self.tasks.put((job.id, job.config, job.tiles.popleft(), job.samples))
+            self.in_flight += 1
+
+    def on_result(self, result):
+        job_id, tile, radiance, luminance_sq, error = result
+        self.in_flight -= 1
+        job = self.jobs.get(job_id)
+        if job is not None and error is not None:
+            self.finish(job, 'failed', error)
+        elif job is not None:
+            region = (slice(tile.y0, tile.y0 + tile.height), slice(tile.x0, tile.x0 + tile.width))
+            job.radiance[region] += radiance
+            job.counts[region] += np.uint32(job.samples)
+            rgb = get_colors(job.radiance[region], job.counts[region])
+            messages = encode_tile_messages(tile.x0, tile.y0, rgb, job.radiance.shape[0])
+            write_frame(job.writer, PIXELS, JOB_ID.pack(job.id) + b''.join(messages))
+            job.remaining -= 1
+            if not job.remaining:
+                if job.output:
+                    image_io.save_image(job.output, job.radiance, job.counts)
+                self.finish(job, 'done')
+        self.dispatch()
+
+    def finish(self, job, state, reason=None):
+        del self.jobs[job.id]
+        job.tiles.clear()
+        write_event(job.writer, event='finished', job=job.id, state=state, reason=reason,
+                    seconds=time.perf_counter() - job.submitted, output=job.output if state == 'done' else None)
+
+def connect(address):
+    if isinstance(address, tuple):
+        return socket.create_connection(address)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+def send_request(sock, **request):
+    send_message(sock, REQUEST, json.dumps(request).encode())
+
+def submit_job(address, job, priority=0, tag=None, on_pixels=None, on_event=None):
+    # blocks until the job finishes; on_pixels gets binary progress messages
+    with connect(address) as sock:
+        send_request(sock, op='submit', job=job, priority=priority, tag=tag)
+        while True:
+            kind, payload = recv_message(sock)
+            if kind == PIXELS:
+                if on_pixels is not None:
+                    on_pixels(JOB_ID.unpack_from(payload)[0], payload[JOB_ID.size:])
+                continue
+            event = json.loads(payload)
+            if on_event is not None:
+                on_event(event)
+            if event['event'] == 'finished':
+                return event
+
+def service_request(address, **request):
+    with connect(address) as sock:
+        send_request(sock, **request)
+        return json.loads(recv_message(sock)[1])
+
+def run_client(address, options, priority=0, tag=None):
+    # main.py --submit: same arguments and progress output as a local render
+    job = {name: options[name] for name in JOB_FIELDS if options.get(name) is not None}
+    if job.get('scene'):
+        job['scene'] = os.path.abspath(job['scene'])
+    if job.get('mesh'):
+        job['mesh'] = [os.path.abspath(path) for path in job['mesh']]
+    job['scene_cache'] = os.path.abspath(options.get('scene_cache') or '.scene_cache')
+    job['output'] = os.path.abspath(options.get('output') or 'image.ppm')
+    binary = options.get('progress') == 'binary'
+    log_stream = sys.stderr if binary else sys.stdout
+
+    def on_pixels(job_id, messages):
+        if binary:
+            sys.stdout.buffer.write(messages)
+            sys.stdout.buffer.flush()
+
+    def on_event(event):
+        if event['event'] == 'accepted':
+            print(f'Job {event["job"]} accepted, {event["tiles"]} tiles', file=log_stream, flush=True)
+
+    event = submit_job(address, job, priority, tag, on_pixels, on_event)
+    if event['state'] != 'done':
+        print(f'Job {event["job"]} {event["state"]}: {event["reason"]}', file=sys.stderr, flush=True)
+        return 1
+    print(f'Job {event["job"]} written to {event["output"]} in {event["seconds"]:.2f}s', file=log_stream, flush=True)
+    return 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Long-lived render service with warm scenes and workers')
+    parser.add_argument('command', choices=['serve', 'status', 'cancel', 'shutdown'], nargs='?', default='serve')
+    parser.add_argument('job', type=int, nargs='?', help='job id for cancel')
+    parser.add_argument('--address', default=DEFAULT_SOCKET, help=f'Unix socket path or HOST:PORT (default {DEFAULT_SOCKET})')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--tile-size', type=int, default=16)
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = parse_args(argv)
+    address = service_address(args.address)
+    if args.command == 'serve':
+        service = RenderService(args.workers, args.tile_size)
+        print(f'Serving on {args.address} with {args.workers} workers', file=sys.stderr, flush=True)
+        asyncio.run(service.serve(address))
+    elif args.command == 'cancel':
+        print(json.dumps(service_request(address, op='cancel', job=args.job)))
+    else:
+        print(json.dumps(service_request(address, op=args.command), indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
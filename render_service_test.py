@@ -0,0 +1,58 @@
+import io
+import os
+import asyncio
+import tempfile
+import threading
+import unittest
+import contextlib
+import numpy as np
+from main import PathTracer
+from render_service import RenderService, submit_job, service_request
+
+class TestRenderService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.address = os.path.join(self.tmp.name, 'service.sock')
+        self.service = RenderService(workers=1, tile_size=8)
+        self.thread = threading.Thread(target=asyncio.run, args=(self.service.serve(self.address),))
+        self.thread.start()
+        while not os.path.exists(self.address):
+            self.thread.join(0.01)
+
+    def tearDown(self):
+        service_request(self.address, op='shutdown')
+        self.thread.join()
+        self.tmp.cleanup()
+
+    def test_job_matches_local_render(self):
+        job = {'image_width': 24, 'image_height': 16, 'samples_per_pix': 2, 'max_depth': 4, 'engine': 'wavefront'}
+        tiles = []
+        event = submit_job(self.address, dict(job, output=os.path.join(self.tmp.name, 'service.npy')),
+                           on_pixels=lambda job_id, messages: tiles.append(messages))
+        self.assertEqual(event['state'], 'done')
+        self.assertEqual(len(tiles), 6)
+        with contextlib.redirect_stdout(io.StringIO()):
+            PathTracer(progress='none', output=os.path.join(self.tmp.name, 'local.npy'), **job).run()
+        self.assertTrue(np.array_equal(np.load(event['output']), np.load(os.path.join(self.tmp.name, 'local.npy'))))
+
+    def test_same_tag_supersedes_running_job(self):
+        accepted = threading.Event()
+        finished = []
+        job = {'image_width': 64, 'image_height': 64, 'samples_per_pix': 8, 'max_depth': 8}
+
+        def first():
+            finished.append(submit_job(self.address, job, tag='preview',
+                                       on_event=lambda event: event['event'] == 'accepted' and accepted.set()))
+        thread = threading.Thread(target=first)
+        thread.start()
+        accepted.wait(10)
+        second = submit_job(self.address, dict(job, image_width=8, image_height=8, samples_per_pix=1), tag='preview')
+        thread.join()
+        self.assertEqual(finished[0]['state'], 'cancelled')
+        self.assertIn('superseded', finished[0]['reason'])
+        self.assertEqual(second['state'], 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
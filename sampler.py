@@ -0,0 +1,59 @@
+import numpy as np
+
+PHILOX_M = (0xD2511F53, 0xCD9E8D57)
+PHILOX_W = (0x9E3779B9, 0xBB67AE85)
+MASK32 = np.uint64(0xffffffff)
+
+# Counter layout: word 0 is the block within a draw, word 1 the sample index,
+# word 2 the pixel index and word 3 the dimension. Dimension 0 is the camera,
+# 1 + depth is a bounce and SCALAR_STREAM onwards feeds utils.rand.
+CAMERA = 0
+SCALAR_STREAM = 1 << 31
+
+def philox4x32(counters, key, rounds=10):
+    c0, c1, c2, c3 = (np.asarray(c, dtype=np.uint64) for c in counters)
+    k0, k1 = int(key[0]), int(key[1])
+    m0, m1 = np.uint64(PHILOX_M[0]), np.uint64(PHILOX_M[1])
+    for _ in range(rounds):
+        p0, p1 = c0*m0, c2*m1
+        c0, c1, c2, c3 = (p1 >> np.uint64(32)) ^ c1 ^ np.uint64(k0), p1 & MASK32, \
+                         (p0 >> np.uint64(32)) ^ c3 ^ np.uint64(k1), p0 & MASK32
+        k0 = (k0 + PHILOX_W[0]) & 0xffffffff
+        k1 = (k1 + PHILOX_W[1]) & 0xffffffff
+    return c0, c1, c2, c3
+
+def to_unit_float(hi, lo):
+    # 53 random bits from two 32 bit words, as in genrand_res53
+    return ((hi >> np.uint64(5)).astype(np.float64)*67108864.0 + (lo >> np.uint64(6)))*(1.0/9007199254740992.0)
+
+class Sampler:
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.key = np.random.SeedSequence(seed).generate_state(2)
+
+    def uniforms(self, pixel, sample, dimension, count=4):
+        pixel, sample = np.broadcast_arrays(np.asarray(pixel, dtype=np.uint64), np.asarray(sample, dtype=np.uint64))
+        pixel, sample = pixel.ravel(), sample.ravel()
+        blocks = (count + 1)//2
+        counters = (np.tile(np.arange(blocks, dtype=np.uint64), len(pixel)),
+                    np.repeat(sample, blocks),
+                    np.repeat(pixel, blocks),
+                    np.full(blocks*len(pixel), dimension, dtype=np.uint64))
+        x0, x1, x2, x3 = philox4x32(counters, self.key)
+        u = np.stack([to_unit_float(x0, x1), to_unit_float(x2, x3)], axis=1).reshape(len(pixel), 2*blocks)
+        return u[:, :count]
+
+    def streams(self, pixel, sample, block=32):
+        # one batched draw primes a scalar stream for every (pixel, sample)
+        pixel, sample = np.asarray(pixel, dtype=np.int64), np.asarray(sample, dtype=np.int64)
+        first = self.uniforms(pixel, sample, SCALAR_STREAM, block).tolist()
+        return [self.stream(p, s, block, row) for p, s, row in zip(pixel.tolist(), sample.tolist(), first)]
+
+    def stream(self, pixel, sample, block=32, first=None):
+        if first is None:
+            first = self.uniforms(pixel, sample, SCALAR_STREAM, block)[0].tolist()
+        yield from first
+        refill = 1
+        while True:
+            yield from self.uniforms(pixel, sample, SCALAR_STREAM + refill, block)[0].tolist()
+            refill += 1
@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from sampler import Sampler, philox4x32
+from main import PathTracer
+from wavefront import WavefrontRenderer
+
+class TestSampler(unittest.TestCase):
+
+    def test_philox_known_answers(self):
+        # Random123 known-answer vectors for Philox4x32-10
+        out = philox4x32(([0], [0], [0], [0]), (0, 0))
+        self.assertEqual([int(x[0]) for x in out], [0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8])
+        out = philox4x32(([0x243f6a88], [0x85a308d3], [0x13198a2e], [0x03707344]), (0xa4093822, 0x299f31d0))
+        self.assertEqual([int(x[0]) for x in out], [0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1])
+
+    def test_uniforms_are_keyed(self):
+        sampler = Sampler(3)
+        u = sampler.uniforms(np.arange(1000), 2, 1)
+        self.assertEqual(u.shape, (1000, 4))
+        self.assertTrue(((u >= 0) & (u < 1)).all())
+        self.assertTrue(np.array_equal(u[[10, 500]], sampler.uniforms([10, 500], 2, 1)))
+        self.assertFalse(np.array_equal(u[10], sampler.uniforms(10, 3, 1)[0]))
+        self.assertFalse(np.array_equal(u[10], Sampler(4).uniforms(10, 2, 1)[0]))
+
+    def test_streams_match_single_stream(self):
+        sampler = Sampler()
+        streams = sampler.streams([7, 8], [0, 5], block=4)
+        single = sampler.stream(8, 5, block=4)
+        self.assertEqual([next(streams[1]) for _ in range(10)], [next(single) for _ in range(10)])
+
+    def test_wavefront_independent_of_tiling(self):
+        pt = PathTracer(image_width=16, image_height=12, max_depth=5)
+        pt.build_world()
+        pt.setup_camera()
+        renderer = WavefrontRenderer(pt.world, pt.cam, 16, 12, 5, Sampler(1))
+        whole, _ = renderer.render_tile(0, 0, 16, 12, 3)
+        left, _ = renderer.render_tile(0, 0, 5, 12, 3)
+        right, _ = renderer.render_tile(5, 0, 11, 12, 3)
+        self.assertTrue(np.array_equal(whole, np.concatenate([left, right], axis=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from vec3 import Point3
+from sphere import Sphere
+from hittable_list import HittableList
+from compiled_scene import CompiledScene
+from material import Lambertian, Metal, Dielectric
+
+CACHE_VERSION = b'scene-cache-2'
+MATERIAL_TYPES = {'lambertian': Lambertian, 'metal': Metal, 'dielectric': Dielectric}
+
+class SceneFile:
+    def __init__(self, scene, camera):
+        self.scene = scene
+        self.camera = camera
+
+    def world(self):
+        scene = self.scene
+        world = HittableList()
+        for center, radius, material_id in zip(scene.centers.tolist(), scene.radii.tolist(), scene.material_id.tolist()):
+            world.add(Sphere(Point3(center), radius, scene.materials[material_id]))
+        return world
+
+def parse_material(spec):
+    name = spec.get('type', '').lower()
+    if name not in MATERIAL_TYPES:
+        raise ValueError(f'Unknown material type {spec.get("type")!r}, expected one of {sorted(MATERIAL_TYPES)}')
+    albedo = [float(c) for c in spec.get('albedo', [1.0, 1.0, 1.0])]
+    if name == 'dielectric':
+        # glass is clear in both engines; Dielectric ignores any albedo
+        albedo = [1.0, 1.0, 1.0]
+    return MATERIAL_TYPES[name].kind, tuple(albedo), min(1.0, float(spec.get('fuzz', 0.0))), float(spec.get('ri', 1.0))
+
+def parse_camera(spec):
+    camera = {'lookfrom': [0.0, 0.0, 0.0], 'lookat': [0.0, 0.0, -1.0], 'vup': [0.0, 1.0, 0.0],
+              'vfov': 90.0, 'aperture': 0.0}
+    camera.update(spec)
+    if 'focus_dist' not in camera:
+        camera['focus_dist'] = float(np.linalg.norm(np.subtract(camera['lookfrom'], camera['lookat'])))
+    return camera
+
+def compile_scene_data(data):
+    named = {name: parse_material(spec) for name, spec in data.get('materials', {}).items()}
+    rows, row_index, material_id = [], {}, []
+    for k, sphere in enumerate(data.get('spheres', [])):
+        ref = sphere.get('material')
+        if isinstance(ref, str):
+            if ref not in named:
+                raise ValueError(f'Sphere {k} uses undefined material {ref!r}')
+            row = named[ref]
+        elif isinstance(ref, dict):
+            row = parse_material(ref)
+        else:
+            raise ValueError(f'Sphere {k} needs a material name or inline material')
+        if row not in row_index:
+            row_index[row] = len(rows)
+            rows.append(row)
+        material_id.append(row_index[row])
+
+    spheres = data.get('spheres', [])
+    arrays = {
+        'centers': np.array([s['center'] for s in spheres], dtype=np.float64).reshape(len(spheres), 3),
+        'radii': np.array([s['radius'] for s in spheres], dtype=np.float64),
+        'material_id': np.array(material_id, dtype=np.int32),
+        'table_kind': np.array([row[0] for row in rows], dtype=np.int8),
+        'table_albedo': np.array([row[1] for row in rows], dtype=np.float64).reshape(len(rows), 3),
+        'table_fuzz': np.array([row[2] for row in rows], dtype=np.float64),
+        'table_ri': np.array([row[3] for row in rows], dtype=np.float64),
+    }
+    scene = CompiledScene.from_arrays(arrays)
+    if len(scene) > CompiledScene.bvh_threshold:
+        scene.build_bvh()
+    return scene
+
+def load_scene(path, cache_root='.scene_cache', raw=None):
+    # the cache key covers the raw file, so a hit skips JSON parsing and the
+    # BVH build and maps the arrays straight from disk
+    if raw is None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    cache_dir = os.path.join(cache_root, hashlib.sha256(CACHE_VERSION + raw).hexdigest()[:32])
+    if os.path.isdir(cache_dir):
+        with open(os.path.join(cache_dir, 'camera.json')) as f:
+            return SceneFile(CompiledScene.load(cache_dir), json.load(f))
+
+    data = json.loads(raw)
+    scene = compile_scene_data(data)
+    camera = parse_camera(data.get('camera', {}))
+    os.makedirs(cache_root, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=cache_root)
+    try:
+        scene.save(staging)
+        with open(os.path.join(staging, 'camera.json'), 'w') as f:
+            json.dump(camera, f)
+        os.rename(staging, cache_dir)
+    except OSError:
+        # another process published the same scene first
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(cache_dir):
+            raise
+    return SceneFile(CompiledScene.load(cache_dir), camera)
+
+def dump_scene(path, objects, camera):
+    materials, names, spheres = {}, {}, []
+    for obj in objects:
+        mat = obj.material
+        if id(mat) not in names:
+            names[id(mat)] = f'm{len(names)}'
+            spec = {'type': type(mat).__name__.lower()}
+            if isinstance(mat, Dielectric):
+                spec['ri'] = mat.ri
+            else:
+                spec['albedo'] = list(mat.albedo.e)
+            if isinstance(mat, Metal):
+                spec['fuzz'] = mat.fuzz
+            materials[names[id(mat)]] = spec
+        spheres.append({'center': list(obj.center.e), 'radius': obj.radius, 'material': names[id(mat)]})
+    with open(path, 'w') as f:
+        json.dump({'camera': camera, 'materials': materials, 'spheres': spheres}, f, indent=1)
+
+if __name__ == '__main__':
+    # export a built-in world as a starting point: python scene_file.py random scene.json
+    from main import PathTracer
+    if len(sys.argv) != 3:
+        sys.exit('usage: scene_file.py {default,random} OUTPUT.json')
+    pt = PathTracer(world=sys.argv[1], engine='wavefront')
+    pt.build_world()
+    dump_scene(sys.argv[2], pt.world.objects, pt.camera_params())
@@ -0,0 +1,74 @@
+import io
+import os
+import json
+import pickle
+import tempfile
+import unittest
+import contextlib
+import numpy as np
+from main import PathTracer
+from scene_file import load_scene, dump_scene
+
+class TestSceneFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'scene.json')
+        self.cache = os.path.join(self.tmp.name, 'cache')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip_matches_builtin_world(self):
+        pt = PathTracer()
+        pt.build_world()
+        dump_scene(self.path, pt.world.objects, pt.camera_params())
+        reference = pt.world.compile()
+        scene = load_scene(self.path, self.cache).scene
+        for name in ('centers', 'radii', 'material_kind', 'albedo', 'fuzz', 'ri'):
+            self.assertTrue(np.array_equal(getattr(scene, name), getattr(reference, name)), name)
+        self.assertEqual([type(m) for m in scene.materials], [type(m) for m in reference.materials])
+
+    def test_cache_is_mapped_and_includes_bvh(self):
+        spheres = [{'center': [float(k), 0.0, -5.0], 'radius': 0.4, 'material': 'red'} for k in range(40)]
+        with open(self.path, 'w') as f:
+            json.dump({'materials': {'red': {'type': 'lambertian', 'albedo': [0.8, 0.1, 0.1]}},
+                       'spheres': spheres, 'camera': {'vfov': 40}}, f)
+        first = load_scene(self.path, self.cache)
+        second = load_scene(self.path, self.cache)
+        self.assertEqual(len(os.listdir(self.cache)), 1)
+        self.assertIsInstance(second.scene.centers, np.memmap)
+        self.assertIsInstance(second.scene.bvh.node_min, np.memmap)
+        self.assertEqual(second.camera['vfov'], 40)
+        self.assertAlmostEqual(second.camera['focus_dist'], 1.0)
+
+        origins = np.zeros((20, 3))
+        directions = np.random.default_rng(0).normal(size=(20, 3)) + [0, 0, -3]
+        restored = pickle.loads(pickle.dumps(second.scene))
+        for scene in (second.scene, restored):
+            for a, b in zip(scene.closest_hit(origins, directions), first.scene.closest_hit(origins, directions)):
+                self.assertTrue(np.array_equal(a, b))
+
+    def test_dielectric_matches_across_engines(self):
+        scene = json.dumps({'spheres': [{'center': [0, 0, -1], 'radius': 0.5,
+                                         'material': {'type': 'dielectric', 'ri': 1.5, 'albedo': [0.2, 0.2, 0.9]}}],
+                            'camera': {'vfov': 60}})
+        images = []
+        for engine in ('scalar', 'wavefront'):
+            output = os.path.join(self.tmp.name, engine + '.npy')
+            with contextlib.redirect_stdout(io.StringIO()):
+                PathTracer(image_width=8, image_height=8, samples_per_pix=16, max_depth=8, engine=engine,
+                           scene_data=scene, scene_cache=self.cache, output=output).run()
+            images.append(np.load(output))
+        centre = [image[3:5, 3:5].mean(axis=(0, 1)) for image in images]
+        self.assertTrue(np.allclose(centre[0], centre[1], atol=0.1), centre)
+        self.assertGreater(centre[1][0], 0.5)
+
+    def test_unknown_material(self):
+        with open(self.path, 'w') as f:
+            json.dump({'spheres': [{'center': [0, 0, 0], 'radius': 1, 'material': 'missing'}]}, f)
+        self.assertRaises(ValueError, load_scene, self.path, self.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import numpy as np
+from collections import namedtuple
+from multiprocessing import Array, Lock
+
+Tile = namedtuple('Tile', ['index', 'x0', 'y0', 'width', 'height'])
+
+TILE_ORDERS = ('scanline', 'spiral', 'hilbert')
+
+def hilbert_index(n, x, y):
+    d = 0
+    s = n//2
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s*s*((3*rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x = s - 1 - x
+                y = s - 1 - y
+            x, y = y, x
+        s //= 2
+    return d
+
+def make_tiles(image_width, image_height, tile_size=16, order='scanline'):
+    cols = (image_width + tile_size - 1)//tile_size
+    rows = (image_height + tile_size - 1)//tile_size
+    # tile rows are numbered from the top of the image, which is the highest j
+    cells = [(tx, ty) for ty in range(rows) for tx in range(cols)]
+    if order == 'spiral':
+        cx, cy = (cols - 1)/2.0, (rows - 1)/2.0
+        cells.sort(key=lambda c: (max(abs(c[0] - cx), abs(c[1] - cy)), np.arctan2(c[1] - cy, c[0] - cx)))
+    elif order == 'hilbert':
+        n = 1
+        while n < max(cols, rows):
+            n *= 2
+        cells.sort(key=lambda c: hilbert_index(n, c[0], c[1]))
+    elif order != 'scanline':
+        raise ValueError(f'Unknown tile order {order!r}, expected one of {TILE_ORDERS}')
+
+    tiles = []
+    for tx, ty in cells:
+        y1 = image_height - ty*tile_size
+        y0 = max(0, y1 - tile_size)
+        x0 = tx*tile_size
+        tiles.append(Tile(len(tiles), x0, y0, min(tile_size, image_width - x0), y1 - y0))
+    return tiles
+
+class TileScheduler:
+    def __init__(self, tiles, workers):
+        self.tiles = tiles
+        self.worker_count = workers
+        self.lock = Lock()
+
+        # every worker owns a deque of tile indices, dealt round-robin so the
+        # global tile order is preserved; owners pop from the head, thieves
+        # steal from the tail of the fullest deque
+        queues = [list(range(k, len(tiles), workers)) for k in range(workers)]
+        self.queue = Array('l', [idx for q in queues for idx in q], lock=False)
+        bounds = np.cumsum([0] + [len(q) for q in queues])
+        self.head = Array('l', [int(b) for b in bounds[:-1]], lock=False)
+        self.tail = Array('l', [int(b) for b in bounds[1:]], lock=False)
+
+        self.tile_time = Array('d', len(tiles), lock=False)
+        self.tile_worker = Array('l', [-1]*len(tiles), lock=False)
+        self.steals = Array('l', workers, lock=False)
+
+    def next_tile(self, worker_id):
+        with self.lock:
+            if self.head[worker_id] < self.tail[worker_id]:
+                idx = self.queue[self.head[worker_id]]
+                self.head[worker_id] += 1
+                return self.tiles[idx]
+            remaining = [self.tail[k] - self.head[k] for k in range(self.worker_count)]
+            victim = int(np.argmax(remaining))
+            if remaining[victim] <= 0:
+                return None
+            self.tail[victim] -= 1
+            self.steals[worker_id] += 1
+            return self.tiles[self.queue[self.tail[victim]]]
+
+    def tile_done(self, tile, worker_id, elapsed):
+        self.tile_time[tile.index] = elapsed
+        self.tile_worker[tile.index] = worker_id
+
+    def stats(self):
+        tiles = [
+            dict(tile._asdict(), seconds=self.tile_time[tile.index], worker=self.tile_worker[tile.index])
+            for tile in self.tiles
+        ]
+        busy = [0.0]*self.worker_count
+        for tile in tiles:
+            if tile['worker'] >= 0:
+                busy[tile['worker']] += tile['seconds']
+        mean_busy = sum(busy)/len(busy)
+        return {
+            'tiles': tiles,
+            'worker_busy': busy,
+            'worker_steals': list(self.steals),
+            'imbalance': max(busy)/mean_busy if mean_busy > 0 else 1.0,
+        }
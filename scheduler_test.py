@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+from scheduler import make_tiles, hilbert_index, TileScheduler, TILE_ORDERS
+
+class TestScheduler(unittest.TestCase):
+
+    def test_tiles_cover_every_pixel_once(self):
+        for order in TILE_ORDERS:
+            for width, height, size in ((64, 48, 16), (37, 23, 8), (5, 70, 16)):
+                coverage = np.zeros((height, width), dtype=int)
+                tiles = make_tiles(width, height, size, order)
+                for k, tile in enumerate(tiles):
+                    self.assertEqual(tile.index, k)
+                    coverage[tile.y0:tile.y0 + tile.height, tile.x0:tile.x0 + tile.width] += 1
+                self.assertTrue((coverage == 1).all(), (order, width, height))
+        self.assertRaises(ValueError, make_tiles, 8, 8, 4, 'random')
+
+    def test_hilbert_index_visits_every_cell(self):
+        n = 8
+        curve = sorted((hilbert_index(n, x, y), x, y) for x in range(n) for y in range(n))
+        self.assertEqual([d for d, _, _ in curve], list(range(n*n)))
+        # consecutive cells on the curve are neighbours
+        for (_, x0, y0), (_, x1, y1) in zip(curve, curve[1:]):
+            self.assertEqual(abs(x1 - x0) + abs(y1 - y0), 1)
+
+    def test_next_tile_returns_every_tile_once(self):
+        for order in TILE_ORDERS:
+            tiles = make_tiles(37, 23, 8, order)
+            scheduler = TileScheduler(tiles, 3)
+            seen = []
+            idle = set()
+            while len(idle) < 3:
+                for worker in range(3):
+                    tile = scheduler.next_tile(worker)
+                    if tile is None:
+                        idle.add(worker)
+                    else:
+                        seen.append(tile.index)
+                        scheduler.tile_done(tile, worker, 0.01)
+            self.assertEqual(sorted(seen), list(range(len(tiles))))
+            stats = scheduler.stats()
+            self.assertTrue(all(tile['worker'] >= 0 for tile in stats['tiles']))
+            self.assertAlmostEqual(sum(stats['worker_busy']), 0.01*len(tiles))
+
+    def test_idle_worker_steals_from_fullest_queue(self):
+        tiles = make_tiles(64, 8, 8)
+        # eight tiles dealt round-robin: worker 0 gets 0, 3, 6; 1 gets 1, 4, 7; 2 gets 2, 5
+        scheduler = TileScheduler(tiles, 3)
+        self.assertEqual(scheduler.next_tile(1).index, 1)
+        self.assertEqual(scheduler.next_tile(2).index, 2)
+        self.assertEqual(scheduler.next_tile(2).index, 5)
+        # worker 2 is out of work and worker 0 has the most left, so it
+        # loses the tail of its queue
+        self.assertEqual(scheduler.next_tile(2).index, 6)
+        self.assertEqual(list(scheduler.steals), [0, 0, 1])
+        self.assertEqual(scheduler.next_tile(0).index, 0)
+        self.assertEqual(scheduler.next_tile(0).index, 3)
+        # then worker 0 runs dry and takes the tail of worker 1's queue
+        self.assertEqual(scheduler.next_tile(0).index, 7)
+        self.assertEqual(list(scheduler.steals), [1, 0, 1])
+        self.assertEqual(scheduler.next_tile(1).index, 4)
+        self.assertIsNone(scheduler.next_tile(1))
+        self.assertEqual(scheduler.stats()['worker_steals'], [1, 0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
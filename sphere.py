@@ -1,7 +1,14 @@
+import math
 import numpy as np
-from vec3 import dot
+from vec3 import dot_batch
 from hittable import Hittable, HitRecord
+from aabb import AABB
+import instrumentation
 import pdb
+try:
+    import cython
+except ImportError:
+    import cython_shim as cython
 
 class Sphere(Hittable):
     def __init__(self, center, radius, material):
@@ -10,28 +17,50 @@ class Sphere(Hittable):
         self.radius = radius
         self.material = material
     
-    def hit(self, ray, t_min, t_max):
-        co = ray.origin - self.center
-        a = ray.direction.length_squared()
-        half_b = dot(co, ray.direction)
-        c = co.length_squared() - self.radius**2
-        d = half_b**2 - a*c 
+    def hit(self, ray, t_min: cython.double, t_max: cython.double):
+        if instrumentation.stats is not None:
+            instrumentation.stats.count('sphere_tests')
+        # the quadratic on unpacked doubles, so a miss allocates no Vec3
+        origin, direction, center = ray.orig, ray.dir, self.center
+        dx: cython.double = direction.x
+        dy: cython.double = direction.y
+        dz: cython.double = direction.z
+        cox: cython.double = origin.x - center.x
+        coy: cython.double = origin.y - center.y
+        coz: cython.double = origin.z - center.z
+        radius: cython.double = self.radius
+        a: cython.double = dx*dx + dy*dy + dz*dz
+        half_b: cython.double = cox*dx + coy*dy + coz*dz
+        c: cython.double = cox*cox + coy*coy + coz*coz - radius**2
+        d: cython.double = half_b**2 - a*c
         if d < 0:
-            return False
+            return None
 
-        sqrtd = np.sqrt(d)
-        t = (-half_b - sqrtd)/a
+        sqrtd: cython.double = math.sqrt(d)
+        t: cython.double = (-half_b - sqrtd)/a
         if t > t_max or t < t_min:
             t = (-half_b + sqrtd)/a
         if t > t_max or t < t_min:
-            return False
+            return None
 
-        self.rec.t = t
-        self.rec.point = ray.at(t)
-        outward_normal = (self.rec.point - self.center)/self.radius;
-        self.rec.set_face_normal(ray, outward_normal)
-        self.rec.material = self.material
+        point = ray.at(t)
+        rec = HitRecord(t, point, self.material)
+        rec.set_face_normal(ray, (point - center)/self.radius)
+        return rec
 
-        return True
+    def bounding_box(self):
+        r = abs(self.radius)
+        return AABB(self.center - r, self.center + r)
 
-        
+    def hit_batch(self, origins, directions, t_min, t_max):
+        co = origins - self.center.e
+        a = dot_batch(directions, directions)
+        half_b = dot_batch(co, directions)
+        c = dot_batch(co, co) - self.radius**2
+        d = half_b**2 - a*c
+        with np.errstate(invalid='ignore'):
+            sqrtd = np.sqrt(d)
+        t = (-half_b - sqrtd)/a
+        t = np.where((t > t_max) | (t < t_min), (-half_b + sqrtd)/a, t)
+        miss = (d < 0) | (t > t_max) | (t < t_min)
+        return np.where(miss, np.inf, t)
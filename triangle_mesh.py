@@ -0,0 +1,153 @@
+import re
+import numpy as np
+from vec3 import Point3, dot_batch, cross_batch, unit_vector_batch
+from hittable import Hittable, HitRecord
+from aabb import AABB
+from flat_bvh import FlatBVH
+from material import scatter_by_kind
+import instrumentation
+
+FACE_REFS = re.compile(r'/\S*')
+DET_EPSILON = 1e-12
+
+def parse_vertices(lines):
+    text = ''.join(lines)
+    values = np.fromstring(text, sep=' ')
+    if len(values) != 3*len(lines):
+        # w components or vertex colours; keep x y z
+        values = np.array([line.split()[:3] for line in lines], dtype=np.float64)
+    return values.reshape(-1, 3)
+
+def parse_faces(lines, bases):
+    # fan-triangulates polygons; bases holds the vertex count before each
+    # face, which resolves negative (relative) indices
+    lines = FACE_REFS.sub('', ''.join(lines)).splitlines()
+    indices = np.fromstring(' '.join(lines), dtype=np.int64, sep=' ')
+    if len(indices) == 3*len(lines):
+        sizes = np.full(len(lines), 3)
+    else:
+        sizes = np.array([len(line.split()) for line in lines])
+    if (sizes < 3).any():
+        raise ValueError('OBJ face with fewer than 3 vertices')
+    indices = np.where(indices < 0, indices + np.repeat(bases, sizes), indices - 1)
+    starts = np.cumsum(sizes) - sizes
+    fans = sizes - 2
+    first = np.repeat(starts, fans)
+    corner = np.arange(fans.sum()) - np.repeat(np.cumsum(fans) - fans, fans) + first + 1
+    return np.stack([indices[first], indices[corner], indices[corner + 1]], axis=1)
+
+def load_obj(path, chunk_bytes=1 << 20):
+    # reads about chunk_bytes of lines at a time and parses each chunk's
+    # vertex and face records with one NumPy call; nothing per triangle
+    # ever becomes a Python object
+    vertex_chunks, face_chunks = [], []
+    vertex_count = 0
+    with open(path) as f:
+        while True:
+            lines = f.readlines(chunk_bytes)
+            if not lines:
+                break
+            vertex_lines, face_lines, bases = [], [], []
+            for line in lines:
+                # the keyword may be followed by any whitespace
+                tag = line[:2]
+                if tag == 'v ' or tag == 'v\t':
+                    vertex_lines.append(line[2:])
+                elif tag == 'f ' or tag == 'f\t':
+                    face_lines.append(line[2:])
+                    bases.append(vertex_count + len(vertex_lines))
+            if vertex_lines:
+                vertex_chunks.append(parse_vertices(vertex_lines))
+                vertex_count += len(vertex_lines)
+            if face_lines:
+                face_chunks.append(parse_faces(face_lines, np.array(bases)))
+    vertices = np.concatenate(vertex_chunks) if vertex_chunks else np.zeros((0, 3))
+    faces = np.concatenate(face_chunks) if face_chunks else np.zeros((0, 3), dtype=np.int64)
+    if len(faces) and (faces.min() < 0 or faces.max() >= len(vertices)):
+        raise ValueError(f'{path}: face index out of range for {len(vertices)} vertices')
+    return vertices, faces.astype(np.int32 if len(vertices) < 2**31 else np.int64)
+
+class TriangleMesh(Hittable):
+    # One material per mesh. Triangles are stored as a vertex and two edges
+    # for Moller-Trumbore, and found through a FlatBVH over their bounds.
+    # Besides the scalar Hittable interface the mesh answers the batched
+    # queries of CompiledScene, so compile() can put it next to the spheres.
+    leaf_size = 8
+
+    def __init__(self, vertices, faces, material):
+        super().__init__()
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float64)
+        self.faces = np.ascontiguousarray(faces)
+        self.material = material
+        p0, p1, p2 = (self.vertices[self.faces[:, k]] for k in range(3))
+        self.v0 = p0
+        self.e1 = p1 - p0
+        self.e2 = p2 - p0
+        box_min = np.minimum(np.minimum(p0, p1), p2)
+        box_max = np.maximum(np.maximum(p0, p1), p2)
+        del p1, p2
+        self.bvh = FlatBVH(box_min, box_max, self.leaf_size)
+        self.box = AABB(Point3(box_min.min(axis=0)), Point3(box_max.max(axis=0)))
+
+    @classmethod
+    def from_obj(cls, path, material):
+        return cls(*load_obj(path), material)
+
+    def __len__(self):
+        return len(self.faces)
+
+    def bounding_box(self):
+        return self.box
+
+    @property
+    def material_kind(self):
+        return np.full(len(self), self.material.kind, dtype=np.int8)
+
+    def hit_pairs(self, tri_idx, origins, directions, t_min, t_max):
+        e1, e2 = self.e1[tri_idx], self.e2[tri_idx]
+        pvec = cross_batch(directions, e2)
+        det = dot_batch(e1, pvec)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_det = 1.0/det
+            tvec = origins - self.v0[tri_idx]
+            u = dot_batch(tvec, pvec)*inv_det
+            qvec = cross_batch(tvec, e1)
+            v = dot_batch(directions, qvec)*inv_det
+            t = dot_batch(e2, qvec)*inv_det
+        hit = (np.abs(det) > DET_EPSILON) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= t_min) & (t <= t_max)
+        return np.where(hit, t, np.inf)
+
+    def closest_hit(self, origins, directions, t_min=0.001, t_max=np.inf):
+        origins = np.asarray(origins, dtype=np.float64)
+        directions = np.asarray(directions, dtype=np.float64)
+        t_max = np.broadcast_to(np.asarray(t_max, dtype=np.float64), (len(origins),))
+        return self.bvh.closest_hit_per_ray(self.hit_pairs, origins, directions, t_min, t_max, 'triangle_tests')
+
+    def outward_normals(self, tri_idx, points):
+        return unit_vector_batch(cross_batch(self.e1[tri_idx], self.e2[tri_idx]))
+
+    def hit_materials(self, tri_idx):
+        n = len(tri_idx)
+        return (np.full(n, self.material.kind, dtype=np.int8),
+                np.broadcast_to(np.asarray(self.material.albedo.e), (n, 3)),
+                {'fuzz': np.full(n, getattr(self.material, 'fuzz', 0.0)),
+                 'ri': np.full(n, getattr(self.material, 'ri', 1.0))})
+
+    def scatter(self, tri_idx, directions, normals, front_face, uniforms=None):
+        kind, albedo, params = self.hit_materials(tri_idx)
+        return scatter_by_kind(kind, directions, normals, front_face, uniforms, albedo, params)
+
+    def hit_batch(self, origins, directions, t_min, t_max):
+        return self.closest_hit(origins, directions, t_min, t_max)[1]
+
+    def hit(self, ray, t_min, t_max):
+        if instrumentation.stats is not None:
+            instrumentation.stats.count('mesh_tests')
+        origin, direction = ray.origin, ray.direction
+        tri_idx, t = self.closest_hit(np.array([[origin.x, origin.y, origin.z]]),
+                                      np.array([[direction.x, direction.y, direction.z]]), t_min, t_max)
+        if tri_idx[0] < 0:
+            return None
+        rec = HitRecord(float(t[0]), ray.at(float(t[0])), self.material)
+        rec.set_face_normal(ray, Point3(self.outward_normals(tri_idx, None)[0]))
+        return rec
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from vec3 import Vec3, Point3, Color
+from ray import Ray
+from sphere import Sphere
+from hittable_list import HittableList
+from material import Lambertian, Metal
+from triangle_mesh import TriangleMesh, load_obj
+
+OBJ = '''# two quads, one written with relative indices and tabs
+o first
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+vt 0 0
+vn 0 0 1
+f 1/1/1 2/1/1 3/1/1 4/1/1
+o second
+v\t0 0 -1
+v\t1\t0\t-1
+v 1 1 -1
+f\t-3//1\t-2//1 -1//1
+'''
+
+def icosphere(center, radius):
+    t = (1 + 5**0.5)/2
+    v = np.array([[-1, t, 0], [1, t, 0], [-1, -t, 0], [1, -t, 0], [0, -1, t], [0, 1, t],
+                  [0, -1, -t], [0, 1, -t], [t, 0, -1], [t, 0, 1], [-t, 0, -1], [-t, 0, 1]], dtype=float)
+    f = np.array([[0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11], [1, 5, 9], [5, 11, 4],
+                  [11, 10, 2], [10, 7, 6], [7, 1, 8], [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8],
+                  [3, 8, 9], [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]])
+    return np.asarray(center) + radius*v/np.linalg.norm(v, axis=1)[:, None], f
+
+class TestTriangleMesh(unittest.TestCase):
+
+    def test_load_obj(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'mesh.obj')
+            with open(path, 'w') as f:
+                f.write(OBJ)
+            # a tiny chunk size splits the file between vertex and face records
+            for chunk_bytes in (1, 1 << 20):
+                vertices, faces = load_obj(path, chunk_bytes)
+                self.assertEqual(vertices.shape, (7, 3))
+                self.assertEqual(faces.tolist(), [[0, 1, 2], [0, 2, 3], [4, 5, 6]])
+
+    def test_closest_hit_matches_brute_force(self):
+        rng = np.random.default_rng(3)
+        vertices = rng.uniform(-1, 1, size=(600, 3))
+        faces = rng.integers(0, 600, size=(200, 3))
+        mesh = TriangleMesh(vertices, faces, Lambertian(Color([0.5, 0.5, 0.5])))
+        origins = rng.uniform(-0.1, 0.1, size=(300, 3))
+        directions = rng.normal(size=(300, 3))
+        tri_idx, t = mesh.closest_hit(origins, directions)
+        brute = mesh.hit_pairs(np.tile(np.arange(200), 300), np.repeat(origins, 200, axis=0),
+                               np.repeat(directions, 200, axis=0), 0.001, np.inf).reshape(300, 200)
+        self.assertTrue(np.array_equal(t, brute.min(axis=1)))
+        hit = np.isfinite(t)
+        self.assertTrue(hit.any())
+        self.assertTrue(np.array_equal(tri_idx[hit], brute[hit].argmin(axis=1)))
+        self.assertTrue((tri_idx[~hit] == -1).all())
+
+    def test_mesh_in_hittable_list(self):
+        world = HittableList()
+        world.add(Sphere(Point3([0, -100.5, -1]), 100, Lambertian(Color([0.8, 0.8, 0.0]))))
+        vertices, faces = icosphere([0, 0, -1], 0.5)
+        world.add(TriangleMesh(vertices, faces, Metal(Color([0.8, 0.6, 0.2]), 0.3)))
+        box = world.bounding_box()
+        self.assertTrue(np.allclose(box.maximum.e, [100, vertices[:, 1].max(), 99]))
+
+        rng = np.random.default_rng(1)
+        directions = rng.normal(size=(100, 3))
+        directions[:, 2] = -np.abs(directions[:, 2])
+        hit_idx, t = world.compile().closest_hit(np.zeros((100, 3)), directions)
+        for k, d in enumerate(directions):
+            rec = world.hit(Ray(Point3([0, 0, 0]), Vec3(d)), 0.001, np.inf)
+            self.assertEqual(rec is not None, hit_idx[k] >= 0)
+            if rec is not None:
+                self.assertTrue(np.isclose(rec.t, t[k]))
+                self.assertIs(rec.material, world.objects[int(hit_idx[k] > 0)].material)
+
+
+if __name__ == '__main__':
+    unittest.main()
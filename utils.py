@@ -1,8 +1,24 @@
+import threading
 import numpy as np
 pi = np.pi
 
 def deg_to_rad(deg):
     return deg * pi/180
 
+# Iterator of uniform floats behind rand(), one per thread. The renderer
+# installs a per-sample Sampler stream; otherwise draws come from the global
+# NumPy RNG.
+class _Streams(threading.local):
+    def __init__(self):
+        self.stream = iter(np.random.random_sample, None)
+
+_streams = _Streams()
+
+def set_stream(stream):
+    _streams.stream = stream
+
+def reset_stream():
+    set_stream(iter(np.random.random_sample, None))
+
 def rand(x_min=0, x_max=1):
-    return x_min + np.random.rand()*(x_max - x_min)
+    return x_min + next(_streams.stream)*(x_max - x_min)
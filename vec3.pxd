@@ -0,0 +1,2 @@
+cdef class Vec3:
+    cdef public double x, y, z
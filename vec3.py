@@ -1,5 +1,13 @@
+import os
+import math
 import numpy as np
 from utils import rand
+try:
+    import cython
+except ImportError:
+    import cython_shim as cython
+
+VALIDATE = bool(os.environ.get('VEC3_VALIDATE'))
 
 def random_in_hemisphere(normal):
     in_unit_sphere = random_in_unit_sphere()
@@ -24,141 +32,234 @@ def random_in_unit_disk():
         return vec
 
 
+# The batch helpers map uniforms in [0, 1) to the target distribution so that
+# callers can feed them counter-based Sampler draws; without them they draw
+# from the global NumPy RNG.
+def random_in_unit_sphere_batch(n, uniforms=None):
+    if uniforms is None:
+        uniforms = np.random.rand(n, 3)
+    return random_unit_vector_batch(n, uniforms)*np.cbrt(uniforms[:, 2])[:, None]
+
+def random_unit_vector_batch(n, uniforms=None):
+    if uniforms is None:
+        uniforms = np.random.rand(n, 2)
+    z = 1.0 - 2.0*uniforms[:, 0]
+    r = np.sqrt(np.maximum(1.0 - z*z, 0.0))
+    phi = 2*np.pi*uniforms[:, 1]
+    return np.stack([r*np.cos(phi), r*np.sin(phi), z], axis=1)
+
+def random_in_unit_disk_batch(n, uniforms=None):
+    if uniforms is None:
+        uniforms = np.random.rand(n, 2)
+    r = np.sqrt(uniforms[:, 0])
+    phi = 2*np.pi*uniforms[:, 1]
+    return np.stack([r*np.cos(phi), r*np.sin(phi), np.zeros(n)], axis=1)
+
+
 def reflect(v, n):
     return v - 2*dot(v, n)*n
 
 def refract(uv, n, refractive_ratio):
     cos_theta = min(dot(-uv, n), 1)
     r_perp = refractive_ratio * (uv + cos_theta*n)
-    r_parallel =  -np.sqrt(abs(1 - r_perp.length_squared()))*n
+    r_parallel =  -math.sqrt(abs(1 - r_perp.length_squared()))*n
     return r_perp + r_parallel
 
-class Vec3x:
-    def __get__(self, obj, objtype=None):
-        return obj.e[0]
-    
-    def __set__(self, obj, value):
-        obj.e[0] = value
-
-class Vec3y:
-    def __get__(self, obj, objtype=None):
-        return obj.e[1]
-    
-    def __set__(self, obj, value):
-        obj.e[1] = value
+def reflect_batch(v, n):
+    return v - 2*dot_batch(v, n)[:, None]*n
 
-class Vec3z:
-    def __get__(self, obj, objtype=None):
-        return obj.e[2]
-    
-    def __set__(self, obj, value):
-        obj.e[2] = value
+def refract_batch(uv, n, refractive_ratio):
+    cos_theta = np.minimum(dot_batch(-uv, n), 1.0)
+    r_perp = refractive_ratio[:, None]*(uv + cos_theta[:, None]*n)
+    r_parallel = -np.sqrt(np.abs(1.0 - dot_batch(r_perp, r_perp)))[:, None]*n
+    return r_perp + r_parallel
 
+@cython.cclass
 class Vec3:
+    __slots__ = ('x', 'y', 'z')
+    # scalar arithmetic on plain floats; NumPy is only used at the batch and
+    # array boundaries. Argument checks cost more than the math, so they only
+    # run when VEC3_VALIDATE is set or VALIDATE is switched on. Compiled, the
+    # fields are C doubles declared in vec3.pxd.
+    __array_ufunc__ = None
 
-    x = Vec3x()
-    y = Vec3y()
-    z = Vec3z()
-
+    @staticmethod
     def random(min_coord=0, max_coord=1):
-        return Vec3([rand(min_coord, max_coord), rand(min_coord, max_coord), rand(min_coord, max_coord)])
-    
+        return _vec3(rand(min_coord, max_coord), rand(min_coord, max_coord), rand(min_coord, max_coord))
+
+    def __init__(self, vec=(0.0, 0.0, 0.0)):
+        if VALIDATE:
+            if not isinstance(vec, (list, tuple, np.ndarray)):
+                msg = 'vec must be a list or numpy.ndarray'
+                raise ValueError(msg)
+            if len(vec) != 3:
+                msg = 'vec must have len 3'
+                raise ValueError(msg)
+        x, y, z = vec
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
 
-    def __init__(self, vec=[0.0, 0.0, 0.0]):
-        if not (isinstance(vec, list) or isinstance(vec, np.ndarray)):
-            msg = 'vec must be a list or numpy.ndarray'
-            raise ValueError(msg)
-        if len(vec) != 3:
-            msg = 'vec must have len 3'
-            raise ValueError(msg)
-        self.e = np.array(vec, dtype=np.float32)
+    @property
+    def e(self):
+        return np.array([self.x, self.y, self.z])
 
     def near_zero(self):
-        return np.allclose(self.e, np.array([0.0, 0.0, 0.0]))
+        s: cython.double = 1e-8
+        return abs(self.x) <= s and abs(self.y) <= s and abs(self.z) <= s
 
     def __neg__(self):
-        return Vec3(-self.e)
+        return _vec3(-self.x, -self.y, -self.z)
     
     def __getitem__(self, idx):
-        return self.e[idx]
+        return (self.x, self.y, self.z)[idx]
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+        yield self.z
+
+    def __len__(self):
+        return 3
     
     def __add__(self, other):
         if isinstance(other, Vec3):
-            return Vec3(self.e + other.e)
-        else:
-            return Vec3(self.e + other)
+            v: Vec3 = other
+            return _vec3(self.x + v.x, self.y + v.y, self.z + v.z)
+        t: cython.double = other
+        return _vec3(self.x + t, self.y + t, self.z + t)
 
     def __radd__(self, other):
-        return Vec3(self.e + other)
+        t: cython.double = other
+        return _vec3(t + self.x, t + self.y, t + self.z)
 
     def __iadd__(self, other):
         if isinstance(other, Vec3):
-            self.e += other.e
+            v: Vec3 = other
+            self.x += v.x
+            self.y += v.y
+            self.z += v.z
         else:
-            self.e += other
+            t: cython.double = other
+            self.x += t
+            self.y += t
+            self.z += t
         return self
     
     def __sub__(self, other):
         if isinstance(other, Vec3):
-            return Vec3(self.e - other.e)
-        else:
-            return Vec3(self.e - other)
+            v: Vec3 = other
+            return _vec3(self.x - v.x, self.y - v.y, self.z - v.z)
+        t: cython.double = other
+        return _vec3(self.x - t, self.y - t, self.z - t)
 
     def __rsub__(self, other):
-        return Vec3(other - self.e)
+        t: cython.double = other
+        return _vec3(t - self.x, t - self.y, t - self.z)
 
     def __isub__(self, other):
         if isinstance(other, Vec3):
-            self.e -= other.e
+            v: Vec3 = other
+            self.x -= v.x
+            self.y -= v.y
+            self.z -= v.z
         else:
-            self.e -= other
+            t: cython.double = other
+            self.x -= t
+            self.y -= t
+            self.z -= t
         return self
     
     def __mul__(self, other):
         if isinstance(other, Vec3):
-            return Vec3(self.e * other.e)
-        else:
-            return Vec3(other*self.e)
+            v: Vec3 = other
+            return _vec3(self.x*v.x, self.y*v.y, self.z*v.z)
+        t: cython.double = other
+        return _vec3(self.x*t, self.y*t, self.z*t)
     
-    def __rmul__(self, t):
-        return Vec3(self.e*t)
+    def __rmul__(self, other):
+        t: cython.double = other
+        return _vec3(t*self.x, t*self.y, t*self.z)
 
-    def __imul__(self, t):
-        self.e *= t
+    def __imul__(self, other):
+        t: cython.double = other
+        self.x *= t
+        self.y *= t
+        self.z *= t
         return self
     
-    def __truediv__(self, t):
-        return Vec3(self.e / t)
+    def __truediv__(self, other):
+        t: cython.double = other
+        return _vec3(self.x/t, self.y/t, self.z/t)
 
-    def __itruediv__(self, t):
-        self.e /= t
+    def __itruediv__(self, other):
+        t: cython.double = other
+        self.x /= t
+        self.y /= t
+        self.z /= t
         return self
     
     def __eq__(self, other):
-        return all(self.e == other.e)
-    
+        return self.x == other.x and self.y == other.y and self.z == other.z
+
     def __str__(self):
-        return ' '.join([str(x) for x in self.e])
+        return f'{self.x} {self.y} {self.z}'
+
+    def __repr__(self):
+        return f'Vec3([{self.x}, {self.y}, {self.z}])'
+
+    def __reduce__(self):
+        return Vec3, ((self.x, self.y, self.z),)
 
     def length(self):
-        return np.linalg.norm(self.e, 2)
+        return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
     
     def length_squared(self):
-        return np.linalg.norm(self.e, 2)**2
-    
+        return self.x*self.x + self.y*self.y + self.z*self.z
+
+@cython.cfunc
+@cython.inline
+def _vec3(x: cython.double, y: cython.double, z: cython.double) -> Vec3:
+    if cython.compiled:
+        v: Vec3 = Vec3.__new__(Vec3)
+    else:
+        # object.__new__ skips the lookup that Vec3.__new__ costs uncompiled
+        v = _new(Vec3)
+    v.x = x
+    v.y = y
+    v.z = z
+    return v
+
+_new = object.__new__
 
 def dot(u, v):
-    if not isinstance(u, Vec3) or not isinstance(v, Vec3):
+    if VALIDATE and (not isinstance(u, Vec3) or not isinstance(v, Vec3)):
         raise ValueError('Expected Vec3 for both arguments')
-    return np.dot(u.e, v.e)
+    a: Vec3 = u
+    b: Vec3 = v
+    return a.x*b.x + a.y*b.y + a.z*b.z
 
 def cross(u, v):
-    if not isinstance(u, Vec3) or not isinstance(v, Vec3):
+    if VALIDATE and (not isinstance(u, Vec3) or not isinstance(v, Vec3)):
         raise ValueError('Expected Vec3 for both arguments')
-    return Vec3(np.cross(u.e, v.e))
+    a: Vec3 = u
+    b: Vec3 = v
+    return _vec3(a.y*b.z - a.z*b.y, a.z*b.x - a.x*b.z, a.x*b.y - a.y*b.x)
 
 def unit_vector(v):
-    return v/v.length()
+    a: Vec3 = v
+    return a/a.length()
+
+def dot_batch(u, v):
+    return np.einsum('ij,ij->i', u, v)
+
+def cross_batch(u, v):
+    return np.stack([u[:, 1]*v[:, 2] - u[:, 2]*v[:, 1],
+                     u[:, 2]*v[:, 0] - u[:, 0]*v[:, 2],
+                     u[:, 0]*v[:, 1] - u[:, 1]*v[:, 0]], axis=1)
+
+def unit_vector_batch(v):
+    return v/np.linalg.norm(v, axis=1)[:, None]
 
         
 Point3 = Vec3
@@ -1,45 +1,111 @@
 import unittest
 import numpy as np
-from vec3 import Vec3
+import vec3
+import vec3_numpy
 
-class TestVec3(unittest.TestCase):
+class Vec3Cases:
+    module = None
+
+    def setUp(self):
+        self.Vec3 = self.module.Vec3
 
     def test_instance_arr(self):
+        Vec3 = self.Vec3
         self.assertEqual(Vec3([1.0, 2.0, 3.0]).x, 1.0)
         self.assertEqual(Vec3([1.0, 2.0, 3.0]).y, 2.0)
         self.assertEqual(Vec3([1.0, 2.0, 3.0]).z, 3.0)
-    
+        self.assertEqual(Vec3(np.array([1.0, 2.0, 3.0])).z, 3.0)
+
     def test_add_vecs(self):
+        Vec3 = self.Vec3
         u = Vec3([1.0, 2.0, 3.0])
         v = Vec3([2.0, 3.0, 4.0])
         self.assertEqual(u + v, Vec3([3.0, 5.0, 7.0]))
 
     def test_sub_vecs(self):
+        Vec3 = self.Vec3
         u = Vec3([1.0, 2.0, 3.0])
         v = Vec3([2.0, 0.0, 1.0])
         self.assertEqual(u - v, Vec3([-1.0, 2.0, 2.0]))
 
     def test_iadd_const(self):
-        u = Vec3([1.4, 3.4, 3.2])
+        u = self.Vec3([1.4, 3.4, 3.2])
         u += 3.1
         self.assertTrue(np.allclose(u.x, 4.5))
 
     def test_iadd_vec(self):
+        Vec3 = self.Vec3
         u = Vec3([1.4, 3.4, 3.2])
         v = Vec3([1.4, 3.4, 3.2])
         u += v
         self.assertTrue(np.allclose(u.x, 2.8))
-    
+
     def test_isub_const(self):
-        u = Vec3([1.0, 2.0, 3.0])
+        u = self.Vec3([1.0, 2.0, 3.0])
         u -= 1.0
         self.assertTrue(np.allclose(u.e, np.array([0.0, 1.0, 2.0])))
 
     def test_imul_const(self):
-        u = Vec3([1.0, 2.0, 3.0])
+        u = self.Vec3([1.0, 2.0, 3.0])
         u *= 2
         self.assertTrue(np.allclose(u.e, np.array([2.0, 4.0, 6.0])))
 
+    def test_scalar_ops(self):
+        Vec3 = self.Vec3
+        u = Vec3([1.0, 2.0, 3.0])
+        self.assertTrue(np.allclose((2*u).e, [2.0, 4.0, 6.0]))
+        self.assertTrue(np.allclose((u*Vec3([2.0, 0.5, 1.0])).e, [2.0, 1.0, 3.0]))
+        self.assertTrue(np.allclose((u/2).e, [0.5, 1.0, 1.5]))
+        self.assertTrue(np.allclose((-u).e, [-1.0, -2.0, -3.0]))
+        self.assertTrue(np.allclose((1.0 - u).e, [0.0, -1.0, -2.0]))
+        self.assertTrue(np.isclose(u.length_squared(), 14.0))
+        self.assertTrue(np.isclose(u.length(), np.sqrt(14.0)))
+        self.assertEqual(u[1], 2.0)
+
+    def test_dot_cross_unit(self):
+        m = self.module
+        u = m.Vec3([1.0, 0.0, 0.0])
+        v = m.Vec3([0.0, 1.0, 0.0])
+        self.assertEqual(m.dot(u, v), 0.0)
+        self.assertTrue(np.allclose(m.cross(u, v).e, [0.0, 0.0, 1.0]))
+        self.assertTrue(np.isclose(m.unit_vector(m.Vec3([3.0, 4.0, 0.0])).length(), 1.0))
+
+    def test_reflect_refract(self):
+        m = self.module
+        n = m.Vec3([0.0, 1.0, 0.0])
+        d = m.unit_vector(m.Vec3([1.0, -1.0, 0.0]))
+        self.assertTrue(np.allclose(m.reflect(d, n).e, [np.sqrt(0.5), np.sqrt(0.5), 0.0], atol=1e-6))
+        self.assertTrue(np.allclose(m.refract(d, n, 1.0).e, d.e, atol=1e-6))
+
+    def test_random_helpers(self):
+        m = self.module
+        np.random.seed(0)
+        for _ in range(50):
+            self.assertLess(m.random_in_unit_sphere().length_squared(), 1.0)
+            self.assertTrue(np.isclose(m.random_unit_vector().length(), 1.0, atol=1e-6))
+            disk = m.random_in_unit_disk()
+            self.assertLessEqual(disk.length_squared(), 1.0)
+            self.assertEqual(disk.z, 0.0)
+
+    def test_near_zero(self):
+        self.assertTrue(self.Vec3([1e-9, 0.0, 0.0]).near_zero())
+        self.assertFalse(self.Vec3([1e-3, 0.0, 0.0]).near_zero())
+
+class TestVec3(Vec3Cases, unittest.TestCase):
+    module = vec3
+
+    def test_validation_is_opt_in(self):
+        self.assertRaises(ValueError, vec3.Vec3, [1.0, 2.0])
+        vec3.VALIDATE = True
+        try:
+            self.assertRaises(ValueError, vec3.Vec3, 'abc')
+            self.assertRaises(ValueError, vec3.dot, vec3.Vec3(), [1.0, 2.0, 3.0])
+        finally:
+            vec3.VALIDATE = False
+
+class TestNumpyVec3(Vec3Cases, unittest.TestCase):
+    module = vec3_numpy
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,125 @@
+import time
+import numpy as np
+import instrumentation
+from vec3 import unit_vector_batch, dot_batch
+from color import luminance
+from sampler import Sampler, CAMERA
+from material import MATERIAL_KINDS
+
+class WavefrontRenderer:
+    def __init__(self, world, cam, image_width, image_height, max_depth, sampler=None, roulette_threshold=0.0):
+        self.scene = world.compile() if hasattr(world, 'compile') else world
+        self.sampler = sampler or Sampler()
+        self.roulette_threshold = roulette_threshold
+        self.paths = self.segments = self.roulette_terminations = 0
+        self.cam = cam
+        self.image_width = image_width
+        self.image_height = image_height
+        self.max_depth = max_depth
+
+    def background(self, directions):
+        t = 0.5*(unit_vector_batch(directions)[:, 1] + 1.0)
+        return (1.0 - t)[:, None]*np.array([1.0, 1.0, 1.0]) + t[:, None]*np.array([0.5, 0.7, 1.0])
+
+    def render_tile(self, x0, y0, width, height, samples_per_pix, mask=None, first_sample=None, aovs=None):
+        jj, ii = np.mgrid[y0:y0 + height, x0:x0 + width]
+        if mask is None:
+            mask = np.ones((height, width), dtype=bool)
+        if first_sample is None:
+            first_sample = np.zeros((height, width), dtype=np.int64)
+        radiance = np.zeros((height, width, 3))
+        luminance_sq = np.zeros((height, width))
+        pixel_aovs = {} if aovs is not None else None
+        radiance[mask], luminance_sq[mask] = self.render_pixels(ii[mask], jj[mask], samples_per_pix, first_sample[mask],
+                                                                pixel_aovs)
+        if aovs is not None:
+            for aov, values in pixel_aovs.items():
+                aovs[aov] = np.zeros((height, width) + values.shape[1:])
+                aovs[aov][mask] = values
+        return radiance, luminance_sq
+
+    def render_pixels(self, i, j, samples_per_pix, first_sample=0, aovs=None):
+        # aovs, if a dict, receives per-pixel sums of the first hit's normal,
+        # albedo and distance
+        stats = instrumentation.stats
+        start = time.perf_counter()
+        n_pix = len(i)
+        n_rays = n_pix*samples_per_pix
+        # every random number is keyed by (pixel, sample index, dimension), so
+        # the image does not depend on tiling, worker count or pass layout
+        pixel = np.repeat(j*self.image_width + i, samples_per_pix)
+        sample_index = np.repeat(first_sample + np.zeros(n_pix, dtype=np.int64), samples_per_pix) \
+            + np.tile(np.arange(samples_per_pix), n_pix)
+        camera_uniforms = self.sampler.uniforms(pixel, sample_index, CAMERA)
+        u = (np.repeat(i, samples_per_pix) + camera_uniforms[:, 0])/(self.image_width - 1)
+        v = (np.repeat(j, samples_per_pix) + camera_uniforms[:, 1])/(self.image_height - 1)
+        origins, directions = self.cam.get_rays(u, v, camera_uniforms[:, 2:4])
+        throughput = np.ones((n_rays, 3))
+        sample = np.arange(n_rays)
+        sample_radiance = np.zeros((n_rays, 3))
+        self.paths += n_rays
+        if stats is not None:
+            stats.count('primary_rays', n_rays)
+            stats.add_time('camera', start)
+
+        for depth in range(self.max_depth):
+            if not len(sample):
+                break
+            self.segments += len(sample)
+            if stats is not None:
+                stats.depth_histogram[depth] += len(sample)
+                if depth:
+                    stats.count('secondary_rays', len(sample))
+                start = time.perf_counter()
+            hit_idx, t = self.scene.closest_hit(origins, directions, 0.001, np.inf)
+            if stats is not None:
+                stats.add_time('intersect', start)
+                start = time.perf_counter()
+
+            miss = hit_idx < 0
+            if miss.any():
+                sample_radiance[sample[miss]] = throughput[miss]*self.background(directions[miss])
+            if aovs is not None and not depth:
+                # throughput is still 1, so a miss's radiance is the sky colour
+                first_hit = (np.zeros((n_rays, 3)), sample_radiance.copy(), np.zeros(n_rays))
+
+            hit = ~miss
+            sample, hit_idx, t = sample[hit], hit_idx[hit], t[hit]
+            origins, directions, throughput = origins[hit], directions[hit], throughput[hit]
+
+            points = origins + t[:, None]*directions
+            outward_normals = self.scene.outward_normals(hit_idx, points)
+            front_face = dot_batch(directions, outward_normals) <= 0
+            normals = np.where(front_face[:, None], outward_normals, -outward_normals)
+            if aovs is not None and not depth:
+                first_hit[0][sample] = normals
+                first_hit[1][sample] = self.scene.hit_materials(hit_idx)[1]
+                first_hit[2][sample] = t*np.sqrt(dot_batch(directions, directions))
+
+            uniforms = self.sampler.uniforms(pixel[sample], sample_index[sample], depth + 1)
+            scattered, attenuation, alive = self.scene.scatter(hit_idx, directions, normals, front_face, uniforms)
+            throughput *= attenuation
+            if self.roulette_threshold > 0:
+                # uniforms column 3 is not used by any material kernel
+                peak = throughput.max(axis=1)
+                dim = alive & (peak < self.roulette_threshold)
+                survive = peak[dim]/self.roulette_threshold
+                killed = uniforms[dim, 3] >= survive
+                throughput[np.flatnonzero(dim)[~killed]] /= survive[~killed][:, None]
+                alive[np.flatnonzero(dim)[killed]] = False
+                self.roulette_terminations += int(killed.sum())
+            if stats is not None:
+                stats.add_time('scatter', start)
+                for kind, n in enumerate(np.bincount(self.scene.material_kind[hit_idx], minlength=len(MATERIAL_KINDS))):
+                    if n:
+                        stats.hits_by_material[MATERIAL_KINDS[kind].__name__] += int(n)
+
+            sample, origins, directions, throughput = sample[alive], points[alive], scattered[alive], throughput[alive]
+
+        if stats is not None:
+            stats.count('max_depth_terminations', len(sample))
+        if aovs is not None:
+            for aov, values in zip(('normal', 'albedo', 'depth'), first_hit):
+                aovs[aov] = values.reshape((n_pix, samples_per_pix) + values.shape[1:]).sum(axis=1)
+        sample_radiance = sample_radiance.reshape(n_pix, samples_per_pix, 3)
+        return sample_radiance.sum(axis=1), (luminance(sample_radiance)**2).sum(axis=1)
@@ -0,0 +1,46 @@
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+import numpy as np
+from main import PathTracer
+
+class TestWavefront(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def render(self, **options):
+        settings = dict(image_width=24, image_height=16, max_depth=8, progress='none',
+                        output=os.path.join(self.tmp.name, 'image.npy'))
+        settings.update(options)
+        pt = PathTracer(**settings)
+        with contextlib.redirect_stdout(io.StringIO()):
+            pt.run()
+        return pt, np.load(settings['output'])
+
+    def test_matches_scalar_engine(self):
+        # different sample streams, so the images agree only statistically
+        _, scalar = self.render(engine='scalar', samples_per_pix=16)
+        _, wavefront = self.render(engine='wavefront', samples_per_pix=64)
+        self.assertTrue(np.allclose(scalar.mean(axis=(0, 1)), wavefront.mean(axis=(0, 1)), atol=0.02))
+        self.assertLess(np.abs(scalar - wavefront).mean(), 0.1)
+
+    def test_russian_roulette_is_unbiased(self):
+        for engine, samples in (('wavefront', 64), ('scalar', 8)):
+            means = []
+            for threshold in (0.0, 0.3):
+                pt, image = self.render(engine=engine, samples_per_pix=samples, roulette_threshold=threshold)
+                paths, segments, terminations = pt.path_counts[:]
+                self.assertEqual(paths, 24*16*samples)
+                self.assertEqual(terminations > 0, threshold > 0, engine)
+                means.append(image.mean(axis=(0, 1)))
+            self.assertTrue(np.allclose(*means, atol=0.01), (engine, means))
+
+
+if __name__ == '__main__':
+    unittest.main()